@@ -4,7 +4,7 @@ from flask_apscheduler import APScheduler
 from datetime import datetime
 import logging
 import os
-import json
+import sys
 
 # 确保必要目录存在
 os.makedirs('data/logs', exist_ok=True)
@@ -25,14 +25,27 @@ if not os.getenv('PRODUCTION'):
 from models import db, Article
 db.init_app(app)
 
-# 创建数据库表
+# 创建数据库表并执行迁移（补建已有表上的索引等）
+from migrations import run_migrations
 with app.app_context():
     db.create_all()
+    run_migrations(db)
 
 scheduler = APScheduler()
 scheduler.init_app(app)
 scheduler.start()
 
+# 后台任务队列（爬取、生成等耗时操作）
+from services.job_queue import JobQueue
+from services.article_pipeline import crawl_and_save, generate_and_save
+from utils.exceptions import CrawlerError
+job_queue = JobQueue(app)
+job_queue.handler('crawl')(crawl_and_save)
+job_queue.handler('generate')(generate_and_save)
+# 每个gunicorn worker导入时都会启动自己的调度线程；任务通过条件UPDATE原子认领，
+# 同一个任务只会被一个worker执行
+job_queue.start()
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -64,8 +77,27 @@ def manage_config():
 def manage_articles():
     if request.method == 'GET':
         from models import Article
-        articles = Article.query.order_by(Article.created_at.desc()).all()
-        return jsonify([a.to_dict() for a in articles])
+        from utils.pagination import encode_cursor, decode_cursor
+        
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        cursor = request.args.get('cursor')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        articles, next_cursor = Article.list_previews(
+            limit=limit,
+            cursor=cursor,
+            status=request.args.get('status'),
+            tag=request.args.get('tag')
+        )
+        return jsonify({
+            'success': True,
+            'articles': articles,
+            'next_cursor': encode_cursor(*next_cursor) if next_cursor else None,
+            'has_more': next_cursor is not None
+        })
     else:
         # 创建新文章
         from services.llm_service import LLMService
@@ -73,33 +105,66 @@ def manage_articles():
         article = llm.generate_article(request.json)
         return jsonify(article)
 
+@app.route('/api/llm/cache/stats', methods=['GET'])
+def llm_cache_stats():
+    from services.llm_service import LLMService
+    llm = LLMService()
+    if not llm.cache:
+        return jsonify({'success': False, 'message': 'LLM缓存未启用'}), 404
+    return jsonify({'success': True, 'data': llm.cache.stats()})
+
+@app.route('/api/crawler/cache/stats', methods=['GET'])
+def crawler_cache_stats():
+    from services.crawler import ArticleCrawler
+    crawler = ArticleCrawler()
+    if not crawler.http_cache:
+        return jsonify({'success': False, 'message': '爬虫缓存未启用'}), 404
+    return jsonify({'success': True, 'data': crawler.http_cache.stats()})
+
+@app.route('/api/wechat/stats', methods=['GET'])
+def wechat_call_stats():
+    from services.wechat_api import call_stats
+    return jsonify({'success': True, 'data': call_stats.snapshot()})
+
 @app.route('/api/publish/<int:article_id>', methods=['POST'])
 def publish_article(article_id):
-    from services.wechat_api import WeChatAPI
+    from services.article_pipeline import publish_article as publish_now
     from models import Article
     
     article = Article.query.get_or_404(article_id)
-    wechat = WeChatAPI()
-    result = wechat.publish(article)
-    
-    if result['success']:
-        article.status = 'published'
-        article.published_at = datetime.now()
-        db.session.commit()
+    result = publish_now(article)
     
     return jsonify(result)
 
+@app.route('/api/publish/ledger', methods=['GET'])
+def publish_ledger():
+    """群发记录，status=unknown 可查看需要人工确认的发送"""
+    from models import PublishLedger
+    
+    query = PublishLedger.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    entries = query.order_by(PublishLedger.id.desc()).limit(limit).all()
+    return jsonify({'success': True, 'data': [entry.to_dict() for entry in entries]})
+
+def _submit_job(job_type, payload):
+    """提交后台任务并返回202响应"""
+    job = job_queue.submit(job_type, payload)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'message': '任务已提交'
+    }), 202
+
 @app.route('/api/crawl', methods=['POST'])
 def crawl_articles():
     try:
-        from services.crawler import ArticleCrawler
-        from services.llm_service import LLMService
-        
         data = request.json
         source_url = data.get('source_url', '')
-        source_type = data.get('source_type', 'auto')
-        max_count = data.get('max_count', 5)
-        enable_rewrite = data.get('enable_rewrite', True)
         
         if not source_url:
             return jsonify({
@@ -107,63 +172,17 @@ def crawl_articles():
                 'message': '请提供爬取源URL'
             }), 400
         
-        # 爬取文章
-        crawler = ArticleCrawler()
-        articles = crawler.crawl(source_url, source_type, max_count)
-        
-        if not articles:
-            return jsonify({
-                'success': False,
-                'message': '未能爬取到任何内容，请检查URL是否正确'
-            }), 400
-        
-        # LLM改写（如果启用）
-        if enable_rewrite:
-            llm_service = LLMService()
-            articles = llm_service.rewrite_batch(articles)
+        # async=true 时转为后台任务，立即返回任务ID
+        if data.get('async'):
+            return _submit_job('crawl', data)
         
-        # 保存到数据库
-        saved_articles = []
-        for article_data in articles:
-            try:
-                article = Article(
-                    title=article_data.get('title', ''),
-                    content=article_data.get('content', ''),
-                    status='draft',
-                    ai_generated=article_data.get('rewritten', False),
-                    source_url=article_data.get('source_url', ''),
-                    meta_data=json.dumps({
-                        'source_type': article_data.get('source_type', ''),
-                        'original_title': article_data.get('original_title', ''),
-                        'crawl_time': datetime.now().isoformat(),
-                        'rewritten': article_data.get('rewritten', False),
-                        'meta': article_data.get('meta', {})
-                    })
-                )
-                db.session.add(article)
-                db.session.commit()
-                
-                saved_articles.append({
-                    'id': article.id,
-                    'title': article.title,
-                    'content': article.content[:200] + '...' if len(article.content) > 200 else article.content,
-                    'status': article.status,
-                    'source_type': article_data.get('source_type', ''),
-                    'rewritten': article_data.get('rewritten', False)
-                })
-                
-            except Exception as e:
-                logger.error(f"保存文章失败: {str(e)}")
-                continue
+        return jsonify(crawl_and_save(data))
         
+    except CrawlerError as e:
         return jsonify({
-            'success': True,
-            'count': len(saved_articles),
-            'articles': saved_articles,
-            'message': f'成功爬取并保存 {len(saved_articles)} 篇文章' + 
-                      ('（已进行LLM改写）' if enable_rewrite else '')
-        })
-        
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"爬取文章失败: {str(e)}")
         return jsonify({
@@ -174,11 +193,8 @@ def crawl_articles():
 @app.route('/api/generate', methods=['POST'])
 def generate_article():
     try:
-        from services.llm_service import LLMService
         data = request.json
         topic = data.get('topic', '')
-        style = data.get('style', 'professional')
-        length = data.get('length', 'medium')
         
         if not topic:
             return jsonify({
@@ -186,48 +202,10 @@ def generate_article():
                 'message': '请提供文章主题'
             }), 400
         
-        llm_service = LLMService()
+        if data.get('async'):
+            return _submit_job('generate', data)
         
-        # 构建提示词
-        prompts = {
-            'short': '写一篇500字左右的短文章',
-            'medium': '写一篇1000字左右的中等篇幅文章', 
-            'long': '写一篇2000字左右的长文章'
-        }
-        
-        styles = {
-            'professional': '专业严谨的风格',
-            'casual': '轻松随意的风格',
-            'creative': '创意有趣的风格'
-        }
-        
-        prompt = f"请以{styles.get(style, '专业严谨的风格')}，{prompts.get(length, '写一篇1000字左右的中等篇幅文章')}，主题是：{topic}"
-        
-        # 生成内容
-        content = llm_service.generate_content(prompt)
-        title = llm_service.generate_title(content)
-        
-        # 创建文章记录
-        article = Article(
-            title=title,
-            content=content,
-            status='draft',
-            ai_generated=True
-        )
-        db.session.add(article)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'article': {
-                'id': article.id,
-                'title': article.title,
-                'content': article.content,
-                'status': article.status,
-                'created_at': article.created_at.isoformat()
-            },
-            'message': '文章生成成功'
-        })
+        return jsonify(generate_and_save(data))
         
     except Exception as e:
         return jsonify({
@@ -235,29 +213,50 @@ def generate_article():
             'message': f'生成失败: {str(e)}'
         }), 500
 
+@app.route('/api/scheduler/jobs', methods=['GET'])
+def get_scheduler_jobs():
+    from models import ScheduledJobState
+    states = ScheduledJobState.query.order_by(ScheduledJobState.job_id).all()
+    return jsonify({'success': True, 'jobs': [s.to_dict() for s in states]})
+
+@app.route('/api/scheduler/publish-latency', methods=['GET'])
+def get_publish_latency():
+    from services.publish_dispatcher import dispatch_latency_stats
+    return jsonify({'success': True, 'data': dispatch_latency_stats()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    from models import Job
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 @app.route('/api/analytics/dashboard', methods=['GET'])
 def get_dashboard_stats():
     try:
         from services.analytics_service import AnalyticsService
         analytics = AnalyticsService()
         
-        # 基础统计
-        total_articles = Article.query.count()
-        published_articles = Article.query.filter_by(status='published').count()
-        draft_articles = Article.query.filter_by(status='draft').count()
-        scheduled_articles = Article.query.filter_by(status='scheduled').count()
+        # 基础统计（单次 GROUP BY 聚合）
+        status_counts = Article.count_by_status()
+        total_articles = sum(status_counts.values())
+        published_articles = status_counts.get('published', 0)
+        draft_articles = status_counts.get('draft', 0)
+        scheduled_articles = status_counts.get('scheduled', 0)
         
         # 获取最近文章
         recent_articles = Article.query.order_by(Article.created_at.desc()).limit(5).all()
+        recent_metrics = analytics.get_metrics_for_articles([article.id for article in recent_articles])
         recent_articles_data = [
             {
                 'id': article.id,
                 'title': article.title,
                 'status': article.status,
                 'created_at': article.created_at.isoformat(),
-                'views': getattr(article, 'views', 0),
-                'likes': getattr(article, 'likes', 0), 
-                'comments': getattr(article, 'comments', 0)
+                'views': recent_metrics.get(article.id, {}).get('views', 0),
+                'likes': recent_metrics.get(article.id, {}).get('likes', 0),
+                'comments': recent_metrics.get(article.id, {}).get('comments', 0)
             }
             for article in recent_articles
         ]
@@ -397,5 +396,10 @@ def verify_token():
         'message': 'Invalid token'
     }), 401
 
+# 注册定时任务；直接运行本文件时让 tasks 中的 `from app import ...` 指向当前模块
+if __name__ == '__main__':
+    sys.modules.setdefault('app', sys.modules[__name__])
+import tasks  # noqa: E402,F401
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
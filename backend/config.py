@@ -14,17 +14,89 @@ class Config:
     CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
     CLAUDE_BASE_URL = os.getenv('CLAUDE_BASE_URL', 'https://api.anthropic.com')
     
+    # LLM并发与限速（按服务商账号的RPM/TPM配额设置）
+    # 限速器是进程内的，每个gunicorn worker各有一份，配额按worker数平分（WEB_CONCURRENCY，
+    # gunicorn 也按它决定worker数），否则多个worker合计会超出账号配额
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+    LLM_RATE_LIMIT_PROCESSES = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    OPENAI_RPM = int(os.getenv('OPENAI_RPM', 500))
+    OPENAI_TPM = int(os.getenv('OPENAI_TPM', 200000))
+    CLAUDE_RPM = int(os.getenv('CLAUDE_RPM', 50))
+    CLAUDE_TPM = int(os.getenv('CLAUDE_TPM', 40000))
+    
+    # LLM响应缓存（SQLite文件，多worker共享）
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'data/llm_cache.db')
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 10000))
+    
     # 微信公众号配置
     WECHAT_APP_ID = os.getenv('WECHAT_APP_ID')
     WECHAT_APP_SECRET = os.getenv('WECHAT_APP_SECRET')
+    # 接口地址可指向本地模拟服务（tools/wechat_stub.py）用于联调和压测
+    WECHAT_API_BASE = os.getenv('WECHAT_API_BASE', 'https://api.weixin.qq.com')
+    # access_token 共享存储（多个worker共用），过期前多少秒开始刷新
+    WECHAT_TOKEN_PATH = os.getenv('WECHAT_TOKEN_PATH', 'data/wechat_token.json')
+    WECHAT_TOKEN_REFRESH_MARGIN = int(os.getenv('WECHAT_TOKEN_REFRESH_MARGIN', 300))
+    # 接口连接/读取超时（秒）、连接池大小，以及系统繁忙、限频等临时错误的重试
+    WECHAT_CONNECT_TIMEOUT = float(os.getenv('WECHAT_CONNECT_TIMEOUT', 5))
+    WECHAT_READ_TIMEOUT = float(os.getenv('WECHAT_READ_TIMEOUT', 30))
+    WECHAT_POOL_SIZE = int(os.getenv('WECHAT_POOL_SIZE', 10))
+    WECHAT_MAX_RETRIES = int(os.getenv('WECHAT_MAX_RETRIES', 3))
+    WECHAT_RETRY_BACKOFF = float(os.getenv('WECHAT_RETRY_BACKOFF', 0.5))
+    # 发布时正文外链图片并发转存到微信的最大并发数
+    WECHAT_IMAGE_CONCURRENCY = int(os.getenv('WECHAT_IMAGE_CONCURRENCY', 6))
+    # 定时发布时，同一时段内到期的文章合并为一条多图文消息（节省群发次数）
+    PUBLISH_SLOT_MINUTES = int(os.getenv('PUBLISH_SLOT_MINUTES', 60))
+    # 定时发布：每分钟把未来多少分钟内到期的定时任务注册为精确触发器
+    PUBLISH_ARM_HORIZON_MINUTES = int(os.getenv('PUBLISH_ARM_HORIZON_MINUTES', 10))
+    # 提前多少分钟准备定时发布（生成HTML和封面、上传素材），到点只需群发
+    PUBLISH_STAGE_MINUTES = int(os.getenv('PUBLISH_STAGE_MINUTES', 10))
+    # 认领后超过多少分钟仍未完成的发布视为中断（进程退出等），重试时按群发记录对账
+    PUBLISH_SEND_STALE_MINUTES = int(os.getenv('PUBLISH_SEND_STALE_MINUTES', 10))
+    # 每次拉取最近几天的图文统计数据（近几天的数据会被微信持续修正）
+    METRICS_LOOKBACK_DAYS = int(os.getenv('METRICS_LOOKBACK_DAYS', 7))
     
     # 定时任务配置
     SCHEDULER_API_ENABLED = True
     SCHEDULER_TIMEZONE = 'Asia/Shanghai'
+    # 定时任务执行锁持有时间的上限（秒），进程崩溃后超时自动释放；各任务默认按自己的周期取更短的值
+    SCHEDULER_LOCK_TTL = int(os.getenv('SCHEDULER_LOCK_TTL', 3600))
+    
+    # 后台任务队列配置（任务存储在数据库 job 表中）
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 1800))
     
     # 爬虫配置
     CRAWLER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     CRAWLER_TIMEOUT = 30
+    # 单个响应正文的大小上限（MB，按解压后计算），超过时中断下载
+    CRAWLER_MAX_BODY_MB = float(os.getenv('CRAWLER_MAX_BODY_MB', 5))
+    CRAWLER_MAX_WORKERS = int(os.getenv('CRAWLER_MAX_WORKERS', 8))
+    # 同一主机两次请求之间的最小间隔（秒），按域名后缀单独配置
+    CRAWLER_HOST_INTERVAL = float(os.getenv('CRAWLER_DELAY', 1))
+    CRAWLER_HOST_INTERVALS = {
+        'mp.weixin.qq.com': 2,
+        'zhihu.com': 2
+    }
+    # HTTP条件请求缓存（SQLite文件，多worker共享），正文总大小上限（MB）
+    CRAWLER_CACHE_ENABLED = os.getenv('CRAWLER_CACHE_ENABLED', 'true').lower() == 'true'
+    CRAWLER_CACHE_PATH = os.getenv('CRAWLER_CACHE_PATH', 'data/crawler_cache.db')
+    CRAWLER_CACHE_MAX_MB = int(os.getenv('CRAWLER_CACHE_MAX_MB', 200))
+    # RSS/Atom 地址发现结果的缓存时间（秒），没有feed的站点单独设置；探测请求超时（秒）
+    CRAWLER_FEED_TTL = int(os.getenv('CRAWLER_FEED_TTL', 7 * 24 * 3600))
+    CRAWLER_NO_FEED_TTL = int(os.getenv('CRAWLER_NO_FEED_TTL', 24 * 3600))
+    CRAWLER_FEED_PROBE_TIMEOUT = float(os.getenv('CRAWLER_FEED_PROBE_TIMEOUT', 5))
+    # HTML解析器（lxml/html.parser），为空时自动选择：安装了 lxml 就用 lxml
+    CRAWLER_HTML_PARSER = os.getenv('CRAWLER_HTML_PARSER', '')
+    # 只解析页面中用到的部分（标题、正文所在的子树），关闭后解析完整页面
+    CRAWLER_PARTIAL_PARSING = os.getenv('CRAWLER_PARTIAL_PARSING', 'true').lower() == 'true'
+    # 增量爬取：跳过已爬取过的链接，正文与已处理内容相同的文章不再改写
+    CRAWLER_INCREMENTAL = os.getenv('CRAWLER_INCREMENTAL', 'true').lower() == 'true'
+    # 近似重复检测（SimHash）：指纹汉明距离不超过阈值的文章视为同一篇，阈值最大为3
+    CRAWLER_DEDUP_ENABLED = os.getenv('CRAWLER_DEDUP_ENABLED', 'true').lower() == 'true'
+    CRAWLER_DEDUP_DISTANCE = int(os.getenv('CRAWLER_DEDUP_DISTANCE', 3))
     
     # 图片生成配置
     DALLE_API_KEY = os.getenv('DALLE_API_KEY')
@@ -0,0 +1,165 @@
+"""数据库迁移
+
+db.create_all() 只会创建不存在的表，已有表上新增的索引和列需要在这里补齐。
+每个迁移只执行一次，执行记录保存在 schema_migrations 表中。多个gunicorn worker
+同时启动时由迁移锁串行执行（PostgreSQL 用 advisory lock，SQLite 用数据库文件旁的文件锁），
+拿到锁后重新读取执行记录，已由其他worker应用的迁移直接跳过。
+"""
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+class AddColumn:
+    """给已有表加列；SQLite不支持 ADD COLUMN IF NOT EXISTS，先检查列是否存在"""
+
+    def __init__(self, table: str, column: str, ddl: str):
+        self.table = table
+        self.column = column
+        self.ddl = ddl
+
+    def __call__(self, conn):
+        columns = {col['name'] for col in inspect(conn).get_columns(self.table)}
+        if self.column not in columns:
+            conn.execute(text(f'ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl}'))
+
+
+def backfill_crawled_items(conn):
+    """把已有文章的来源地址写入爬取记录，增量爬取上线后不会把它们当成新链接重新爬取"""
+    from services.crawl_state import canonicalize_url, url_hash
+
+    existing = {row[0] for row in conn.execute(text('SELECT url_hash FROM crawled_item'))}
+    rows = {}
+    for article_id, source_url, created_at in conn.execute(text(
+        "SELECT id, source_url, created_at FROM article "
+        "WHERE source_url IS NOT NULL AND source_url != '' ORDER BY id"
+    )):
+        digest = url_hash(source_url)
+        if digest in existing or digest in rows:
+            continue
+        rows[digest] = {
+            'url': source_url,
+            'canonical_url': canonicalize_url(source_url),
+            'url_hash': digest,
+            'article_id': article_id,
+            'seen_at': created_at or datetime.utcnow()
+        }
+    if rows:
+        conn.execute(text(
+            'INSERT INTO crawled_item (url, canonical_url, url_hash, article_id, first_seen_at, last_seen_at) '
+            'VALUES (:url, :canonical_url, :url_hash, :article_id, :seen_at, :seen_at)'
+        ), list(rows.values()))
+
+
+# (版本号, 迁移步骤列表)，步骤为SQL语句或接收连接的可调用对象；
+# 按顺序执行，只能追加不能修改已发布的迁移
+MIGRATIONS = [
+    ('001_dashboard_indexes', [
+        'CREATE INDEX IF NOT EXISTS ix_article_status_created_at ON article (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_article_created_at_id ON article (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_article_status_published_at ON article (status, published_at)',
+        'CREATE INDEX IF NOT EXISTS ix_publish_schedule_status_time ON publish_schedule (status, scheduled_time)',
+    ]),
+    ('002_article_wechat_msg', [
+        AddColumn('article', 'wechat_msg_data_id', 'VARCHAR(64)'),
+        AddColumn('article', 'wechat_msg_index', 'INTEGER'),
+        'CREATE INDEX IF NOT EXISTS ix_article_wechat_msg ON article (wechat_msg_data_id, wechat_msg_index)',
+    ]),
+    ('003_publish_schedule_dispatched_at', [
+        AddColumn('publish_schedule', 'dispatched_at', 'TIMESTAMP'),
+    ]),
+    ('004_publish_schedule_staging', [
+        AddColumn('publish_schedule', 'staged_media_id', 'VARCHAR(128)'),
+        AddColumn('publish_schedule', 'stage_index', 'INTEGER'),
+        AddColumn('publish_schedule', 'stage_status', 'VARCHAR(20)'),
+        AddColumn('publish_schedule', 'staged_at', 'TIMESTAMP'),
+        'CREATE INDEX IF NOT EXISTS ix_publish_schedule_staged_media_id ON publish_schedule (staged_media_id)',
+    ]),
+    ('005_crawled_item_backfill', [
+        backfill_crawled_items,
+    ]),
+    ('006_crawled_item_simhash', [
+        AddColumn('crawled_item', 'simhash', 'BIGINT'),
+        AddColumn('crawled_item', 'simhash_band0', 'INTEGER'),
+        AddColumn('crawled_item', 'simhash_band1', 'INTEGER'),
+        AddColumn('crawled_item', 'simhash_band2', 'INTEGER'),
+        AddColumn('crawled_item', 'simhash_band3', 'INTEGER'),
+        'CREATE INDEX IF NOT EXISTS ix_crawled_item_simhash_band0 ON crawled_item (simhash_band0)',
+        'CREATE INDEX IF NOT EXISTS ix_crawled_item_simhash_band1 ON crawled_item (simhash_band1)',
+        'CREATE INDEX IF NOT EXISTS ix_crawled_item_simhash_band2 ON crawled_item (simhash_band2)',
+        'CREATE INDEX IF NOT EXISTS ix_crawled_item_simhash_band3 ON crawled_item (simhash_band3)',
+    ]),
+]
+
+
+# PostgreSQL advisory lock 的键，只用于迁移
+MIGRATION_LOCK_KEY = 8042301
+
+
+@contextmanager
+def migration_lock(engine):
+    """串行执行迁移的进程间锁"""
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+    elif engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+        with FileLock(f"{engine.url.database}.migrate.lock"):
+            yield
+    else:
+        yield
+
+
+def _applied_versions(conn) -> set:
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def run_migrations(db):
+    """执行尚未应用的迁移"""
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)'
+        ))
+        applied = _applied_versions(conn)
+    if all(version in applied for version, _ in MIGRATIONS):
+        return
+
+    with migration_lock(db.engine):
+        # 等锁期间其他worker可能已经执行完
+        with db.engine.connect() as conn:
+            applied = _applied_versions(conn)
+
+        for version, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                with db.engine.begin() as conn:
+                    for statement in statements:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(text(statement))
+                    conn.execute(
+                        text('INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)'),
+                        {'version': version, 'applied_at': datetime.utcnow()}
+                    )
+                logger.info(f"已应用数据库迁移: {version}")
+            except DBAPIError:
+                # 没有迁移锁的数据库上可能和其他进程同时执行（重复加列、主键冲突等），
+                # 对方已经应用成功时忽略，否则是真正的失败
+                with db.engine.connect() as conn:
+                    if version not in _applied_versions(conn):
+                        raise
+                logger.info(f"数据库迁移 {version} 已由其他进程应用")
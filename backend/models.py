@@ -1,9 +1,23 @@
+import json
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, case, cast, func, or_
 
 db = SQLAlchemy()
 
+# 文章列表中内容预览的长度
+PREVIEW_LENGTH = 200
+
 class Article(db.Model):
+    # 索引名与 migrations.py 中的一致，已有数据库通过迁移补建
+    __table_args__ = (
+        db.Index('ix_article_status_created_at', 'status', 'created_at'),
+        db.Index('ix_article_created_at_id', 'created_at', 'id'),
+        db.Index('ix_article_status_published_at', 'status', 'published_at'),
+        db.Index('ix_article_wechat_msg', 'wechat_msg_data_id', 'wechat_msg_index'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
@@ -18,6 +32,98 @@ class Article(db.Model):
     tags = db.Column(db.JSON)
     ai_generated = db.Column(db.Boolean, default=False)
     meta_data = db.Column(db.JSON)
+    # 群发成功后微信返回的图文消息ID及本文在消息中的位置（从1开始），用于关联数据统计
+    wechat_msg_data_id = db.Column(db.String(64))
+    wechat_msg_index = db.Column(db.Integer)
+    
+    @classmethod
+    def bulk_create(cls, rows: List[Dict]) -> Tuple[List['Article'], List[Dict]]:
+        """在一个事务中批量插入文章
+
+        先整批flush（一次批量INSERT并取回自增id）；如果有行失败，回滚到保存点后
+        逐行插入，跳过失败的行。返回 (已保存的文章, 失败记录)。
+        """
+        articles, failed = [], []
+        for index, row in enumerate(rows):
+            try:
+                articles.append((index, cls(**row)))
+            except Exception as e:
+                failed.append({'index': index, 'title': row.get('title', ''), 'error': str(e)})
+        
+        try:
+            with db.session.begin_nested():
+                db.session.add_all([article for _, article in articles])
+            saved = [article for _, article in articles]
+        except Exception:
+            saved = []
+            for index, article in articles:
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(article)
+                    saved.append(article)
+                except Exception as e:
+                    failed.append({'index': index, 'title': article.title, 'error': str(e)})
+        
+        db.session.commit()
+        failed.sort(key=lambda item: item['index'])
+        return saved, failed
+    
+    @classmethod
+    def list_previews(cls, limit: int = 20, cursor: Optional[Tuple[datetime, int]] = None,
+                      status: str = None, tag: str = None) -> Tuple[List[Dict], Optional[Tuple[datetime, int]]]:
+        """按 (created_at, id) 倒序做游标分页，只查询列表需要的列
+
+        预览内容在SQL中截取，不加载 content/html_content/markdown_content 全文。
+        返回 (文章列表, 下一页游标)，没有下一页时游标为 None。
+        """
+        preview = case(
+            (func.length(cls.content) > PREVIEW_LENGTH,
+             func.substr(cls.content, 1, PREVIEW_LENGTH).concat('...')),
+            else_=cls.content
+        ).label('preview')
+        
+        query = db.session.query(
+            cls.id, cls.title, preview, cls.cover_image, cls.status,
+            cls.created_at, cls.published_at, cls.tags
+        )
+        if status:
+            query = query.filter(cls.status == status)
+        if tag:
+            # JSON列序列化后匹配带引号的标签，兼容SQLite和PostgreSQL
+            pattern = json.dumps(tag).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(cast(cls.tags, db.Text).like(f'%{pattern}%', escape='\\'))
+        if cursor:
+            created_at, last_id = cursor
+            query = query.filter(or_(
+                cls.created_at < created_at,
+                and_(cls.created_at == created_at, cls.id < last_id)
+            ))
+        
+        rows = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        items = [
+            {
+                'id': row.id,
+                'title': row.title,
+                'content': row.preview,
+                'cover_image': row.cover_image,
+                'status': row.status,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'published_at': row.published_at.isoformat() if row.published_at else None,
+                'tags': row.tags
+            }
+            for row in rows
+        ]
+        next_cursor = (rows[-1].created_at, rows[-1].id) if has_more else None
+        return items, next_cursor
+    
+    @classmethod
+    def count_by_status(cls) -> Dict[str, int]:
+        """一次 GROUP BY 查询统计各状态的文章数"""
+        rows = db.session.query(cls.status, func.count(cls.id)).group_by(cls.status).all()
+        return {status: count for status, count in rows}
     
     def to_dict(self):
         return {
@@ -48,10 +154,230 @@ class Config(db.Model):
         }
 
 class PublishSchedule(db.Model):
+    __table_args__ = (
+        db.Index('ix_publish_schedule_status_time', 'status', 'scheduled_time'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     article_id = db.Column(db.Integer, db.ForeignKey('article.id'))
     scheduled_time = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(50), default='pending')
+    status = db.Column(db.String(50), default='pending')  # pending/publishing/completed/failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime)  # 实际开始发布的时间，与 scheduled_time 之差即调度延迟
+    # 预先上传的图文素材：同一时间发布的文章共用一个 media_id，stage_index 为在消息中的位置
+    staged_media_id = db.Column(db.String(128))
+    stage_index = db.Column(db.Integer)
+    stage_status = db.Column(db.String(20))  # staged/failed，为空表示未准备
+    staged_at = db.Column(db.DateTime)
+    
+    article = db.relationship('Article', backref='schedules')
+
+class Job(db.Model):
+    """后台任务（爬取、生成等耗时操作），由 services.job_queue 调度执行"""
+    id = db.Column(db.String(36), primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending/running/completed/failed
+    payload = db.Column(db.JSON)
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(500))
+    results = db.Column(db.JSON)  # 逐篇文章的处理结果
+    result = db.Column(db.JSON)  # 任务完成后的完整返回
+    error = db.Column(db.Text)
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'results': self.results or [],
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ScheduledJobState(db.Model):
+    """定时任务运行状态，同时作为多进程间的执行锁"""
+    job_id = db.Column(db.String(100), primary_key=True)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_slot = db.Column(db.DateTime)  # 最近一次被认领的触发时间片，防止多个worker重复执行
+    last_run_at = db.Column(db.DateTime)
+    last_duration = db.Column(db.Float)  # 秒
+    last_status = db.Column(db.String(20))  # running/success/failed
+    last_error = db.Column(db.Text)
+    last_runner = db.Column(db.String(100))
+    run_count = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_duration': self.last_duration,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'last_runner': self.last_runner,
+            'run_count': self.run_count,
+            'locked_by': self.locked_by,
+            'locked_until': self.locked_until.isoformat() if self.locked_until else None
+        }
+
+
+class ArticleDailyStats(db.Model):
+    """文章每日数据（按数据日期），同时冗余文章的发布日期便于按发布周期聚合"""
+    __table_args__ = (
+        db.UniqueConstraint('article_id', 'stat_date', name='uq_article_daily_stats'),
+        db.Index('ix_article_daily_stats_publish_date', 'publish_date', 'article_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
+    stat_date = db.Column(db.Date, nullable=False)
+    publish_date = db.Column(db.Date)
+    views = db.Column(db.Integer, default=0)
+    likes = db.Column(db.Integer, default=0)
+    comments = db.Column(db.Integer, default=0)
+    shares = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TagDailyStats(db.Model):
+    """标签汇总数据，按文章发布日期归档"""
+    __table_args__ = (
+        db.UniqueConstraint('tag', 'publish_date', name='uq_tag_daily_stats'),
+        db.Index('ix_tag_daily_stats_publish_date', 'publish_date'),
+    )
     
-    article = db.relationship('Article', backref='schedules')
\ No newline at end of file
+    id = db.Column(db.Integer, primary_key=True)
+    tag = db.Column(db.String(100), nullable=False)
+    publish_date = db.Column(db.Date, nullable=False)
+    article_count = db.Column(db.Integer, default=0)
+    views = db.Column(db.Integer, default=0)
+    likes = db.Column(db.Integer, default=0)
+    comments = db.Column(db.Integer, default=0)
+    shares = db.Column(db.Integer, default=0)
+
+
+class PublishSlotStats(db.Model):
+    """按发布时段（星期几 + 小时）汇总的数据"""
+    __table_args__ = (
+        db.UniqueConstraint('weekday', 'hour', name='uq_publish_slot_stats'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    weekday = db.Column(db.Integer, nullable=False)  # 0=Monday
+    hour = db.Column(db.Integer, nullable=False)
+    article_count = db.Column(db.Integer, default=0)
+    views = db.Column(db.Integer, default=0)
+    engagement = db.Column(db.Integer, default=0)  # likes + comments + shares
+
+
+class ArticleMetric(db.Model):
+    """微信数据统计接口返回的图文每日数据（原始时间序列）"""
+    __table_args__ = (
+        db.UniqueConstraint('msgid', 'stat_date', name='uq_article_metric_msgid_date'),
+        db.Index('ix_article_metric_article_date', 'article_id', 'stat_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    msgid = db.Column(db.String(64), nullable=False)  # {msg_data_id}_{index}
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'))
+    stat_date = db.Column(db.Date, nullable=False)
+    title = db.Column(db.String(200))
+    int_page_read_user = db.Column(db.Integer, default=0)
+    int_page_read_count = db.Column(db.Integer, default=0)
+    ori_page_read_user = db.Column(db.Integer, default=0)
+    ori_page_read_count = db.Column(db.Integer, default=0)
+    share_user = db.Column(db.Integer, default=0)
+    share_count = db.Column(db.Integer, default=0)
+    add_to_fav_user = db.Column(db.Integer, default=0)
+    add_to_fav_count = db.Column(db.Integer, default=0)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class WeChatMedia(db.Model):
+    """已上传到微信的素材，按文件内容哈希复用，避免重复上传"""
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'media_type', name='uq_wechat_media_hash_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256
+    media_type = db.Column(db.String(20), nullable=False)  # image: 临时素材; uploadimg: 图文内图片
+    media_id = db.Column(db.String(128))
+    url = db.Column(db.Text)
+    size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)  # 为空表示永久有效
+
+
+class CrawledItem(db.Model):
+    """已爬取过的内容，增量爬取时按规范化URL跳过请求、按正文指纹跳过改写"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.Text, nullable=False)  # 第一次遇到时的原始地址
+    canonical_url = db.Column(db.Text, nullable=False)
+    url_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256(canonical_url)
+    content_hash = db.Column(db.String(64), index=True)  # 原文（改写前）的指纹
+    # 原文的64位SimHash（有符号保存）及其4个16位分段，分段用于查找近似重复的候选
+    simhash = db.Column(db.BigInteger)
+    simhash_band0 = db.Column(db.Integer, index=True)
+    simhash_band1 = db.Column(db.Integer, index=True)
+    simhash_band2 = db.Column(db.Integer, index=True)
+    simhash_band3 = db.Column(db.Integer, index=True)
+    source_type = db.Column(db.String(20))
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'))
+    first_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PublishLedger(db.Model):
+    """群发记录：每篇文章按 (文章, 定时任务) 只发送一次，立即发布的 schedule_id 为0
+
+    状态: sending（已认领，media_id 非空表示即将/已经调用群发）、sent、
+    failed（确定未发送，可重新认领）、unknown（群发请求可能已送达，需人工确认）
+    """
+    __table_args__ = (
+        db.UniqueConstraint('article_id', 'schedule_id', name='uq_publish_ledger_article_schedule'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
+    schedule_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='sending', index=True)
+    claim_token = db.Column(db.String(32))  # 当前认领者，被接管后原认领者的写入不再生效
+    media_id = db.Column(db.String(128))
+    msg_index = db.Column(db.Integer)  # 在多图文消息中的位置，从1开始
+    msg_id = db.Column(db.String(64))
+    msg_data_id = db.Column(db.String(64))
+    attempts = db.Column(db.Integer, default=1)
+    error = db.Column(db.Text)
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'article_id': self.article_id,
+            'schedule_id': self.schedule_id,
+            'status': self.status,
+            'media_id': self.media_id,
+            'msg_index': self.msg_index,
+            'msg_id': self.msg_id,
+            'msg_data_id': self.msg_data_id,
+            'attempts': self.attempts,
+            'error': self.error,
+            'claimed_at': self.claimed_at.isoformat() if self.claimed_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
@@ -4,37 +4,42 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import logging
 import random
-from sqlalchemy import func, desc
-from models import Article, PublishSchedule, db
+from sqlalchemy import func, desc, case, cast
+from models import Article, PublishSchedule, ArticleDailyStats, TagDailyStats, PublishSlotStats, db
 
 logger = logging.getLogger(__name__)
 
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
 class AnalyticsService:
     """数据分析服务"""
     
     def __init__(self):
         self.db = db
     
-    def get_article_performance(self, article_id: int) -> Dict:
-        """获取文章表现数据"""
+    def get_article_performance(self, article_id: int = None) -> Dict:
+        """获取文章表现数据；不传 article_id 时返回近30天的整体数据"""
         try:
+            if article_id is None:
+                return self._get_overall_performance()
+            
             article = Article.query.get(article_id)
             if not article:
                 return {}
-                
-            # 从数据库获取实际数据，这里暂时使用模拟数据
-            # 实际项目中这些数据应该从微信API或数据库中获取
+            
+            # 阅读、点赞等数据来自微信数据统计接口（见 MetricsIngestion），只查询一次
+            metrics = self.get_metrics_for_articles([article_id]).get(article_id, self._empty_metrics())
             performance_data = {
                 'article_id': article_id,
                 'title': article.title,
                 'publish_date': article.published_at.isoformat() if article.published_at else None,
-                'views': self._get_mock_views(article_id),
-                'likes': self._get_mock_likes(article_id),
-                'comments': self._get_mock_comments(article_id),
-                'shares': self._get_mock_shares(article_id),
+                'views': metrics['views'],
+                'likes': metrics['likes'],
+                'comments': metrics['comments'],
+                'shares': metrics['shares'],
                 'read_time_avg': self._calculate_read_time(article.content),
                 'bounce_rate': self._calculate_bounce_rate(article_id),
-                'engagement_rate': self._calculate_engagement_rate(article_id),
+                'engagement_rate': self._calculate_engagement_rate(metrics),
                 'peak_hours': self._get_peak_reading_hours(article_id),
                 'audience_demographics': self._get_audience_demographics(article_id)
             }
@@ -45,25 +50,55 @@ class AnalyticsService:
             logger.error(f"获取文章数据失败: {str(e)}")
             return {}
     
-    def _get_mock_views(self, article_id: int) -> int:
-        """模拟阅读量数据"""
-        import random
-        return random.randint(1000, 10000)
-    
-    def _get_mock_likes(self, article_id: int) -> int:
-        """模拟点赞数据"""
-        import random
-        return random.randint(50, 500)
+    def _empty_metrics(self) -> Dict:
+        return {'views': 0, 'likes': 0, 'comments': 0, 'shares': 0}
     
-    def _get_mock_comments(self, article_id: int) -> int:
-        """模拟评论数据"""
-        import random
-        return random.randint(10, 100)
+    def get_metrics_for_articles(self, article_ids: List[int]) -> Dict[int, Dict]:
+        """一次查询多篇文章的累计数据"""
+        if not article_ids:
+            return {}
+        
+        rows = db.session.query(
+            ArticleDailyStats.article_id,
+            func.sum(ArticleDailyStats.views),
+            func.sum(ArticleDailyStats.likes),
+            func.sum(ArticleDailyStats.comments),
+            func.sum(ArticleDailyStats.shares)
+        ).filter(
+            ArticleDailyStats.article_id.in_(article_ids)
+        ).group_by(ArticleDailyStats.article_id).all()
+        
+        return {
+            article_id: {
+                'views': int(views or 0),
+                'likes': int(likes or 0),
+                'comments': int(comments or 0),
+                'shares': int(shares or 0)
+            }
+            for article_id, views, likes, comments, shares in rows
+        }
     
-    def _get_mock_shares(self, article_id: int) -> int:
-        """模拟分享数据"""
-        import random
-        return random.randint(20, 200)
+    def _get_overall_performance(self, days: int = 30) -> Dict:
+        """近 days 天的整体数据（按数据日期汇总）"""
+        since = (datetime.now() - timedelta(days=days)).date()
+        views, likes, comments, shares = db.session.query(
+            func.sum(ArticleDailyStats.views),
+            func.sum(ArticleDailyStats.likes),
+            func.sum(ArticleDailyStats.comments),
+            func.sum(ArticleDailyStats.shares)
+        ).filter(ArticleDailyStats.stat_date >= since).one()
+        
+        metrics = {
+            'views': int(views or 0),
+            'likes': int(likes or 0),
+            'comments': int(comments or 0),
+            'shares': int(shares or 0)
+        }
+        return {
+            'period_days': days,
+            **metrics,
+            'engagement_rate': self._calculate_engagement_rate(metrics)
+        }
     
     def _calculate_read_time(self, content: str) -> int:
         """计算平均阅读时间（秒）"""
@@ -77,14 +112,10 @@ class AnalyticsService:
         import random
         return round(random.uniform(0.15, 0.45), 2)
     
-    def _calculate_engagement_rate(self, article_id: int) -> float:
+    def _calculate_engagement_rate(self, metrics: Dict) -> float:
         """计算互动率"""
-        views = self._get_mock_views(article_id)
-        likes = self._get_mock_likes(article_id)
-        comments = self._get_mock_comments(article_id)
-        shares = self._get_mock_shares(article_id)
-        
-        engagement = likes + comments + shares
+        views = metrics['views']
+        engagement = metrics['likes'] + metrics['comments'] + metrics['shares']
         return round(engagement / views, 3) if views > 0 else 0
     
     def _get_peak_reading_hours(self, article_id: int) -> List[int]:
@@ -120,50 +151,26 @@ class AnalyticsService:
         }
     
     def get_best_publish_time(self) -> List[Dict]:
-        """分析最佳发布时间"""
+        """分析最佳发布时间（读取发布时段汇总表）"""
         try:
-            # 从数据库获取已发布文章的时间和表现数据
-            published_articles = Article.query.filter(
-                Article.status == 'published',
-                Article.published_at.isnot(None)
+            slots = PublishSlotStats.query.filter(
+                PublishSlotStats.article_count > 0,
+                PublishSlotStats.views > 0
             ).all()
             
-            if not published_articles:
+            if not slots:
                 # 返回默认推荐时间
                 return self._get_default_publish_times()
             
-            # 按星期和小时统计表现
-            time_performance = {}
-            
-            for article in published_articles:
-                publish_time = article.published_at
-                weekday = publish_time.strftime('%A')
-                hour = publish_time.hour
-                
-                key = f"{weekday}_{hour}"
-                if key not in time_performance:
-                    time_performance[key] = {
-                        'day': weekday,
-                        'hour': hour,
-                        'articles': [],
-                        'total_engagement': 0
-                    }
-                
-                # 模拟计算互动率
-                engagement = self._calculate_engagement_rate(article.id)
-                time_performance[key]['articles'].append(article.id)
-                time_performance[key]['total_engagement'] += engagement
-            
-            # 计算平均表现并排序
-            best_times = []
-            for key, data in time_performance.items():
-                avg_engagement = data['total_engagement'] / len(data['articles'])
-                best_times.append({
-                    'day': data['day'],
-                    'hour': data['hour'],
-                    'engagement': round(avg_engagement, 3),
-                    'sample_size': len(data['articles'])
-                })
+            best_times = [
+                {
+                    'day': WEEKDAY_NAMES[slot.weekday],
+                    'hour': slot.hour,
+                    'engagement': round(slot.engagement / slot.views, 3),
+                    'sample_size': slot.article_count
+                }
+                for slot in slots
+            ]
             
             # 按互动率排序，返回前5个
             best_times.sort(key=lambda x: x['engagement'], reverse=True)
@@ -183,47 +190,28 @@ class AnalyticsService:
         ]
     
     def get_content_recommendations(self) -> List[Dict]:
-        """获取内容推荐"""
+        """获取内容推荐（读取近90天的标签汇总表）"""
         try:
-            # 分析表现最好的文章标签
-            top_performing_articles = Article.query.filter(
-                Article.status == 'published',
-                Article.tags.isnot(None)
-            ).order_by(desc(Article.created_at)).limit(50).all()
+            since = (datetime.now() - timedelta(days=90)).date()
+            tag_rows = self._query_tag_stats(since)
             
-            if not top_performing_articles:
+            if not tag_rows:
                 return self._get_default_content_recommendations()
             
-            # 统计标签频率和表现
-            tag_performance = {}
-            for article in top_performing_articles:
-                if article.tags:
-                    engagement = self._calculate_engagement_rate(article.id)
-                    for tag in article.tags:
-                        if tag not in tag_performance:
-                            tag_performance[tag] = {
-                                'count': 0,
-                                'total_engagement': 0,
-                                'articles': []
-                            }
-                        tag_performance[tag]['count'] += 1
-                        tag_performance[tag]['total_engagement'] += engagement
-                        tag_performance[tag]['articles'].append(article.id)
-            
             # 计算推荐话题
             recommendations = []
-            for tag, data in tag_performance.items():
-                if data['count'] >= 3:  # 至少有3篇文章
-                    avg_engagement = data['total_engagement'] / data['count']
-                    trend = self._analyze_topic_trend(tag, data['articles'])
+            for row in tag_rows:
+                if row.article_count >= 3 and row.views:  # 至少有3篇文章
+                    avg_engagement = row.engagement / row.views
+                    trend = self._analyze_topic_trend(row.tag, [])
                     
                     recommendations.append({
-                        'topic': tag,
+                        'topic': row.tag,
                         'trend': trend,
                         'predicted_engagement': round(avg_engagement, 3),
-                        'keywords': self._extract_keywords_for_topic(tag),
-                        'sample_size': data['count'],
-                        'confidence': min(1.0, data['count'] / 10)  # 置信度
+                        'keywords': self._extract_keywords_for_topic(row.tag),
+                        'sample_size': row.article_count,
+                        'confidence': min(1.0, row.article_count / 10)  # 置信度
                     })
             
             # 按预期互动率排序
@@ -234,6 +222,19 @@ class AnalyticsService:
             logger.error(f"获取内容推荐失败: {str(e)}")
             return self._get_default_content_recommendations()
     
+    def _query_tag_stats(self, start_date, end_date=None) -> List:
+        """按标签聚合发布日期在区间内的汇总数据"""
+        engagement = TagDailyStats.likes + TagDailyStats.comments + TagDailyStats.shares
+        query = db.session.query(
+            TagDailyStats.tag,
+            func.sum(TagDailyStats.article_count).label('article_count'),
+            func.sum(TagDailyStats.views).label('views'),
+            func.sum(engagement).label('engagement')
+        ).filter(TagDailyStats.publish_date >= start_date)
+        if end_date:
+            query = query.filter(TagDailyStats.publish_date < end_date)
+        return query.group_by(TagDailyStats.tag).all()
+    
     def _get_default_content_recommendations(self) -> List[Dict]:
         """获取默认内容推荐"""
         return [
@@ -288,7 +289,7 @@ class AnalyticsService:
         return [topic]
     
     def generate_report(self, period: str = 'weekly') -> Dict:
-        """生成运营报告"""
+        """生成运营报告（读取汇总表，不加载文章全文）"""
         try:
             # 计算时间范围
             if period == 'weekly':
@@ -304,78 +305,46 @@ class AnalyticsService:
                 date_range = '过去7天'
                 start_date = datetime.now() - timedelta(days=7)
             
-            # 获取时间范围内的文章
-            articles_in_period = Article.query.filter(
-                Article.published_at >= start_date,
-                Article.status == 'published'
-            ).all()
+            end_date = datetime.now()
+            prev_start = start_date - (end_date - start_date)
+            
+            # 时间范围内文章的数量、平均长度等
+            period_stats = self._query_period_articles(start_date)
+            total_articles = period_stats['count']
+            prev_articles = self._query_period_articles(prev_start, start_date)['count']
             
             # 计算总览数据
-            total_articles = len(articles_in_period)
-            total_views = sum(self._get_mock_views(article.id) for article in articles_in_period)
-            total_engagement = sum(
-                self._get_mock_likes(article.id) + 
-                self._get_mock_comments(article.id) + 
-                self._get_mock_shares(article.id)
-                for article in articles_in_period
-            )
+            total_views, total_engagement = self._query_rollup_totals(start_date.date())
+            prev_views, prev_engagement = self._query_rollup_totals(prev_start.date(), start_date.date())
             
             # 获取表现最好的文章
-            top_articles = []
-            for article in articles_in_period:
-                views = self._get_mock_views(article.id)
-                top_articles.append({
-                    'id': article.id,
-                    'title': article.title,
-                    'views': views,
-                    'engagement': self._calculate_engagement_rate(article.id),
-                    'publish_date': article.published_at.strftime('%Y-%m-%d')
-                })
-            
-            top_articles.sort(key=lambda x: x['views'], reverse=True)
-            top_articles = top_articles[:5]
-            
-            # 计算增长数据（与上一个周期对比）
-            prev_start = start_date - (datetime.now() - start_date)
-            prev_articles = Article.query.filter(
-                Article.published_at >= prev_start,
-                Article.published_at < start_date,
-                Article.status == 'published'
-            ).all()
-            
-            prev_views = sum(self._get_mock_views(article.id) for article in prev_articles)
-            prev_engagement = sum(
-                self._get_mock_likes(article.id) + 
-                self._get_mock_comments(article.id) + 
-                self._get_mock_shares(article.id)
-                for article in prev_articles
-            )
+            top_articles = self._query_top_articles(start_date.date())
             
             views_growth = self._calculate_growth_rate(total_views, prev_views)
             engagement_growth = self._calculate_growth_rate(total_engagement, prev_engagement)
             
             # 生成建议
-            recommendations = self._generate_recommendations(articles_in_period)
+            recommendations = self._generate_recommendations(period_stats)
             
             return {
                 'period': date_range,
                 'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': datetime.now().strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d'),
                 'summary': {
                     'total_articles': total_articles,
                     'total_views': total_views,
                     'total_engagement': total_engagement,
                     'avg_views_per_article': total_views // max(1, total_articles),
                     'avg_engagement_rate': round(total_engagement / max(1, total_views), 3),
-                    'avg_read_time': sum(self._calculate_read_time(article.content) for article in articles_in_period) // max(1, total_articles)
+                    'avg_read_time': self._calculate_read_time_from_length(period_stats['avg_length'])
                 },
                 'top_articles': top_articles,
                 'growth': {
                     'views': views_growth,
                     'engagement': engagement_growth,
-                    'articles': f"+{total_articles - len(prev_articles)}"
+                    'articles': f"+{total_articles - prev_articles}"
                 },
-                'content_analysis': self._analyze_content_performance(articles_in_period),
+                'content_analysis': self._analyze_content_performance(start_date.date()),
                 'recommendations': recommendations
             }
             
@@ -383,6 +352,77 @@ class AnalyticsService:
             logger.error(f"生成报告失败: {str(e)}")
             return self._get_default_report()
     
+    def _calculate_read_time_from_length(self, length: float) -> int:
+        """按平均字数计算阅读时间（秒），每分钟300字"""
+        return int((length or 0) / 300 * 60)
+    
+    def _query_period_articles(self, start_date: datetime, end_date: datetime = None) -> Dict:
+        """在SQL中聚合时间范围内已发布文章的数量、长度、配图和发布小时"""
+        filters = [Article.status == 'published', Article.published_at >= start_date]
+        if end_date:
+            filters.append(Article.published_at < end_date)
+        
+        has_images = case(
+            (cast(Article.images, db.Text).notin_(['[]', 'null']), 1),
+            else_=0
+        )
+        count, avg_length, with_images = db.session.query(
+            func.count(Article.id),
+            func.avg(func.length(Article.content)),
+            func.sum(has_images)
+        ).filter(*filters).one()
+        
+        hour = func.extract('hour', Article.published_at)
+        top_hour = db.session.query(hour, func.count(Article.id)).filter(*filters).group_by(
+            hour
+        ).order_by(func.count(Article.id).desc()).first()
+        
+        return {
+            'count': count or 0,
+            'avg_length': float(avg_length or 0),
+            'with_images': int(with_images or 0),
+            'most_common_hour': int(top_hour[0]) if top_hour else None
+        }
+    
+    def _query_rollup_totals(self, start_date, end_date=None) -> tuple:
+        """按发布日期区间汇总阅读量和互动量"""
+        query = db.session.query(
+            func.sum(ArticleDailyStats.views),
+            func.sum(ArticleDailyStats.likes + ArticleDailyStats.comments + ArticleDailyStats.shares)
+        ).filter(ArticleDailyStats.publish_date >= start_date)
+        if end_date:
+            query = query.filter(ArticleDailyStats.publish_date < end_date)
+        views, engagement = query.one()
+        return int(views or 0), int(engagement or 0)
+    
+    def _query_top_articles(self, start_date, limit: int = 5) -> List[Dict]:
+        """发布日期在区间内、阅读量最高的文章"""
+        views = func.sum(ArticleDailyStats.views).label('views')
+        engagement = func.sum(
+            ArticleDailyStats.likes + ArticleDailyStats.comments + ArticleDailyStats.shares
+        ).label('engagement')
+        rows = db.session.query(
+            Article.id, Article.title, Article.published_at, views, engagement
+        ).join(
+            ArticleDailyStats, ArticleDailyStats.article_id == Article.id
+        ).filter(
+            ArticleDailyStats.publish_date >= start_date,
+            Article.status == 'published'
+        ).group_by(
+            Article.id, Article.title, Article.published_at
+        ).order_by(desc('views')).limit(limit).all()
+        
+        return [
+            {
+                'id': row.id,
+                'title': row.title,
+                'views': int(row.views or 0),
+                'engagement': round((row.engagement or 0) / row.views, 3) if row.views else 0,
+                'publish_date': row.published_at.strftime('%Y-%m-%d') if row.published_at else None
+            }
+            for row in rows
+        ]
+    
     def _calculate_growth_rate(self, current: int, previous: int) -> str:
         """计算增长率"""
         if previous == 0:
@@ -392,35 +432,23 @@ class AnalyticsService:
         sign = "+" if growth > 0 else ""
         return f"{sign}{growth:.1f}%"
     
-    def _analyze_content_performance(self, articles: List) -> Dict:
-        """分析内容表现"""
-        if not articles:
+    def _analyze_content_performance(self, start_date) -> Dict:
+        """分析内容表现（按标签汇总表）"""
+        tag_rows = self._query_tag_stats(start_date)
+        if not tag_rows:
             return {}
         
         # 按标签分析
         tag_performance = {}
-        for article in articles:
-            if article.tags:
-                for tag in article.tags:
-                    if tag not in tag_performance:
-                        tag_performance[tag] = {
-                            'count': 0,
-                            'total_views': 0,
-                            'total_engagement': 0
-                        }
-                    
-                    tag_performance[tag]['count'] += 1
-                    tag_performance[tag]['total_views'] += self._get_mock_views(article.id)
-                    tag_performance[tag]['total_engagement'] += (
-                        self._get_mock_likes(article.id) + 
-                        self._get_mock_comments(article.id) + 
-                        self._get_mock_shares(article.id)
-                    )
-        
-        # 计算平均表现
-        for tag, data in tag_performance.items():
-            data['avg_views'] = data['total_views'] // data['count']
-            data['avg_engagement'] = data['total_engagement'] // data['count']
+        for row in tag_rows:
+            count = max(1, row.article_count or 0)
+            tag_performance[row.tag] = {
+                'count': row.article_count or 0,
+                'total_views': int(row.views or 0),
+                'total_engagement': int(row.engagement or 0),
+                'avg_views': int(row.views or 0) // count,
+                'avg_engagement': int(row.engagement or 0) // count
+            }
         
         return {
             'by_topic': tag_performance,
@@ -428,36 +456,33 @@ class AnalyticsService:
             'most_popular_topic': max(tag_performance.keys(), key=lambda k: tag_performance[k]['avg_views']) if tag_performance else None
         }
     
-    def _generate_recommendations(self, articles: List) -> List[str]:
-        """生成运营建议"""
+    def _generate_recommendations(self, period_stats: Dict) -> List[str]:
+        """生成运营建议（基于 _query_period_articles 的聚合结果）"""
         recommendations = []
+        count = period_stats['count']
         
-        if not articles:
+        if not count:
             recommendations.append("建议开始发布更多内容以获得数据洞察")
             return recommendations
         
         # 分析发布频率
-        if len(articles) < 3:
+        if count < 3:
             recommendations.append("建议增加发布频率，保持与读者的互动")
         
         # 分析内容长度
-        avg_length = sum(len(article.content) for article in articles) / len(articles)
+        avg_length = period_stats['avg_length']
         if avg_length < 500:
             recommendations.append("文章内容偏短，建议增加深度和详细度")
         elif avg_length > 3000:
             recommendations.append("文章内容较长，建议适当精简或分段发布")
         
         # 分析图片使用
-        articles_with_images = sum(1 for article in articles if article.images)
-        if articles_with_images / len(articles) < 0.5:
+        if period_stats['with_images'] / count < 0.5:
             recommendations.append("建议为更多文章添加配图，提升阅读体验")
         
         # 分析发布时间
-        publish_hours = [article.published_at.hour for article in articles if article.published_at]
-        if publish_hours:
-            from collections import Counter
-            hour_counts = Counter(publish_hours)
-            most_common_hour = hour_counts.most_common(1)[0][0]
+        most_common_hour = period_stats['most_common_hour']
+        if most_common_hour is not None:
             if most_common_hour < 8 or most_common_hour > 22:
                 recommendations.append(f"当前主要在{most_common_hour}点发布，建议尝试黄金时段（8-22点）")
         
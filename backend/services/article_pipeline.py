@@ -0,0 +1,552 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import or_
+
+from config import Config
+from models import db, Article, PublishSchedule
+from utils.exceptions import CrawlerError
+
+logger = logging.getLogger(__name__)
+
+# 文章生成的篇幅和风格提示
+LENGTH_PROMPTS = {
+    'short': '写一篇500字左右的短文章',
+    'medium': '写一篇1000字左右的中等篇幅文章',
+    'long': '写一篇2000字左右的长文章'
+}
+
+STYLE_PROMPTS = {
+    'professional': '专业严谨的风格',
+    'casual': '轻松随意的风格',
+    'creative': '创意有趣的风格'
+}
+
+
+def crawl_and_save(params: Dict, reporter=None) -> Dict:
+    """爬取 -> LLM改写 -> 保存草稿，/api/crawl 同步调用和后台任务共用"""
+    from services.crawl_state import CrawlState
+    from services.crawler import ArticleCrawler
+    from services.llm_service import LLMService
+
+    source_url = params.get('source_url', '')
+    source_type = params.get('source_type', 'auto')
+    max_count = params.get('max_count', 5)
+    enable_rewrite = params.get('enable_rewrite', True)
+    incremental = params.get('incremental', Config.CRAWLER_INCREMENTAL)
+
+    # 爬取文章（增量爬取时跳过已爬取过的链接）
+    if reporter:
+        reporter.update(message='正在爬取')
+    crawl_state = CrawlState() if incremental else None
+    crawler = ArticleCrawler(crawl_state=crawl_state)
+    articles = crawler.crawl(source_url, source_type, max_count)
+
+    unchanged = []
+    if crawl_state:
+        # 正文与已处理过的内容相同或相近（其他来源的转载）的不再改写
+        articles, unchanged = crawl_state.filter_unchanged(articles)
+        crawl_state.record(unchanged)
+
+    if not articles:
+        if crawl_state and (crawl_state.skipped_urls or unchanged):
+            return {
+                'success': True,
+                'count': 0,
+                'articles': [],
+                'failed': [],
+                'skipped': crawl_state.skipped_urls + len(unchanged),
+                'message': '没有新内容，已爬取过的文章均已跳过'
+            }
+        raise CrawlerError('未能爬取到任何内容，请检查URL是否正确')
+
+    # LLM改写（如果启用）
+    if enable_rewrite:
+        if reporter:
+            reporter.update(progress=0, total=len(articles), message='正在改写')
+        llm_service = LLMService()
+        articles = llm_service.rewrite_batch(articles)
+
+    # 保存到数据库（整批一个事务，失败的行跳过）
+    if reporter:
+        reporter.update(progress=0, total=len(articles), message='正在保存')
+    rows = [
+        {
+            'title': article_data.get('title', ''),
+            'content': article_data.get('content', ''),
+            'status': 'draft',
+            'ai_generated': article_data.get('rewritten', False),
+            'source_url': article_data.get('source_url', ''),
+            'meta_data': json.dumps({
+                'source_type': article_data.get('source_type', ''),
+                'original_title': article_data.get('original_title', ''),
+                'crawl_time': datetime.now().isoformat(),
+                'rewritten': article_data.get('rewritten', False),
+                'meta': article_data.get('meta', {})
+            })
+        }
+        for article_data in articles
+    ]
+    saved, failed = Article.bulk_create(rows)
+    for item in failed:
+        logger.error(f"保存文章失败: {item['title']} - {item['error']}")
+
+    failed_indexes = {item['index'] for item in failed}
+    saved_sources = [data for index, data in enumerate(articles) if index not in failed_indexes]
+    if crawl_state:
+        crawl_state.record([
+            {**article_data, 'article_id': article.id}
+            for article, article_data in zip(saved, saved_sources)
+        ])
+    saved_articles = []
+    for article, article_data in zip(saved, saved_sources):
+        saved_item = {
+            'id': article.id,
+            'title': article.title,
+            'content': article.content[:200] + '...' if len(article.content) > 200 else article.content,
+            'status': article.status,
+            'source_type': article_data.get('source_type', ''),
+            'rewritten': article_data.get('rewritten', False)
+        }
+        saved_articles.append(saved_item)
+        if reporter:
+            reporter.add_result(saved_item)
+
+    return {
+        'success': True,
+        'count': len(saved_articles),
+        'articles': saved_articles,
+        'failed': failed,
+        'skipped': crawl_state.skipped_urls + len(unchanged) if crawl_state else 0,
+        'message': f'成功爬取并保存 {len(saved_articles)} 篇文章' +
+                   ('（已进行LLM改写）' if enable_rewrite else '')
+    }
+
+
+def generate_and_save(params: Dict, reporter=None) -> Dict:
+    """按主题生成文章并保存草稿，/api/generate 同步调用和后台任务共用"""
+    from services.llm_service import LLMService
+
+    topic = params.get('topic', '')
+    style = params.get('style', 'professional')
+    length = params.get('length', 'medium')
+
+    llm_service = LLMService()
+
+    # 构建提示词
+    prompt = (
+        f"请以{STYLE_PROMPTS.get(style, '专业严谨的风格')}，"
+        f"{LENGTH_PROMPTS.get(length, '写一篇1000字左右的中等篇幅文章')}，主题是：{topic}"
+    )
+
+    # 生成内容
+    if reporter:
+        reporter.update(progress=0, total=1, message='正在生成')
+    content = llm_service.generate_content(prompt)
+    title = llm_service.generate_title(content)
+
+    # 创建文章记录
+    article = Article(
+        title=title,
+        content=content,
+        status='draft',
+        ai_generated=True
+    )
+    db.session.add(article)
+    db.session.commit()
+
+    article_data = {
+        'id': article.id,
+        'title': article.title,
+        'content': article.content,
+        'status': article.status,
+        'created_at': article.created_at.isoformat()
+    }
+    if reporter:
+        reporter.add_result({'id': article.id, 'title': article.title, 'status': article.status})
+
+    return {
+        'success': True,
+        'article': article_data,
+        'message': '文章生成成功'
+    }
+
+
+def build_publish_payload(article: Article, wechat=None) -> Dict:
+    """发布所需的文章数据，没有HTML内容时由Markdown转换
+
+    传入 wechat 时把正文中的外链图片转存到微信（微信不显示外链图片）。
+    """
+    html_content = article.html_content
+    if not html_content:
+        from services.markdown_converter import MarkdownToWeChatHTML
+        html_content = MarkdownToWeChatHTML().convert(article.markdown_content or article.content)
+
+    if wechat is not None:
+        from services.image_rehost import ImageRehoster
+        html_content = ImageRehoster(wechat).rehost(html_content)
+
+    return {
+        'title': article.title,
+        'html_content': html_content,
+        'cover_image': article.cover_image,
+        'source_url': article.source_url or ''
+    }
+
+
+def _mark_published(article: Article, result: Dict, index: int, published_at: datetime):
+    article.status = 'published'
+    article.published_at = published_at
+    msg_data_id = result.get('msg_data_id')
+    article.wechat_msg_data_id = str(msg_data_id) if msg_data_id is not None else None
+    article.wechat_msg_index = index
+
+
+def publish_article(article: Article, wechat=None) -> Dict:
+    """立即发布单篇文章，按群发记录去重，重复请求不会再次群发"""
+    from services.publish_ledger import SendLedger, MANUAL_SCHEDULE_ID
+    from services.wechat_api import WeChatAPI
+
+    wechat = wechat or WeChatAPI()
+    ledger = SendLedger()
+    key = (article.id, MANUAL_SCHEDULE_ID)
+    claim = ledger.claim([key])
+
+    if key in claim.sent:
+        result = ledger.as_result(claim.sent[key])
+    elif key in claim.unknown:
+        return {"success": False, "message": "上次群发结果未知，请在公众号后台确认后再处理"}
+    elif not claim.claimed:
+        return {"success": False, "message": "文章正在发布中，请勿重复提交"}
+    else:
+        try:
+            payload = build_publish_payload(article, wechat)
+        except Exception:
+            ledger.fail(claim, [key], '准备发布内容失败')
+            raise
+        result = _send_claimed(wechat, ledger, claim, [key], [payload])
+
+    if result['success']:
+        _mark_published(article, result, 1, datetime.now())
+        db.session.commit()
+
+    return result
+
+
+def publish_due_schedules(now: datetime = None, wechat=None) -> Dict:
+    """发布到期的定时任务
+
+    先逐行原子认领（pending -> publishing），多个worker同时触发时每行只会被一个认领。
+    已预先上传素材（stage_upcoming_schedules）的任务直接群发；其余任务按
+    同一时段（PUBLISH_SLOT_MINUTES）合成一条多图文消息，每条最多8篇，
+    只上传和群发一次。群发结果逐篇写回文章和定时任务。
+    """
+    from services.publish_ledger import SendLedger
+    from services.wechat_api import WeChatAPI, MAX_NEWS_ARTICLES
+
+    now = now or datetime.now()
+    _recover_stuck_schedules()
+    schedules = _claim_due_schedules(now)
+
+    wechat = wechat or WeChatAPI()
+    stats = {'messages': 0, 'published': 0, 'failed': 0, 'staged': 0, 'reconciled': 0}
+    latencies = [(schedule.dispatched_at - schedule.scheduled_time).total_seconds() for schedule in schedules]
+
+    ledger = SendLedger()
+    claim = ledger.claim([(schedule.article_id, schedule.id) for schedule in schedules])
+    schedules = _reconcile_sent(ledger, claim, schedules, now, stats)
+    db.session.commit()
+
+    staged, unstaged = _split_staged(schedules)
+    for media_id, group in staged.items():
+        result = ledger.send(wechat, claim, [(schedule.article_id, schedule.id) for schedule in group], media_id)
+        stats['messages'] += 1
+        stats['staged'] += len(group)
+        for schedule in group:
+            _apply_publish_result(schedule, result, schedule.stage_index, now, stats)
+        db.session.commit()
+
+    slots = OrderedDict()
+    for schedule in unstaged:
+        slots.setdefault(_publish_slot(schedule.scheduled_time), []).append(schedule)
+    for slot, slot_schedules in slots.items():
+        for start in range(0, len(slot_schedules), MAX_NEWS_ARTICLES):
+            chunk = slot_schedules[start:start + MAX_NEWS_ARTICLES]
+            _publish_chunk(wechat, ledger, claim, chunk, now, stats)
+            db.session.commit()
+
+    if latencies:
+        stats['max_dispatch_latency'] = round(max(latencies), 3)
+        logger.info(
+            f"定时发布完成: {stats['messages']}条消息（预上传{stats['staged']}篇, 对账{stats['reconciled']}篇）, "
+            f"发布{stats['published']}篇, 失败{stats['failed']}篇, "
+            f"最大调度延迟 {stats['max_dispatch_latency']:.1f}s"
+        )
+    return stats
+
+
+def _claim_due_schedules(now: datetime) -> List[PublishSchedule]:
+    """认领已到期、文章已审核的定时任务"""
+    candidates = db.session.query(PublishSchedule.id).join(
+        Article, PublishSchedule.article_id == Article.id
+    ).filter(
+        PublishSchedule.scheduled_time <= now,
+        PublishSchedule.status == 'pending',
+        Article.status == 'approved'
+    ).order_by(PublishSchedule.scheduled_time, PublishSchedule.id).all()
+
+    claimed_ids = []
+    for (schedule_id,) in candidates:
+        claimed = PublishSchedule.query.filter(
+            PublishSchedule.id == schedule_id,
+            PublishSchedule.status == 'pending'
+        ).update({
+            'status': 'publishing',
+            'dispatched_at': datetime.now()
+        }, synchronize_session=False)
+        if claimed:
+            claimed_ids.append(schedule_id)
+    db.session.commit()
+
+    if not claimed_ids:
+        return []
+    return PublishSchedule.query.filter(
+        PublishSchedule.id.in_(claimed_ids)
+    ).order_by(PublishSchedule.scheduled_time, PublishSchedule.id).all()
+
+
+def _recover_stuck_schedules():
+    """发布中断（进程退出等）后一直停在 publishing 的任务放回 pending，重新认领时按群发记录对账"""
+    cutoff = datetime.now() - timedelta(minutes=Config.PUBLISH_SEND_STALE_MINUTES)
+    recovered = PublishSchedule.query.filter(
+        PublishSchedule.status == 'publishing',
+        PublishSchedule.dispatched_at < cutoff
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+    if recovered:
+        logger.warning(f"{recovered} 个定时任务发布中断，重新发布")
+
+
+def _reconcile_sent(ledger, claim, schedules: List[PublishSchedule], now: datetime, stats: Dict) -> List[PublishSchedule]:
+    """按群发记录处理认领结果，返回需要发送的任务
+
+    已发送的直接补写结果；结果未知的标记失败，不自动重发。
+    其他进程正在发送的保持 publishing：放回 pending 会因为计划时间已过被立即重新触发，
+    对方没发完之前反复认领；留给 _recover_stuck_schedules 超时后放回 pending 再对账。
+    """
+    claimed = set(claim.claimed)
+    pending = []
+    for schedule in schedules:
+        key = (schedule.article_id, schedule.id)
+        if key in claimed:
+            pending.append(schedule)
+        elif key in claim.sent:
+            entry = claim.sent[key]
+            _apply_publish_result(schedule, ledger.as_result(entry), entry.msg_index, now, stats)
+            stats['reconciled'] += 1
+        elif key in claim.unknown:
+            schedule.status = 'failed'
+            stats['failed'] += 1
+            logger.error(f"文章群发结果未知，需人工确认: {schedule.article.title}")
+        else:
+            logger.info(f"文章正在由其他进程群发，稍后对账: {schedule.article.title}")
+    return pending
+
+
+def _split_staged(schedules: List[PublishSchedule]):
+    """按预上传的素材分组；素材中的文章没有全部在本次认领到时不能直接群发，改走常规发布"""
+    groups = OrderedDict()
+    unstaged = []
+    for schedule in schedules:
+        if schedule.stage_status == 'staged' and schedule.staged_media_id:
+            groups.setdefault(schedule.staged_media_id, []).append(schedule)
+        else:
+            unstaged.append(schedule)
+
+    staged = OrderedDict()
+    for media_id, group in groups.items():
+        expected = PublishSchedule.query.filter_by(staged_media_id=media_id).count()
+        if expected == len(group):
+            staged[media_id] = sorted(group, key=lambda schedule: schedule.stage_index or 0)
+        else:
+            logger.warning(f"预上传素材 {media_id} 的文章未同时到期，改为重新上传发布")
+            unstaged.extend(group)
+    unstaged.sort(key=lambda schedule: (schedule.scheduled_time, schedule.id))
+    return staged, unstaged
+
+
+def _publish_slot(scheduled_time: datetime) -> datetime:
+    minutes = max(1, Config.PUBLISH_SLOT_MINUTES)
+    minute_of_day = scheduled_time.hour * 60 + scheduled_time.minute
+    slot_minute = minute_of_day - minute_of_day % minutes
+    return scheduled_time.replace(hour=slot_minute // 60, minute=slot_minute % 60, second=0, microsecond=0)
+
+
+def _prepare_chunk(wechat, schedules: List[PublishSchedule], on_error):
+    """生成一组定时任务的发布内容，整组的正文图片一起转存
+
+    返回 (payloads, ready)，准备失败的任务交给 on_error(schedule)。
+    """
+    from services.image_rehost import ImageRehoster
+
+    payloads, ready = [], []
+    for schedule in schedules:
+        try:
+            payloads.append(build_publish_payload(schedule.article))
+            ready.append(schedule)
+        except Exception as e:
+            on_error(schedule)
+            logger.error(f"准备发布内容失败: {schedule.article.title} - {str(e)}")
+
+    if ready:
+        htmls = ImageRehoster(wechat).rehost_many([payload['html_content'] for payload in payloads])
+        for payload, html_content in zip(payloads, htmls):
+            payload['html_content'] = html_content
+    return payloads, ready
+
+
+def _apply_publish_result(schedule: PublishSchedule, result: Dict, index: int, now: datetime, stats: Dict):
+    article = schedule.article
+    if result['success']:
+        _mark_published(article, result, index, now)
+        schedule.status = 'completed'
+        stats['published'] += 1
+        logger.info(f"成功发布文章: {article.title}")
+    else:
+        schedule.status = 'failed'
+        stats['failed'] += 1
+        logger.error(f"发布失败: {article.title} - {result['message']}")
+
+
+def _send_claimed(wechat, ledger, claim, keys: List, payloads: List[Dict]) -> Dict:
+    """上传素材后通过群发记录发送（上传失败时释放认领）"""
+    media_id = wechat.upload_batch(payloads)
+    if not media_id:
+        ledger.fail(claim, keys, '上传图文消息失败')
+        return {"success": False, "message": "上传图文消息失败"}
+    return ledger.send(wechat, claim, keys, media_id)
+
+
+def _publish_chunk(wechat, ledger, claim, schedules: List[PublishSchedule], now: datetime, stats: Dict):
+    """把一组定时任务作为一条图文消息发布"""
+    failed_keys = []
+
+    def fail(schedule):
+        schedule.status = 'failed'
+        stats['failed'] += 1
+        failed_keys.append((schedule.article_id, schedule.id))
+
+    payloads, ready = _prepare_chunk(wechat, schedules, fail)
+    if failed_keys:
+        ledger.fail(claim, failed_keys, '准备发布内容失败')
+    if not ready:
+        return
+
+    started = time.monotonic()
+    result = _send_claimed(wechat, ledger, claim, [(schedule.article_id, schedule.id) for schedule in ready], payloads)
+    logger.info(f"发布{len(ready)}篇文章耗时 {time.monotonic() - started:.2f}s")
+    stats['messages'] += 1
+    for index, schedule in enumerate(ready, start=1):
+        _apply_publish_result(schedule, result, index, now, stats)
+
+
+def stage_upcoming_schedules(now: datetime = None, wechat=None) -> Dict:
+    """预先准备 PUBLISH_STAGE_MINUTES 分钟内到期的定时任务
+
+    生成并保存HTML和封面图，转存正文图片，上传图文素材并把 media_id
+    记在定时任务上，到点时 publish_due_schedules 只需群发一次。
+    同一时间到期的文章合成一条素材（每条最多8篇）。只写回仍为 pending 的任务；
+    文章内容或发布时间在准备之后被修改时，预上传的素材会作废，到点重新上传。
+    """
+    from services.wechat_api import WeChatAPI, MAX_NEWS_ARTICLES
+
+    now = now or datetime.now()
+    schedules = PublishSchedule.query.join(
+        Article, PublishSchedule.article_id == Article.id
+    ).filter(
+        PublishSchedule.status == 'pending',
+        PublishSchedule.scheduled_time > now,
+        PublishSchedule.scheduled_time <= now + timedelta(minutes=Config.PUBLISH_STAGE_MINUTES),
+        Article.status == 'approved',
+        or_(PublishSchedule.stage_status.is_(None), PublishSchedule.stage_status == 'failed')
+    ).order_by(PublishSchedule.scheduled_time, PublishSchedule.id).all()
+
+    stats = {'messages': 0, 'staged': 0, 'failed': 0}
+    if not schedules:
+        return stats
+
+    groups = OrderedDict()
+    for schedule in schedules:
+        groups.setdefault(schedule.scheduled_time, []).append(schedule)
+
+    wechat = wechat or WeChatAPI()
+    for scheduled_time, group in groups.items():
+        for start in range(0, len(group), MAX_NEWS_ARTICLES):
+            try:
+                _stage_chunk(wechat, group[start:start + MAX_NEWS_ARTICLES], stats)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"预上传定时发布素材失败: {str(e)}")
+
+    logger.info(
+        f"定时发布预上传完成: {stats['messages']}条素材, "
+        f"准备{stats['staged']}篇, 失败{stats['failed']}篇"
+    )
+    return stats
+
+
+def _stage_chunk(wechat, schedules: List[PublishSchedule], stats: Dict):
+    # 生成的HTML和封面图保存到文章上，到点改走常规发布时也不用重新生成
+    for schedule in schedules:
+        _render_article(schedule.article)
+    db.session.commit()
+
+    failed_ids = []
+
+    def fail(schedule):
+        failed_ids.append(schedule.id)
+
+    payloads, ready = _prepare_chunk(wechat, schedules, fail)
+    media_id = None
+    if ready:
+        news_articles = [wechat.build_news_article(payload) for payload in payloads]
+        media_id = wechat.upload_news(news_articles)
+        if not media_id:
+            failed_ids.extend(schedule.id for schedule in ready)
+
+    if failed_ids:
+        PublishSchedule.query.filter(
+            PublishSchedule.id.in_(failed_ids),
+            PublishSchedule.status == 'pending'
+        ).update({'stage_status': 'failed'}, synchronize_session=False)
+        stats['failed'] += len(failed_ids)
+
+    if media_id:
+        staged_at = datetime.now()
+        for index, schedule in enumerate(ready, start=1):
+            stats['staged'] += PublishSchedule.query.filter(
+                PublishSchedule.id == schedule.id,
+                PublishSchedule.status == 'pending'
+            ).update({
+                'staged_media_id': media_id,
+                'stage_index': index,
+                'stage_status': 'staged',
+                'staged_at': staged_at
+            }, synchronize_session=False)
+        stats['messages'] += 1
+    db.session.commit()
+
+
+def _render_article(article: Article):
+    """生成文章的HTML内容和封面图（已有的不重新生成）"""
+    if not article.html_content:
+        from services.markdown_converter import MarkdownToWeChatHTML
+        article.html_content = MarkdownToWeChatHTML().convert(article.markdown_content or article.content)
+
+    if not article.cover_image:
+        from services.image_service import ImageService
+        article.cover_image = ImageService().generate_cover_image(article.title)
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import re
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from flask import current_app, has_app_context
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from config import Config
+from models import db, CrawledItem
+from services.near_duplicate import NearDuplicateIndex, signature_columns
+
+logger = logging.getLogger(__name__)
+
+# 不影响页面内容的跟踪参数
+TRACKING_PARAMS = {
+    'spm', 'from', 'source', 'ref', 'share', 'share_token', 'isappinstalled', 'scene', 'clicktime',
+    'enterid', 'sessionid', 'subscene', 'chksm', 'gclid', 'fbclid', 'utm_source', 'utm_medium',
+    'utm_campaign', 'utm_term', 'utm_content'
+}
+# 微信文章长链接中标识文章的参数，其余参数都与分享来源有关
+WECHAT_ARTICLE_PARAMS = {'__biz', 'mid', 'idx', 'sn'}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """规范化URL：统一为https、小写主机名、去掉默认端口、锚点、末尾斜杠和跟踪参数，参数排序"""
+    parsed = urlsplit((url or '').strip())
+    scheme = (parsed.scheme or 'http').lower()
+    host = (parsed.hostname or '').lower()
+    port = parsed.port
+    netloc = host if not port or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    if scheme == 'http':
+        scheme = 'https'
+
+    path = re.sub(r'/{2,}', '/', parsed.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    params = parse_qsl(parsed.query, keep_blank_values=True)
+    if host == 'mp.weixin.qq.com' and path == '/s':
+        params = [(key, value) for key, value in params if key in WECHAT_ARTICLE_PARAMS]
+    elif host == 'zhihu.com' or host.endswith('.zhihu.com'):
+        params = []
+    else:
+        params = [(key, value) for key, value in params
+                  if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')]
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(params)), ''))
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+
+def content_fingerprint(text: str) -> str:
+    """正文指纹：忽略空白差异"""
+    normalized = re.sub(r'\s+', ' ', text or '').strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class CrawlState:
+    """增量爬取状态：已爬取的URL（规范化后）和正文指纹
+
+    爬虫在请求前用 unseen 过滤掉已爬取的链接；爬取完成后 filter_unchanged
+    跳过正文与已处理内容相同或相近的文章（不同来源转载的同一篇），只有新内容进入改写。
+    保存后调用 record 记录。爬虫的工作线程中没有应用上下文，查询时自动进入。
+    """
+
+    def __init__(self, app=None, near_duplicates: Optional[NearDuplicateIndex] = None):
+        self.app = app or current_app._get_current_object()
+        if near_duplicates is None and Config.CRAWLER_DEDUP_ENABLED:
+            near_duplicates = NearDuplicateIndex(Config.CRAWLER_DEDUP_DISTANCE)
+        self.near_duplicates = near_duplicates
+        self.skipped_urls = 0
+        self._lock = threading.Lock()
+
+    def _context(self):
+        return nullcontext() if has_app_context() else self.app.app_context()
+
+    def unseen(self, urls: List[str]) -> List[str]:
+        """返回没有爬取过的URL（保持顺序，规范化后相同的只保留第一个）"""
+        hashes: Dict[str, str] = {}
+        for url in urls:
+            if url:
+                hashes.setdefault(url_hash(url), url)
+        if not hashes:
+            return []
+
+        try:
+            with self._context():
+                seen = {
+                    row[0] for row in db.session.query(CrawledItem.url_hash).filter(
+                        CrawledItem.url_hash.in_(list(hashes))
+                    ).all()
+                }
+        except SQLAlchemyError as e:
+            logger.warning(f"查询爬取记录失败，按未爬取处理: {str(e)}")
+            seen = set()
+
+        if seen:
+            with self._lock:
+                self.skipped_urls += len(seen)
+            logger.info(f"跳过已爬取的链接 {len(seen)} 个")
+        return [url for digest, url in hashes.items() if digest not in seen]
+
+    def filter_unchanged(self, articles: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """拆分为 (新内容, 已处理过的内容)，给每篇文章加上 content_hash（开启近似重复检测时还有 simhash）
+
+        先按正文指纹精确比较，剩下的再用 SimHash 查找近似重复。
+        """
+        for article in articles:
+            article['content_hash'] = content_fingerprint(article.get('content', ''))
+
+        digests = list({article['content_hash'] for article in articles})
+        known: Dict[str, Optional[int]] = {}
+        if digests:
+            try:
+                with self._context():
+                    for content_hash, article_id in db.session.query(
+                        CrawledItem.content_hash, CrawledItem.article_id
+                    ).filter(CrawledItem.content_hash.in_(digests)).all():
+                        known.setdefault(content_hash, article_id)
+            except SQLAlchemyError as e:
+                logger.warning(f"查询正文指纹失败，按新内容处理: {str(e)}")
+
+        fresh, unchanged, batch = [], [], set()
+        for article in articles:
+            digest = article['content_hash']
+            if digest in known:
+                article['article_id'] = known[digest]
+                unchanged.append(article)
+            elif digest in batch:
+                # 同一批中重复的内容只处理一次
+                unchanged.append(article)
+            else:
+                batch.add(digest)
+                fresh.append(article)
+        if unchanged:
+            logger.info(f"跳过内容未变化的文章 {len(unchanged)} 篇")
+
+        if self.near_duplicates and fresh:
+            with self._context():
+                fresh, similar = self.near_duplicates.filter(fresh)
+            unchanged.extend(similar)
+        return fresh, unchanged
+
+    def record(self, articles: List[Dict]):
+        """记录已处理的文章（source_url、content_hash、simhash，已保存的带 article_id）"""
+        now = datetime.utcnow()
+        try:
+            with self._context():
+                for article in articles:
+                    url = article.get('source_url')
+                    if not url:
+                        continue
+                    values = {
+                        'content_hash': article.get('content_hash'),
+                        'source_type': article.get('source_type'),
+                        'last_seen_at': now,
+                        **signature_columns(article.get('simhash'))
+                    }
+                    if article.get('article_id'):
+                        values['article_id'] = article['article_id']
+                    digest = url_hash(url)
+                    updated = CrawledItem.query.filter_by(url_hash=digest).update(values, synchronize_session=False)
+                    if not updated:
+                        try:
+                            with db.session.begin_nested():
+                                db.session.add(CrawledItem(
+                                    url=url,
+                                    canonical_url=canonicalize_url(url),
+                                    url_hash=digest,
+                                    first_seen_at=now,
+                                    **values
+                                ))
+                        except IntegrityError:
+                            CrawledItem.query.filter_by(url_hash=digest).update(values, synchronize_session=False)
+                db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning(f"写入爬取记录失败: {str(e)}")
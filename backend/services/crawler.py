@@ -1,60 +1,167 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import re
-import time
-import json
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import logging
 from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
-from datetime import datetime, timedelta
+from datetime import datetime
+from config import Config
+from services.feed_cache import FeedCache
+from services.http_cache import CachingAdapter, HTTPCache
+from utils.html_soup import HTML_PARSER, SubtreeStrainer, make_soup
+from utils.http_body import detect_encoding, read_limited
+from utils.rate_limiter import HostRateLimiter
 
 logger = logging.getLogger(__name__)
 
+# 页面中没有声明feed时依次探测的常见路径
+FEED_PATHS = ['/rss', '/feed', '/rss.xml', '/feed.xml', '/atom.xml', '/index.xml']
+
+# 各类页面只解析用到的部分（标题、正文、元信息所在的子树）
+WECHAT_ARTICLE_STRAINER = SubtreeStrainer(
+    classes=['rich_media_title', 'rich_media_content', 'rich_media_meta_text'],
+    ids=['publish_time']
+)
+PAGE_STRAINER = SubtreeStrainer(
+    tags=['title', 'h1', 'article'],
+    classes=['title', 'post-title', 'entry-title', 'article-title', 'content', 'post-content',
+             'entry-content', 'article-content', 'main-content', 'post-body', 'entry']
+)
+ZHIHU_AUTHOR_STRAINER = SubtreeStrainer(
+    tags=['a'],
+    classes=['ProfileHeader-name', 'AuthorInfo-name', 'UserHeader-name', 'Profile-name']
+)
+ZHIHU_CONTENT_STRAINER = SubtreeStrainer(
+    tags=['h1'],
+    classes=['Post-Title', 'QuestionHeader-title', 'Post-RichText', 'RichText', 'RichContent-inner']
+)
+FEED_LINK_STRAINER = SubtreeStrainer(tags=['link'])
+
+# <link rel="alternate"> 中表示feed的类型
+FEED_CONTENT_TYPES = {'application/rss+xml', 'application/atom+xml', 'application/rdf+xml'}
+
 class ArticleCrawler:
-    def __init__(self):
+    def __init__(self, max_workers: int = None, crawl_state=None):
+        self.max_workers = max_workers or Config.CRAWLER_MAX_WORKERS
+        self.max_body_bytes = int(Config.CRAWLER_MAX_BODY_MB * 1024 * 1024)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        # crawl_sources 每个源一个线程，源内再按页面（或feed探测路径）并发，
+        # 同一主机最多有 外层 × 内层 个线程同时请求，连接池按此大小设置，避免连接被丢弃重建
+        inner_workers = max(self.max_workers, len(FEED_PATHS))
+        pool_options = {'pool_connections': self.max_workers, 'pool_maxsize': self.max_workers * inner_workers}
+        # 条件请求缓存：内容没变的页面服务器返回304，正文从本地读取
+        self.http_cache = None
+        if Config.CRAWLER_CACHE_ENABLED:
+            self.http_cache = HTTPCache(Config.CRAWLER_CACHE_PATH, max_bytes=Config.CRAWLER_CACHE_MAX_MB * 1024 * 1024)
+            adapter = CachingAdapter(self.http_cache, **pool_options)
+        else:
+            adapter = HTTPAdapter(**pool_options)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.feed_cache = FeedCache(
+            Config.CRAWLER_CACHE_PATH,
+            ttl=Config.CRAWLER_FEED_TTL,
+            negative_ttl=Config.CRAWLER_NO_FEED_TTL
+        )
+        # 解析器后端和是否只解析需要的子树（压测时可在实例上切换）
+        self.html_parser = HTML_PARSER
+        self.partial_parsing = Config.CRAWLER_PARTIAL_PARSING
+        # 每个主机一个令牌桶，替代原来全局的 time.sleep
+        self.rate_limiter = HostRateLimiter(
+            Config.CRAWLER_HOST_INTERVAL,
+            Config.CRAWLER_HOST_INTERVALS
+        )
+        # 增量爬取：传入 CrawlState 时跳过已经爬取过的链接
+        self.crawl_state = crawl_state
+    
+    def _fetch(self, url: str, **kwargs) -> requests.Response:
+        """按主机限速后发起GET请求"""
+        waited = self.rate_limiter.acquire(url)
+        if waited:
+            logger.debug(f"限速等待 {waited:.2f}s: {url}")
+        return self._get(url, **kwargs)
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """流式下载，正文超过 max_body_bytes 或不是文本内容时抛出 CrawlerError
+
+        下载完成后 response.content / response.text 照常可用，编码按响应头、页面声明和内容检测确定。
+        流式的200响应不会被缓存适配器自动保存，读完正文后在这里写入HTTP缓存。
+        """
+        kwargs.setdefault('timeout', Config.CRAWLER_TIMEOUT)
+        response = self.session.get(url, stream=True, **kwargs)
+        if not getattr(response, 'from_cache', False):
+            body = read_limited(response, self.max_body_bytes)
+            if self.http_cache and response.status_code == 200:
+                self.http_cache.store(response.url, response.headers, body)
+        response.encoding = detect_encoding(response.headers, response.content)
+        return response
+    
+    def _new_urls(self, urls: List[str]) -> List[str]:
+        """去掉已爬取过的链接（没有开启增量爬取时原样返回）"""
+        if not self.crawl_state:
+            return urls
+        return self.crawl_state.unseen(urls)
+    
+    def _soup(self, markup, strainer: Optional[SubtreeStrainer] = None):
+        """构建文档树，开启部分解析时只保留 strainer 匹配的子树"""
+        return make_soup(markup, strainer if self.partial_parsing else None, parser=self.html_parser)
+    
+    def _map_concurrent(self, func: Callable, items: List) -> List:
+        """并发执行 func(item)，按输入顺序返回非空结果"""
+        if not items:
+            return []
+        
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(func, items))
+        
+        return [result for result in results if result]
     
     def crawl_wechat_article(self, url: str) -> Dict:
         """爬取微信公众号文章"""
         try:
-            response = self.session.get(url, timeout=30)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 提取文章标题
-            title = soup.find('h1', class_='rich_media_title')
-            title = title.text.strip() if title else ''
-            
-            # 提取文章内容
-            content_div = soup.find('div', class_='rich_media_content')
-            if not content_div:
-                return None
-            
-            # 提取文本内容
-            content = self._extract_text(content_div)
-            
-            # 提取图片
-            images = self._extract_images(content_div)
-            
-            # 提取作者和时间
-            meta_info = self._extract_meta(soup)
-            
-            return {
-                'title': title,
-                'content': content,
-                'images': images,
-                'source_url': url,
-                'meta': meta_info
-            }
+            response = self._fetch(url)
+            return self._parse_wechat_article(response.text, url)
             
         except Exception as e:
             logger.error(f"爬取文章失败: {str(e)}")
             return None
     
+    def _parse_wechat_article(self, html: str, url: str) -> Optional[Dict]:
+        """从微信文章页面中提取标题、正文、图片和元信息"""
+        soup = self._soup(html, WECHAT_ARTICLE_STRAINER)
+        
+        # 提取文章标题
+        title = soup.find('h1', class_='rich_media_title')
+        title = title.text.strip() if title else ''
+        
+        # 提取文章内容
+        content_div = soup.find('div', class_='rich_media_content')
+        if not content_div:
+            return None
+        
+        # 提取文本内容
+        content = self._extract_text(content_div)
+        
+        # 提取图片
+        images = self._extract_images(content_div)
+        
+        # 提取作者和时间
+        meta_info = self._extract_meta(soup)
+        
+        return {
+            'title': title,
+            'content': content,
+            'images': images,
+            'source_url': url,
+            'meta': meta_info
+        }
+    
     def _extract_text(self, content_div) -> str:
         """提取纯文本内容"""
         # 移除script和style标签
@@ -95,13 +202,21 @@ class ArticleCrawler:
         return meta
     
     def crawl_multiple(self, urls: List[str]) -> List[Dict]:
-        """批量爬取文章"""
+        """批量爬取文章（同一主机按令牌桶限速，不同主机并行）"""
+        return self._map_concurrent(self.crawl_wechat_article, self._new_urls(urls))
+    
+    def crawl_sources(self, sources: List[Dict]) -> List[Dict]:
+        """并发爬取多个源，每个源格式: {'url': ..., 'type': 'auto', 'max_count': 5}"""
+        def crawl_source(source):
+            return self.crawl(
+                source.get('url', ''),
+                source.get('type', 'auto'),
+                source.get('max_count', 5)
+            )
+        
         articles = []
-        for url in urls:
-            article = self.crawl_wechat_article(url)
-            if article:
-                articles.append(article)
-            time.sleep(2)  # 避免频率过高
+        for source_articles in self._map_concurrent(crawl_source, sources):
+            articles.extend(source_articles)
         return articles
     
     def crawl_website(self, website_url: str, max_articles: int = 5) -> List[Dict]:
@@ -109,7 +224,7 @@ class ArticleCrawler:
         try:
             # 首先尝试RSS/Atom feeds
             rss_articles = self._crawl_rss_feed(website_url, max_articles)
-            if rss_articles:
+            if rss_articles is not None:
                 return rss_articles
             
             # 如果没有RSS，尝试解析网站内容
@@ -119,28 +234,98 @@ class ArticleCrawler:
             logger.error(f"爬取网站失败: {str(e)}")
             return []
     
-    def _crawl_rss_feed(self, website_url: str, max_articles: int) -> List[Dict]:
-        """尝试从RSS/Atom feed爬取"""
-        # 常见的RSS路径
-        rss_paths = ['/rss', '/feed', '/rss.xml', '/feed.xml', '/atom.xml', '/index.xml']
+    def _crawl_rss_feed(self, website_url: str, max_articles: int) -> Optional[List[Dict]]:
+        """尝试从RSS/Atom feed爬取，没有可用的feed时返回None（feed中没有新条目时返回空列表）"""
+        site = self._site_of(website_url)
+        feed_url = self._discover_feed(website_url)
+        if not feed_url:
+            return None
+        
+        try:
+            response = self._fetch(feed_url)
+            response.raise_for_status()
+            feed = feedparser.parse(response.content)
+        except Exception as e:
+            logger.warning(f"读取feed {feed_url} 失败: {str(e)}")
+            feed = None
+        
+        if not feed or not feed.entries:
+            # 地址失效，下次重新发现
+            self.feed_cache.forget(site)
+            return None
+        
+        entries = feed.entries
+        if self.crawl_state:
+            new_links = set(self._new_urls([getattr(entry, 'link', '') for entry in entries]))
+            entries = [entry for entry in entries if getattr(entry, 'link', '') in new_links]
+        
+        articles = []
+        for entry in entries[:max_articles]:
+            article = self._parse_rss_entry(entry)
+            if article:
+                articles.append(article)
+        if entries and not articles:
+            return None
+        return articles
+    
+    def _site_of(self, url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+    
+    def _discover_feed(self, website_url: str) -> Optional[str]:
+        """查找网站的feed地址：先读页面中的 <link rel="alternate">，再并发探测常见路径
+
+        结果（包括没有feed）按站点缓存，有效期内不再探测。
+        """
+        site = self._site_of(website_url)
+        hit, feed_url = self.feed_cache.get(site)
+        if hit:
+            return feed_url
+        
+        feed_url = self._find_feed_link(website_url) or self._probe_feed_paths(website_url)
+        self.feed_cache.set(site, feed_url)
+        if feed_url:
+            logger.info(f"发现feed: {feed_url}")
+        else:
+            logger.info(f"{site} 没有RSS/Atom feed，使用页面解析")
+        return feed_url
+    
+    def _find_feed_link(self, website_url: str) -> Optional[str]:
+        """页面 <head> 中声明的feed地址"""
+        try:
+            response = self._fetch(website_url)
+            response.raise_for_status()
+        except Exception as e:
+            logger.debug(f"读取页面 {website_url} 失败: {str(e)}")
+            return None
+        
+        soup = make_soup(response.content, FEED_LINK_STRAINER, parser=self.html_parser)
+        for link in soup.find_all('link', href=True):
+            rel = [value.lower() for value in (link.get('rel') or [])]
+            if 'alternate' in rel and (link.get('type') or '').lower() in FEED_CONTENT_TYPES:
+                return urljoin(response.url, link['href'])
+        return None
+    
+    def _probe_feed_paths(self, website_url: str) -> Optional[str]:
+        """并发请求常见的feed路径，按 FEED_PATHS 的顺序返回第一个有效的地址
+
+        只在发现时执行（结果有缓存），不经过按主机的限速。
+        """
+        candidates = [urljoin(website_url, path) for path in FEED_PATHS]
         
-        for path in rss_paths:
+        def probe(url):
             try:
-                rss_url = urljoin(website_url, path)
-                feed = feedparser.parse(rss_url)
-                
-                if feed.entries:
-                    articles = []
-                    for entry in feed.entries[:max_articles]:
-                        article = self._parse_rss_entry(entry)
-                        if article:
-                            articles.append(article)
-                    return articles
+                response = self._get(url, timeout=Config.CRAWLER_FEED_PROBE_TIMEOUT)
+                if response.status_code != 200:
+                    return None
+                return url if feedparser.parse(response.content).entries else None
             except Exception as e:
-                logger.debug(f"RSS路径 {path} 失败: {str(e)}")
-                continue
+                logger.debug(f"探测feed {url} 失败: {str(e)}")
+                return None
         
-        return []
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            results = list(executor.map(probe, candidates))
+        return next((url for url in results if url), None)
     
     def _parse_rss_entry(self, entry) -> Optional[Dict]:
         """解析RSS条目"""
@@ -158,8 +343,7 @@ class ArticleCrawler:
             
             # 清理HTML标签
             if content:
-                soup = BeautifulSoup(content, 'html.parser')
-                content = soup.get_text().strip()
+                content = self._soup(content).get_text().strip()
             
             return {
                 'title': title,
@@ -179,21 +363,16 @@ class ArticleCrawler:
     def _crawl_website_content(self, website_url: str, max_articles: int) -> List[Dict]:
         """爬取网站内容页面"""
         try:
-            response = self.session.get(website_url, timeout=30)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = self._fetch(website_url)
+            # 链接选择器依赖上下文（如 article a），需要完整的文档树
+            soup = self._soup(response.text)
             
             # 查找文章链接 - 常见的文章链接模式
             article_links = self._find_article_links(soup, website_url)
             
-            articles = []
-            for link in article_links[:max_articles]:
-                article = self._crawl_single_page(link)
-                if article:
-                    articles.append(article)
-                time.sleep(1)  # 避免频率过高
+            article_links = self._new_urls(article_links)
             
-            return articles
+            return self._map_concurrent(self._crawl_single_page, article_links[:max_articles])
             
         except Exception as e:
             logger.error(f"爬取网站内容失败: {str(e)}")
@@ -253,33 +432,42 @@ class ArticleCrawler:
     def _crawl_single_page(self, url: str) -> Optional[Dict]:
         """爬取单个页面内容"""
         try:
-            response = self.session.get(url, timeout=30)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 提取标题
-            title = self._extract_title(soup)
-            
-            # 提取正文内容
-            content = self._extract_article_content(soup)
-            
-            if not title or not content or len(content) < 100:
-                return None
-            
-            return {
-                'title': title,
-                'content': content,
-                'source_url': url,
-                'source_type': 'website',
-                'meta': {
-                    'crawled_time': datetime.now().isoformat()
-                }
-            }
+            response = self._fetch(url)
+            return self._parse_single_page(response.text, url)
             
         except Exception as e:
             logger.error(f"爬取页面 {url} 失败: {str(e)}")
             return None
     
+    def _parse_single_page(self, html: str, url: str) -> Optional[Dict]:
+        """从普通网页中提取标题和正文"""
+        soup = self._soup(html, PAGE_STRAINER)
+        
+        # 提取标题
+        title = self._extract_title(soup)
+        
+        # 提取正文内容
+        content = self._extract_article_content(soup)
+        
+        # 常见的正文容器都没有时要退回到 <body>，需要完整解析
+        if self.partial_parsing and len(content) < 100:
+            soup = self._soup(html)
+            title = self._extract_title(soup)
+            content = self._extract_article_content(soup)
+        
+        if not title or not content or len(content) < 100:
+            return None
+        
+        return {
+            'title': title,
+            'content': content,
+            'source_url': url,
+            'source_type': 'website',
+            'meta': {
+                'crawled_time': datetime.now().isoformat()
+            }
+        }
+    
     def _extract_title(self, soup) -> str:
         """提取文章标题"""
         # 尝试多种标题提取方式
@@ -354,28 +542,25 @@ class ArticleCrawler:
             }
             
             # 从用户主页获取文章和回答
-            response = self.session.get(author_url, headers=headers, timeout=30)
+            response = self._fetch(author_url, headers=headers)
             
             if response.status_code != 200:
                 logger.error(f"知乎请求失败，状态码: {response.status_code}")
                 return []
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = self._soup(response.text, ZHIHU_AUTHOR_STRAINER)
             
             # 提取用户名
             author_name = self._extract_zhihu_author_name(soup)
             
             # 查找文章和回答链接
-            content_links = self._find_zhihu_content_links(soup, author_url)
-            
-            articles = []
-            for link in content_links[:max_articles]:
-                article = self._crawl_zhihu_content(link, author_name)
-                if article:
-                    articles.append(article)
-                time.sleep(2)  # 知乎限制较严格，间隔久一点
+            content_links = self._new_urls(self._find_zhihu_content_links(soup, author_url))
             
-            return articles
+            # 知乎限制较严格，限速间隔在 Config.CRAWLER_HOST_INTERVALS 中单独配置
+            return self._map_concurrent(
+                lambda link: self._crawl_zhihu_content(link, author_name),
+                content_links[:max_articles]
+            )
             
         except Exception as e:
             logger.error(f"爬取知乎答主内容失败: {str(e)}")
@@ -434,40 +619,44 @@ class ArticleCrawler:
                 'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
             }
             
-            response = self.session.get(url, headers=headers, timeout=30)
+            response = self._fetch(url, headers=headers)
             
             if response.status_code != 200:
                 return None
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 提取标题
-            title = self._extract_zhihu_title(soup, url)
-            
-            # 提取内容
-            content = self._extract_zhihu_content_text(soup, url)
-            
-            if not title or not content or len(content) < 50:
-                return None
-            
-            content_type = "文章" if "/p/" in url else "回答"
-            
-            return {
-                'title': title,
-                'content': content,
-                'source_url': url,
-                'source_type': 'zhihu',
-                'meta': {
-                    'author': author_name,
-                    'content_type': content_type,
-                    'crawled_time': datetime.now().isoformat()
-                }
-            }
+            return self._parse_zhihu_content(response.text, url, author_name)
             
         except Exception as e:
             logger.error(f"爬取知乎内容 {url} 失败: {str(e)}")
             return None
     
+    def _parse_zhihu_content(self, html: str, url: str, author_name: str) -> Optional[Dict]:
+        """从知乎文章或回答页面中提取标题和正文"""
+        soup = self._soup(html, ZHIHU_CONTENT_STRAINER)
+        
+        # 提取标题
+        title = self._extract_zhihu_title(soup, url)
+        
+        # 提取内容
+        content = self._extract_zhihu_content_text(soup, url)
+        
+        if not title or not content or len(content) < 50:
+            return None
+        
+        content_type = "文章" if "/p/" in url else "回答"
+        
+        return {
+            'title': title,
+            'content': content,
+            'source_url': url,
+            'source_type': 'zhihu',
+            'meta': {
+                'author': author_name,
+                'content_type': content_type,
+                'crawled_time': datetime.now().isoformat()
+            }
+        }
+    
     def _extract_zhihu_title(self, soup, url: str) -> str:
         """提取知乎标题"""
         try:
@@ -505,6 +694,8 @@ class ArticleCrawler:
                 source_type = self._detect_source_type(source_url)
             
             if source_type == 'wechat':
+                if not self._new_urls([source_url]):
+                    return []
                 article = self.crawl_wechat_article(source_url)
                 return [article] if article else []
             elif source_type == 'zhihu':
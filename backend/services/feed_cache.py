@@ -0,0 +1,66 @@
+import logging
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class FeedCache(SQLiteStore):
+    """网站的RSS/Atom地址发现结果缓存（SQLite文件，gunicorn多个worker共享）
+
+    以站点（scheme://host）为键，保存发现的feed地址；没有feed也缓存（地址为空），
+    避免每次爬取都重新探测。两种结果分别有各自的有效期。
+    """
+
+    def __init__(self, path: str, ttl: int = 7 * 24 * 3600, negative_ttl: int = 24 * 3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS feed_urls (
+                site TEXT PRIMARY KEY,
+                feed_url TEXT,
+                checked_at REAL NOT NULL
+            )
+        """)
+
+    def get(self, site: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否命中, feed地址)，命中且地址为空表示该站点没有feed"""
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT feed_url, checked_at FROM feed_urls WHERE site = ?', (site,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取feed缓存失败: {str(e)}")
+            return False, None
+        if not row:
+            return False, None
+        feed_url, checked_at = row
+        ttl = self.ttl if feed_url else self.negative_ttl
+        if checked_at <= time.time() - ttl:
+            return False, None
+        return True, feed_url
+
+    def set(self, site: str, feed_url: Optional[str]):
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO feed_urls (site, feed_url, checked_at) VALUES (?, ?, ?)',
+                    (site, feed_url, time.time())
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"写入feed缓存失败: {str(e)}")
+
+    def forget(self, site: str):
+        """feed失效（地址不再可用）时删除，下次重新发现"""
+        try:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM feed_urls WHERE site = ?', (site,))
+        except sqlite3.Error as e:
+            logger.warning(f"删除feed缓存失败: {str(e)}")
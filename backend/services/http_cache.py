@@ -0,0 +1,229 @@
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# 缓存的是解码后的正文，这些与传输相关的响应头不能原样返回
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+
+# 单个响应超过总容量的这个比例就不缓存，避免一个大页面挤掉其他条目
+MAX_ENTRY_FRACTION = 0.05
+
+
+class HTTPCache(SQLiteStore):
+    """爬虫HTTP响应缓存（SQLite文件，gunicorn多个worker共享）
+
+    只缓存带 ETag 或 Last-Modified 的 GET 响应，以URL为键。再次请求时带上
+    If-None-Match / If-Modified-Since，服务器返回304时直接使用本地保存的正文。
+    正文总大小超过上限时按最近访问时间淘汰（LRU）。命中统计由 SQLiteStore 在进程内累加后定期写入。
+    """
+
+    STATS_TABLE = 'http_cache_stats'
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * MAX_ENTRY_FRACTION)
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_http_responses_accessed_at '
+            'ON http_responses (accessed_at)'
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.executemany(
+            'INSERT OR IGNORE INTO http_cache_stats (name, value) VALUES (?, 0)',
+            [('hits',), ('misses',), ('evictions',), ('bytes_saved',)]
+        )
+
+    def validators(self, url: str) -> Optional[Dict]:
+        """已缓存响应的 ETag / Last-Modified"""
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT etag, last_modified FROM http_responses WHERE url = ?', (url,)
+                ).fetchone()
+            if row:
+                return {'etag': row[0], 'last_modified': row[1]}
+            return None
+        except sqlite3.Error as e:
+            logger.warning(f"读取HTTP缓存失败: {str(e)}")
+            return None
+
+    def revalidated(self, url: str, headers: Dict) -> Optional[Dict]:
+        """服务器返回304：合并新的响应头，刷新访问时间并返回缓存的响应"""
+        try:
+            now = time.time()
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT headers, body, etag, last_modified FROM http_responses WHERE url = ?', (url,)
+                ).fetchone()
+                if not row:
+                    return None
+                stored_headers = json.loads(row[0])
+                stored_headers.update(self._storable_headers(headers))
+                conn.execute(
+                    'UPDATE http_responses SET headers = ?, etag = ?, last_modified = ?, accessed_at = ? '
+                    'WHERE url = ?',
+                    (
+                        json.dumps(stored_headers),
+                        headers.get('ETag') or row[2],
+                        headers.get('Last-Modified') or row[3],
+                        now,
+                        url
+                    )
+                )
+            self._count('hits')
+            self._count('bytes_saved', len(row[1]))
+            return {'headers': stored_headers, 'body': row[1]}
+        except sqlite3.Error as e:
+            logger.warning(f"读取HTTP缓存失败: {str(e)}")
+            return None
+
+    def store(self, url: str, headers: Dict, body: bytes):
+        """保存带校验信息的200响应，没有 ETag / Last-Modified 的不缓存"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        try:
+            self._count('misses')
+            with self._connection() as conn:
+                if not (etag or last_modified) or len(body) > self.max_entry_bytes:
+                    conn.execute('DELETE FROM http_responses WHERE url = ?', (url,))
+                    return
+                now = time.time()
+                conn.execute(
+                    'INSERT OR REPLACE INTO http_responses '
+                    '(url, etag, last_modified, headers, body, size, stored_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (url, etag, last_modified, json.dumps(self._storable_headers(headers)),
+                     sqlite3.Binary(body), len(body), now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"写入HTTP缓存失败: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM http_responses').fetchone()[0]
+        overflow = total - self.max_bytes
+        if overflow <= 0:
+            return
+        evicted = []
+        for url, size in conn.execute('SELECT url, size FROM http_responses ORDER BY accessed_at ASC'):
+            evicted.append((url,))
+            overflow -= size
+            if overflow <= 0:
+                break
+        conn.executemany('DELETE FROM http_responses WHERE url = ?', evicted)
+        conn.execute("UPDATE http_cache_stats SET value = value + ? WHERE name = 'evictions'", (len(evicted),))
+
+    @staticmethod
+    def _storable_headers(headers: Dict) -> Dict:
+        return {name: value for name, value in headers.items() if name.lower() not in SKIPPED_HEADERS}
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        self.flush()
+        with self._connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM http_cache_stats').fetchall())
+            entries, size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_responses'
+            ).fetchone()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / total, 3) if total else 0,
+            'bytes_saved': counters.get('bytes_saved', 0),
+            'entries': entries,
+            'size': size,
+            'max_bytes': self.max_bytes
+        }
+
+
+class CachingAdapter(HTTPAdapter):
+    """带条件请求的连接适配器，挂载到 requests.Session 上对调用方透明
+
+    304 响应转换成正文来自缓存的200响应（response.from_cache 为 True）。
+    流式请求（stream=True）的200响应不在这里保存，由调用方读完正文后调用 cache.store。
+    """
+
+    def __init__(self, cache: HTTPCache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, stream=stream, **kwargs)
+
+        validators = None
+        if not ('If-None-Match' in request.headers or 'If-Modified-Since' in request.headers):
+            validators = self.cache.validators(request.url)
+        if validators:
+            unconditional = request.copy()
+            if validators['etag']:
+                request.headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                request.headers['If-Modified-Since'] = validators['last_modified']
+
+        response = super().send(request, stream=stream, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and validators:
+            cached = self.cache.revalidated(request.url, response.headers)
+            # 读完空的304正文，连接放回连接池
+            response.content
+            response.close()
+            if cached:
+                return self._cached_response(request, response, cached)
+            # 条目在查询校验信息之后被淘汰了：不带条件头重新请求一次，而不是把304交给调用方
+            logger.info(f"HTTP缓存条目已被淘汰，重新请求: {request.url}")
+            response = super().send(unconditional, stream=stream, **kwargs)
+            response.from_cache = False
+
+        if response.status_code == 200 and not stream:
+            self.cache.store(request.url, response.headers, response.content)
+        return response
+
+    def _cached_response(self, request, not_modified: requests.Response, cached: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(cached['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = not_modified.url
+        response.request = request
+        response.connection = self
+        response._content = bytes(cached['body'])
+        response._content_consumed = True
+        response.from_cache = True
+        return response
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from services.media_cache import MediaCache, content_hash
+from utils.exceptions import ContentTooLargeError
+from utils.http_body import read_limited
+
+logger = logging.getLogger(__name__)
+
+# <img ... src="..."> 中的 src，分组: 前缀, 引号, 地址
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+
+# 微信图文内图片只支持jpg/png，大小1MB以内
+ALLOWED_CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/png': '.png'}
+MAX_IMAGE_BYTES = 1024 * 1024
+
+# 已经在微信服务器上的图片不需要转存
+WECHAT_IMAGE_HOSTS = ('qpic.cn', 'qlogo.cn')
+
+
+class ImageRehoster:
+    """把正文中的外链图片转存到微信（media/uploadimg），并替换 src
+
+    下载和上传分两轮并发执行，中间按内容哈希查询已上传的图片；
+    数据库读写都在调用线程中完成，工作线程只做网络请求。
+    转存失败的图片保留原地址。
+    """
+
+    def __init__(self, wechat, max_workers: int = None):
+        self.wechat = wechat
+        self.max_workers = max_workers or Config.WECHAT_IMAGE_CONCURRENCY
+        self.media_cache = MediaCache()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def rehost(self, html: str) -> str:
+        """转存HTML中的全部外链图片，返回替换后的HTML"""
+        return self.rehost_many([html])[0]
+
+    def rehost_many(self, htmls: List[str]) -> List[str]:
+        """多篇文章的图片一起转存（同一条图文消息的文章共用一轮并发）"""
+        sources = []
+        for html in htmls:
+            for match in IMG_SRC_PATTERN.finditer(html or ''):
+                src = match.group(3).strip()
+                if self._needs_rehost(src) and src not in sources:
+                    sources.append(src)
+        if not sources:
+            return htmls
+
+        # 1. 并发下载
+        downloads = dict(zip(sources, self._map_concurrent(self._download, sources)))
+
+        # 2. 已上传过的图片直接复用
+        digests = {src: content_hash(image['content']) for src, image in downloads.items() if image}
+        cached = self.media_cache.get_many(list(set(digests.values())), 'uploadimg')
+        hosted = {src: cached[digest].url for src, digest in digests.items() if digest in cached}
+        reused = len(hosted)
+
+        # 3. 并发上传其余图片（相同内容只上传一次）
+        pending = {}
+        for src, digest in digests.items():
+            if src not in hosted:
+                pending.setdefault(digest, src)
+        uploads = self._map_concurrent(lambda src: self._upload(downloads[src]), list(pending.values()))
+        uploaded = dict(zip(pending.keys(), uploads))
+        for digest, url in uploaded.items():
+            if url:
+                self.media_cache.put(digest, 'uploadimg', url=url, size=len(downloads[pending[digest]]['content']))
+        for src, digest in digests.items():
+            if src not in hosted and uploaded.get(digest):
+                hosted[src] = uploaded[digest]
+
+        logger.info(
+            f"正文图片转存: 共{len(sources)}张, 复用{reused}张, "
+            f"上传{sum(1 for url in uploaded.values() if url)}张, 失败{len(sources) - len(hosted)}张"
+        )
+
+        # 4. 一次替换全部 src
+        def replace(match):
+            src = match.group(3).strip()
+            if src in hosted:
+                return f"{match.group(1)}{match.group(2)}{hosted[src]}{match.group(2)}"
+            return match.group(0)
+
+        return [IMG_SRC_PATTERN.sub(replace, html) if html else html for html in htmls]
+
+    def _needs_rehost(self, src: str) -> bool:
+        parsed = urlparse(src)
+        if parsed.scheme not in ('http', 'https'):
+            return False
+        return not (parsed.hostname or '').endswith(WECHAT_IMAGE_HOSTS)
+
+    def _map_concurrent(self, func: Callable, items: List) -> List:
+        """并发执行 func(item)，按输入顺序返回结果"""
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def _download(self, src: str) -> Optional[Dict]:
+        try:
+            # 流式读取，格式不对或超过1MB的在读完正文之前就放弃
+            with self.session.get(unescape(src), timeout=Config.CRAWLER_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                extension = ALLOWED_CONTENT_TYPES.get(content_type)
+                if not extension:
+                    logger.warning(f"图片格式不支持({content_type})，保留原地址: {src}")
+                    return None
+                try:
+                    content = read_limited(response, MAX_IMAGE_BYTES, text_only=False)
+                except ContentTooLargeError:
+                    logger.warning(f"图片超过1MB，保留原地址: {src}")
+                    return None
+
+            name = os.path.basename(urlparse(src).path) or 'image'
+            if not name.lower().endswith(tuple(ALLOWED_CONTENT_TYPES.values())):
+                name += extension
+            return {'content': content, 'filename': name}
+        except Exception as e:
+            logger.warning(f"下载图片失败: {src} - {str(e)}")
+            return None
+
+    def _upload(self, image: Dict) -> Optional[str]:
+        return self.wechat.upload_content_image(image['content'], image['filename'])
@@ -0,0 +1,204 @@
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobReporter:
+    """任务执行过程中回写进度和逐条结果"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def update(self, progress: int = None, total: int = None, message: str = None):
+        """更新进度，同时作为心跳刷新 updated_at"""
+        job = db.session.get(Job, self.job_id)
+        if not job:
+            return
+        if progress is not None:
+            job.progress = progress
+        if total is not None:
+            job.total = total
+        if message is not None:
+            job.message = message
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+
+    def add_result(self, item: Dict):
+        """追加一条处理结果（如一篇已保存的文章）"""
+        job = db.session.get(Job, self.job_id)
+        if not job:
+            return
+        # JSON列需要整体赋值才会被识别为修改
+        job.results = (job.results or []) + [item]
+        job.progress = len(job.results)
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+
+
+class JobQueue:
+    """基于数据库表的后台任务队列（无需Redis）
+
+    每个gunicorn worker进程各自运行一个调度线程，通过条件UPDATE原子认领
+    pending 状态的任务，保证同一任务只会被一个进程执行。
+    """
+
+    def __init__(self, app=None, max_workers: int = 2, poll_interval: float = 2):
+        self.app = None
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.stale_seconds = 1800
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers: Dict[str, Callable] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dispatcher: Optional[threading.Thread] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOB_WORKERS', self.max_workers)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.stale_seconds = app.config.get('JOB_STALE_SECONDS', self.stale_seconds)
+        app.extensions['job_queue'] = self
+
+    def handler(self, job_type: str):
+        """注册任务处理函数: handler(payload, reporter) -> result"""
+        def decorator(func):
+            self._handlers[job_type] = func
+            return func
+        return decorator
+
+    def start(self):
+        """启动调度线程（每个进程只启动一次）"""
+        with self._lock:
+            if self._dispatcher and self._dispatcher.is_alive():
+                return
+            # gunicorn fork 后线程不会被继承，按当前进程重新计算 worker_id
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='job-worker'
+            )
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop,
+                name='job-dispatcher',
+                daemon=True
+            )
+            self._dispatcher.start()
+
+    def submit(self, job_type: str, payload: Dict) -> Job:
+        """提交任务，立即返回任务记录"""
+        if job_type not in self._handlers:
+            raise ValueError(f"未知的任务类型: {job_type}")
+
+        job = Job(
+            id=str(uuid.uuid4()),
+            job_type=job_type,
+            status='pending',
+            payload=payload,
+            message='排队中'
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self._fail_stale_jobs()
+                    while self._has_free_slot():
+                        job_id = self._claim_next()
+                        if not job_id:
+                            break
+                        with self._lock:
+                            self._running += 1
+                        self._executor.submit(self._run, job_id)
+            except Exception as e:
+                logger.error(f"任务调度异常: {str(e)}")
+
+    def _has_free_slot(self) -> bool:
+        with self._lock:
+            return self._running < self.max_workers
+
+    def _claim_next(self) -> Optional[str]:
+        """原子认领最早的一个待执行任务"""
+        candidates = db.session.query(Job.id).filter(
+            Job.status == 'pending'
+        ).order_by(Job.created_at.asc()).limit(self.max_workers).all()
+
+        for (job_id,) in candidates:
+            now = datetime.utcnow()
+            claimed = Job.query.filter(
+                Job.id == job_id,
+                Job.status == 'pending'
+            ).update({
+                'status': 'running',
+                'worker_id': self.worker_id,
+                'started_at': now,
+                'updated_at': now,
+                'message': '执行中'
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def _fail_stale_jobs(self):
+        """长时间没有心跳的running任务视为worker已退出"""
+        deadline = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        stale = Job.query.filter(
+            Job.status == 'running',
+            Job.updated_at < deadline
+        ).update({
+            'status': 'failed',
+            'error': '任务执行超时或worker已退出',
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        if stale:
+            logger.warning(f"标记 {stale} 个超时任务为失败")
+        db.session.commit()
+
+    def _run(self, job_id: str):
+        try:
+            with self.app.app_context():
+                job = db.session.get(Job, job_id)
+                handler = self._handlers[job.job_type]
+                payload = job.payload or {}
+                try:
+                    result = handler(payload, JobReporter(job_id))
+                    job = db.session.get(Job, job_id)
+                    job.status = 'completed'
+                    job.result = result
+                    job.message = (result or {}).get('message', '已完成')
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"任务 {job_id} 执行失败: {str(e)}\n{traceback.format_exc()}")
+                    job = db.session.get(Job, job_id)
+                    job.status = 'failed'
+                    job.error = str(e)
+                    job.message = '执行失败'
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._wakeup.set()
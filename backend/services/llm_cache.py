@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache(SQLiteStore):
+    """LLM响应缓存（SQLite文件，gunicorn多个worker共享）
+
+    以 (服务商, 模型, 系统提示词, 用户提示词, 温度, max_tokens) 的哈希为键，
+    超过TTL的条目视为失效，条目数超过上限时按最近访问时间淘汰（LRU）。
+    命中统计和访问时间由 SQLiteStore 在进程内累加后定期写入。
+    """
+
+    STATS_TABLE = 'llm_cache_stats'
+    TOUCH_SQL = 'UPDATE llm_responses SET accessed_at = MAX(accessed_at, ?) WHERE key = ?'
+
+    def __init__(self, path: str, ttl: int = 7 * 24 * 3600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_llm_responses_accessed_at '
+            'ON llm_responses (accessed_at)'
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.executemany(
+            'INSERT OR IGNORE INTO llm_cache_stats (name, value) VALUES (?, 0)',
+            [('hits',), ('misses',), ('evictions',)]
+        )
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_prompt: Optional[str], user_prompt: str,
+                 temperature: Optional[float], max_tokens: Optional[int] = None) -> str:
+        """根据请求参数生成缓存键"""
+        payload = json.dumps(
+            [provider, model, system_prompt or '', user_prompt, temperature, max_tokens],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的缓存，命中时记录访问时间（只读，不占写锁）"""
+        try:
+            now = time.time()
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT response FROM llm_responses WHERE key = ? AND created_at > ?',
+                    (key, now - self.ttl)
+                ).fetchone()
+            if row:
+                self._touch(key, now)
+                self._count('hits')
+                return row[0]
+            self._count('misses')
+            return None
+        except sqlite3.Error as e:
+            logger.warning(f"读取LLM缓存失败: {str(e)}")
+            return None
+
+    def set(self, key: str, response: str):
+        """写入缓存并执行过期清理和LRU淘汰"""
+        try:
+            now = time.time()
+            # 先写入累加的访问时间，淘汰时按最新的访问时间排序
+            self.flush()
+            with self._connection() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO llm_responses (key, response, created_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, response, now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"写入LLM缓存失败: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute(
+            'DELETE FROM llm_responses WHERE created_at <= ?', (now - self.ttl,)
+        ).rowcount
+        count = conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+        overflow = count - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = conn.execute(
+                'DELETE FROM llm_responses WHERE key IN '
+                '(SELECT key FROM llm_responses ORDER BY accessed_at ASC LIMIT ?)',
+                (overflow,)
+            ).rowcount
+        if expired or evicted:
+            conn.execute(
+                "UPDATE llm_cache_stats SET value = value + ? WHERE name = 'evictions'", (expired + evicted,)
+            )
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        self.flush()
+        with self._connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM llm_cache_stats').fetchall())
+            entries = conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / total, 3) if total else 0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl
+        }
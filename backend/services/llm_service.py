@@ -2,17 +2,50 @@ from openai import OpenAI
 from anthropic import Anthropic
 import json
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List
 from config import Config
+from services.llm_cache import LLMCache
+from utils.rate_limiter import UsageRateLimiter
 
 logger = logging.getLogger(__name__)
 
+# 限速器在进程内共享，LLMService 每次请求都会新建实例
+_rate_limiters: Dict[str, UsageRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def _get_rate_limiter(provider: str) -> UsageRateLimiter:
+    """获取服务商对应的RPM/TPM限速器（每个进程分到配额的 1/LLM_RATE_LIMIT_PROCESSES）"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            if provider == 'openai':
+                rpm, tpm = Config.OPENAI_RPM, Config.OPENAI_TPM
+            else:
+                rpm, tpm = Config.CLAUDE_RPM, Config.CLAUDE_TPM
+            processes = Config.LLM_RATE_LIMIT_PROCESSES
+            # 配额为0表示不限速；平分后至少保留1，避免完全无法请求
+            limiter = UsageRateLimiter(
+                max(1, rpm // processes) if rpm else 0,
+                max(1, tpm // processes) if tpm else 0
+            )
+            _rate_limiters[provider] = limiter
+        return limiter
+
 class LLMService:
     def __init__(self):
         self.openai_client = None
         self.claude_client = None
         self.timeout = 30  # 设置超时时间
+        self.cache = None
+        if Config.LLM_CACHE_ENABLED:
+            self.cache = LLMCache(
+                Config.LLM_CACHE_PATH,
+                ttl=Config.LLM_CACHE_TTL,
+                max_entries=Config.LLM_CACHE_MAX_ENTRIES
+            )
         self._initialize_clients()
     
     def _initialize_clients(self):
@@ -31,6 +64,73 @@ class LLMService:
                 timeout=self.timeout
             )
     
+    def _estimate_tokens(self, text: str, max_tokens: int) -> int:
+        """粗略估算一次调用消耗的token数（中文约每字1个token）"""
+        return len(text) + max_tokens
+    
+    def _chat(self, provider: str, model: str, user_prompt: str, system_prompt: str = None,
+              temperature: float = None, max_tokens: int = 2000, timeout: float = None,
+              cache: bool = False) -> str:
+        """调用LLM对话接口，所有请求统一经过服务商限速
+
+        cache=True 时先查响应缓存，用于改写这类相同输入可复用结果的调用。
+        """
+        cache_key = None
+        if cache and self.cache:
+            cache_key = LLMCache.make_key(
+                provider, model, system_prompt, user_prompt, temperature, max_tokens
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中LLM缓存: {provider}/{model}")
+                return cached
+        
+        result = self._request_completion(
+            provider, model, user_prompt, system_prompt, temperature, max_tokens, timeout
+        )
+        
+        if cache_key and result:
+            self.cache.set(cache_key, result)
+        return result
+    
+    def _request_completion(self, provider: str, model: str, user_prompt: str,
+                            system_prompt: Optional[str], temperature: Optional[float],
+                            max_tokens: int, timeout: Optional[float]) -> str:
+        """限速后实际请求服务商接口"""
+        estimated = self._estimate_tokens((system_prompt or '') + user_prompt, max_tokens)
+        waited = _get_rate_limiter(provider).acquire(estimated)
+        if waited:
+            logger.info(f"{provider} 触发限速，等待 {waited:.1f}s")
+        
+        options = {}
+        if temperature is not None:
+            options['temperature'] = temperature
+        if timeout is not None:
+            options['timeout'] = timeout
+        
+        if provider == 'openai':
+            messages = []
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            messages.append({"role": "user", "content": user_prompt})
+            response = self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **options
+            )
+            return response.choices[0].message.content
+        
+        if system_prompt:
+            options['system'] = system_prompt
+        response = self.claude_client.messages.create(
+            model=model,
+            messages=[{"role": "user", "content": user_prompt}],
+            max_tokens=max_tokens,
+            **options
+        )
+        return response.content[0].text
+    
     def rewrite_article(self, content: str, style: str = "professional") -> str:
         """使用LLM改写文章"""
         prompt = f"""
@@ -49,24 +149,16 @@ class LLMService:
         
         try:
             if self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的内容创作者"},
-                        {"role": "user", "content": prompt}
-                    ],
+                return self._chat(
+                    'openai', "gpt-4", prompt,
+                    system_prompt="你是一个专业的内容创作者",
                     temperature=0.7,
-                    max_tokens=2000
+                    max_tokens=2000,
+                    cache=True
                 )
-                return response.choices[0].message.content
             
             elif self.claude_client:
-                response = self.claude_client.messages.create(
-                    model="claude-3-opus-20240229",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=2000
-                )
-                return response.content[0].text
+                return self._chat('claude', "claude-3-opus-20240229", prompt, max_tokens=2000, cache=True)
             
         except Exception as e:
             logger.error(f"LLM改写失败: {str(e)}")
@@ -93,23 +185,14 @@ class LLMService:
         
         try:
             if self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "你是一个优秀的自媒体内容创作者"},
-                        {"role": "user", "content": prompt}
-                    ],
+                content = self._chat(
+                    'openai', "gpt-4", prompt,
+                    system_prompt="你是一个优秀的自媒体内容创作者",
                     temperature=0.8,
                     max_tokens=2000
                 )
-                content = response.choices[0].message.content
             elif self.claude_client:
-                response = self.claude_client.messages.create(
-                    model="claude-3-sonnet-20240229",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=2000
-                )
-                content = response.content[0].text
+                content = self._chat('claude', "claude-3-sonnet-20240229", prompt, max_tokens=2000)
             else:
                 content = "生成失败：未配置LLM服务"
             
@@ -133,20 +216,13 @@ class LLMService:
         
         try:
             if self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": prompt}],
+                return self._chat(
+                    'openai', "gpt-3.5-turbo", prompt,
                     temperature=0.9,
                     max_tokens=50
-                )
-                return response.choices[0].message.content.strip()
+                ).strip()
             elif self.claude_client:
-                response = self.claude_client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=50
-                )
-                return response.content[0].text.strip()
+                return self._chat('claude', "claude-3-haiku-20240307", prompt, max_tokens=50).strip()
         except Exception as e:
             logger.error(f"生成标题失败: {str(e)}")
             return "精彩文章标题"
@@ -155,23 +231,14 @@ class LLMService:
         """生成内容 - 为API兼容性添加的方法"""
         try:
             if self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的内容创作者，擅长创作高质量的文章。"},
-                        {"role": "user", "content": prompt}
-                    ],
+                return self._chat(
+                    'openai', "gpt-4o", prompt,
+                    system_prompt="你是一个专业的内容创作者，擅长创作高质量的文章。",
                     temperature=0.7,
                     max_tokens=2000
-                )
-                return response.choices[0].message.content.strip()
+                ).strip()
             elif self.claude_client:
-                response = self.claude_client.messages.create(
-                    model="claude-3-sonnet-20240229",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=2000
-                )
-                return response.content[0].text.strip()
+                return self._chat('claude', "claude-3-sonnet-20240229", prompt, max_tokens=2000).strip()
             else:
                 return "错误：未配置LLM服务"
         except Exception as e:
@@ -217,33 +284,28 @@ class LLMService:
             # 尝试使用更快的模型和更短的内容
             if self.openai_client:
                 try:
-                    response = self.openai_client.chat.completions.create(
-                        model="gpt-4o-mini",  # 使用更快的模型
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
+                    result = self._chat(
+                        'openai', "gpt-4o-mini", user_prompt,  # 使用更快的模型
+                        system_prompt=system_prompt,
                         max_tokens=1500,  # 减少token数量
                         temperature=0.7,
-                        timeout=15  # 设置较短的超时时间
-                    )
-                    result = response.choices[0].message.content.strip()
+                        timeout=15,  # 设置较短的超时时间
+                        cache=True
+                    ).strip()
                 except Exception as e:
                     logger.warning(f"GPT-4o-mini失败，尝试备用方案: {str(e)}")
                     # 备用方案：返回原内容但做简单优化
                     result = self._simple_rewrite_fallback(original_content, original_title)
             elif self.claude_client:
                 try:
-                    response = self.claude_client.messages.create(
-                        model="claude-3-haiku-20240307",  # 使用更快的模型
+                    result = self._chat(
+                        'claude', "claude-3-haiku-20240307",  # 使用更快的模型
+                        f"{system_prompt}\n\n{user_prompt}",
                         max_tokens=1500,
                         temperature=0.7,
                         timeout=15,
-                        messages=[
-                            {"role": "user", "content": f"{system_prompt}\n\n{user_prompt}"}
-                        ]
-                    )
-                    result = response.content[0].text.strip()
+                        cache=True
+                    ).strip()
                 except Exception as e:
                     logger.warning(f"Claude失败，使用备用方案: {str(e)}")
                     result = self._simple_rewrite_fallback(original_content, original_title)
@@ -310,48 +372,48 @@ class LLMService:
             logger.error(f"解析改写结果失败: {str(e)}")
             return "改写文章", result
     
-    def rewrite_batch(self, articles: List[dict]) -> List[dict]:
-        """批量改写文章"""
-        rewritten_articles = []
-        
-        for article in articles:
-            try:
-                rewritten = self.rewrite_for_wechat(
-                    article.get('content', ''),
-                    {
-                        'title': article.get('title', ''),
-                        'source_type': article.get('source_type', 'unknown'),
-                        'source_url': article.get('source_url', ''),
-                        'meta': article.get('meta', {})
-                    }
-                )
-                
-                # 合并原始信息和改写结果
-                final_article = {
-                    **article,
-                    'title': rewritten['title'],
-                    'content': rewritten['content'],
-                    'original_title': article.get('title', ''),
-                    'original_content': article.get('content', ''),
-                    'rewritten': True,
-                    'rewrite_time': rewritten.get('rewrite_time')
+    def _rewrite_one(self, article: dict) -> dict:
+        """改写单篇文章并合并原始信息，失败时保留原文"""
+        try:
+            rewritten = self.rewrite_for_wechat(
+                article.get('content', ''),
+                {
+                    'title': article.get('title', ''),
+                    'source_type': article.get('source_type', 'unknown'),
+                    'source_url': article.get('source_url', ''),
+                    'meta': article.get('meta', {})
                 }
-                
-                rewritten_articles.append(final_article)
-                
-                # 避免API限制
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"批量改写失败: {str(e)}")
-                # 如果改写失败，保留原文
-                rewritten_articles.append({
-                    **article,
-                    'rewritten': False,
-                    'error': str(e)
-                })
+            )
+            
+            # 合并原始信息和改写结果
+            return {
+                **article,
+                'title': rewritten['title'],
+                'content': rewritten['content'],
+                'original_title': article.get('title', ''),
+                'original_content': article.get('content', ''),
+                'rewritten': True,
+                'rewrite_time': rewritten.get('rewrite_time')
+            }
+            
+        except Exception as e:
+            logger.error(f"批量改写失败: {str(e)}")
+            # 如果改写失败，保留原文
+            return {
+                **article,
+                'rewritten': False,
+                'error': str(e)
+            }
+    
+    def rewrite_batch(self, articles: List[dict], max_concurrency: int = None) -> List[dict]:
+        """批量改写文章（并发执行，结果顺序与输入一致）"""
+        concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        if concurrency <= 1 or len(articles) <= 1:
+            return [self._rewrite_one(article) for article in articles]
         
-        return rewritten_articles
+        # 服务商的RPM/TPM限制由 _chat 中的共享限速器保证
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(articles))) as executor:
+            return list(executor.map(self._rewrite_one, articles))
     
     def _simple_rewrite_fallback(self, content: str, title: str) -> str:
         """简单的备用改写方案，当LLM失败时使用"""
@@ -0,0 +1,87 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from flask import has_app_context
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, WeChatMedia
+
+logger = logging.getLogger(__name__)
+
+# 临时素材有效期3天，提前1小时视为过期，保证发布过程中素材仍然有效
+TEMP_MEDIA_TTL = timedelta(days=3)
+EXPIRY_MARGIN = timedelta(hours=1)
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class MediaCache:
+    """素材上传缓存：文件内容哈希 -> 微信 media_id / URL
+
+    缓存不可用（没有应用上下文或数据库出错）时只记录日志，按未命中处理，不影响上传。
+    发布流程中调用时外层事务里还有未提交的认领和群发记录，所以读写都放在保存点内，
+    出错只回滚保存点，写入随调用方的事务一起提交。
+    """
+
+    def get(self, digest: str, media_type: str) -> Optional[WeChatMedia]:
+        if not has_app_context():
+            return None
+        try:
+            with db.session.begin_nested():
+                return WeChatMedia.query.filter(
+                    WeChatMedia.content_hash == digest,
+                    WeChatMedia.media_type == media_type,
+                    or_(WeChatMedia.expires_at.is_(None), WeChatMedia.expires_at > datetime.utcnow() + EXPIRY_MARGIN)
+                ).first()
+        except SQLAlchemyError as e:
+            logger.warning(f"查询素材缓存失败: {str(e)}")
+            return None
+
+    def get_many(self, digests: List[str], media_type: str) -> Dict[str, WeChatMedia]:
+        """批量查询，返回 {内容哈希: 素材}"""
+        if not digests or not has_app_context():
+            return {}
+        try:
+            with db.session.begin_nested():
+                rows = WeChatMedia.query.filter(
+                    WeChatMedia.content_hash.in_(digests),
+                    WeChatMedia.media_type == media_type,
+                    or_(WeChatMedia.expires_at.is_(None), WeChatMedia.expires_at > datetime.utcnow() + EXPIRY_MARGIN)
+                ).all()
+            return {row.content_hash: row for row in rows}
+        except SQLAlchemyError as e:
+            logger.warning(f"查询素材缓存失败: {str(e)}")
+            return {}
+
+    def put(self, digest: str, media_type: str, media_id: Optional[str] = None, url: Optional[str] = None,
+            size: Optional[int] = None, ttl: Optional[timedelta] = None):
+        if not has_app_context():
+            return
+        values = {
+            'media_id': media_id,
+            'url': url,
+            'size': size,
+            'created_at': datetime.utcnow(),
+            'expires_at': datetime.utcnow() + ttl if ttl else None
+        }
+        try:
+            with db.session.begin_nested():
+                updated = WeChatMedia.query.filter_by(
+                    content_hash=digest, media_type=media_type
+                ).update(values, synchronize_session=False)
+                if not updated:
+                    try:
+                        with db.session.begin_nested():
+                            db.session.add(WeChatMedia(content_hash=digest, media_type=media_type, **values))
+                    except IntegrityError:
+                        # 其他进程同时上传了同一文件，以后写入的为准
+                        WeChatMedia.query.filter_by(
+                            content_hash=digest, media_type=media_type
+                        ).update(values, synchronize_session=False)
+        except SQLAlchemyError as e:
+            logger.warning(f"写入素材缓存失败: {str(e)}")
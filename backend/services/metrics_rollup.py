@@ -0,0 +1,129 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Dict
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Article, ArticleDailyStats, TagDailyStats, PublishSlotStats
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = ('views', 'likes', 'comments', 'shares')
+
+
+class MetricsRollup:
+    """维护数据分析用的汇总表
+
+    每收到一条文章某天的数据，就把与旧值的差额累加到标签汇总和发布时段汇总，
+    报表直接读取汇总表，不再逐篇文章计算。
+    """
+
+    def record(self, article: Article, stat_date: date, metrics: Dict[str, int]) -> bool:
+        """写入文章某天的数据（当天的绝对值），返回数据是否有变化
+
+        只修改session，由调用方统一提交，便于批量写入时共用一个事务。
+        """
+        row = ArticleDailyStats.query.filter_by(article_id=article.id, stat_date=stat_date).first()
+        is_new_article = row is None and not db.session.query(ArticleDailyStats.id).filter_by(
+            article_id=article.id
+        ).first()
+
+        if row is None:
+            row = ArticleDailyStats(
+                article_id=article.id,
+                stat_date=stat_date,
+                publish_date=article.published_at.date() if article.published_at else None,
+                views=0, likes=0, comments=0, shares=0
+            )
+            db.session.add(row)
+
+        deltas = {}
+        for field in METRIC_FIELDS:
+            old_value = getattr(row, field) or 0
+            new_value = int(metrics.get(field, old_value) or 0)
+            deltas[field] = new_value - old_value
+            setattr(row, field, new_value)
+
+        if not any(deltas.values()) and not is_new_article:
+            return False
+
+        new_count = 1 if is_new_article else 0
+        if row.publish_date:
+            for tag in set(article.tags or []):
+                self._increment(
+                    TagDailyStats,
+                    {'tag': str(tag)[:100], 'publish_date': row.publish_date},
+                    {**deltas, 'article_count': new_count}
+                )
+
+        if article.published_at:
+            self._increment(
+                PublishSlotStats,
+                {'weekday': article.published_at.weekday(), 'hour': article.published_at.hour},
+                {
+                    'views': deltas['views'],
+                    'engagement': deltas['likes'] + deltas['comments'] + deltas['shares'],
+                    'article_count': new_count
+                }
+            )
+        return True
+
+    def _increment(self, model, keys: Dict, deltas: Dict):
+        """对汇总行做原子累加，不存在时插入"""
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+
+        values = {getattr(model, field): getattr(model, field) + value for field, value in deltas.items()}
+        if model.query.filter_by(**keys).update(values, synchronize_session=False):
+            return
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**keys, **deltas))
+        except IntegrityError:
+            # 并发插入了同一行，改为累加
+            model.query.filter_by(**keys).update(values, synchronize_session=False)
+
+    def rebuild(self):
+        """根据文章每日数据重建标签和时段汇总（文章标签或发布时间修改后使用）"""
+        tag_totals = defaultdict(lambda: defaultdict(int))
+        slot_totals = defaultdict(lambda: defaultdict(int))
+
+        rows = db.session.query(
+            Article.id, Article.tags, Article.published_at,
+            db.func.sum(ArticleDailyStats.views),
+            db.func.sum(ArticleDailyStats.likes),
+            db.func.sum(ArticleDailyStats.comments),
+            db.func.sum(ArticleDailyStats.shares)
+        ).join(
+            ArticleDailyStats, ArticleDailyStats.article_id == Article.id
+        ).filter(
+            Article.published_at.isnot(None)
+        ).group_by(Article.id, Article.tags, Article.published_at).yield_per(1000)
+
+        for _, tags, published_at, views, likes, comments, shares in rows:
+            values = dict(zip(METRIC_FIELDS, (views or 0, likes or 0, comments or 0, shares or 0)))
+            for tag in set(tags or []):
+                totals = tag_totals[(str(tag)[:100], published_at.date())]
+                totals['article_count'] += 1
+                for field, value in values.items():
+                    totals[field] += value
+            slot = slot_totals[(published_at.weekday(), published_at.hour)]
+            slot['article_count'] += 1
+            slot['views'] += values['views']
+            slot['engagement'] += values['likes'] + values['comments'] + values['shares']
+
+        TagDailyStats.query.delete(synchronize_session=False)
+        PublishSlotStats.query.delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(TagDailyStats, [
+            {'tag': tag, 'publish_date': publish_date, **totals}
+            for (tag, publish_date), totals in tag_totals.items()
+        ])
+        db.session.bulk_insert_mappings(PublishSlotStats, [
+            {'weekday': weekday, 'hour': hour, **totals}
+            for (weekday, hour), totals in slot_totals.items()
+        ])
+        db.session.commit()
+        logger.info(f"重建汇总表: {len(tag_totals)} 个标签日, {len(slot_totals)} 个发布时段")
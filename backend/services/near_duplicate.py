@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, CrawledItem
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+# 64位指纹分成4段，每段16位。汉明距离不超过3的两个指纹至少有一段完全相同（抽屉原理），
+# 按段建索引查候选，再精确比较距离，不需要全表扫描
+BAND_COUNT = 4
+BAND_BITS = SIMHASH_BITS // BAND_COUNT
+BAND_MASK = (1 << BAND_BITS) - 1
+# 补算时跳过的记录（没有原文或算不出指纹）在 simhash_band0 中的标记
+SKIPPED_BAND = -1
+BAND_COLUMNS = [getattr(CrawledItem, f'simhash_band{band}') for band in range(BAND_COUNT)]
+
+# 至少包含一个字母、数字或汉字的词才参与计算（去掉空白和标点）
+TOKEN_PATTERN = re.compile(r'\w')
+
+
+def tokenize(text: str) -> List[str]:
+    """jieba分词，去掉单字词（多为"的""了"等虚词，权重高却不区分内容）"""
+    return [token for token in jieba.lcut(text or '') if len(token) > 1 and TOKEN_PATTERN.search(token)]
+
+
+def simhash(text: str) -> Optional[int]:
+    """正文的64位SimHash（词频加权），内容相近的文章指纹只有少数几位不同；没有可用的词时返回None"""
+    weights = Counter(tokenize(text))
+    if not weights:
+        return None
+
+    vector = [0] * SIMHASH_BITS
+    for token, weight in weights.items():
+        digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            if digest >> bit & 1:
+                vector[bit] += weight
+            else:
+                vector[bit] -= weight
+    return sum(1 << bit for bit, value in enumerate(vector) if value > 0)
+
+
+def bands(signature: int) -> List[int]:
+    return [signature >> (band * BAND_BITS) & BAND_MASK for band in range(BAND_COUNT)]
+
+
+def hamming(a: int, b: int) -> int:
+    # int.bit_count() 需要 Python 3.10，部署镜像是 3.9
+    return bin(a ^ b).count('1')
+
+
+def to_signed(signature: int) -> int:
+    """数据库 BIGINT 是有符号的，最高位为1的指纹按补码保存"""
+    return signature - (1 << SIMHASH_BITS) if signature >= 1 << (SIMHASH_BITS - 1) else signature
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+
+def signature_columns(signature: Optional[int]) -> Dict:
+    """写入 CrawledItem 的指纹字段"""
+    if signature is None:
+        return {}
+    columns = {'simhash': to_signed(signature)}
+    for band, value in enumerate(bands(signature)):
+        columns[f'simhash_band{band}'] = value
+    return columns
+
+
+class NearDuplicateIndex:
+    """跨来源的近似重复检测（SimHash + 分段索引）
+
+    同一条新闻从公众号、知乎、RSS转载过来时文字略有差异，正文指纹不同但SimHash只差几位。
+    指纹保存在 crawled_item 表中，查询时用4个分段列的索引取出候选，再比较汉明距离，
+    候选数量与总条数基本无关，几十万条记录时单次查询仍在毫秒以内。
+    """
+
+    def __init__(self, max_distance: int = 3):
+        if max_distance >= BAND_COUNT:
+            # 超过3时有的相近指纹没有任何一段相同，会漏判
+            logger.warning(f"近似重复阈值 {max_distance} 超过 {BAND_COUNT - 1}，部分相近内容可能查不到")
+        self.max_distance = max_distance
+
+    def lookup(self, signature: int):
+        """返回指纹距离不超过阈值的已有记录中最接近的一条"""
+        conditions = [column == value for column, value in zip(BAND_COLUMNS, bands(signature))]
+        try:
+            candidates = db.session.query(
+                CrawledItem.id, CrawledItem.article_id, CrawledItem.url, CrawledItem.simhash
+            ).filter(or_(*conditions)).all()
+        except SQLAlchemyError as e:
+            logger.warning(f"查询近似重复失败，按新内容处理: {str(e)}")
+            return None
+
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            distance = hamming(signature, to_unsigned(candidate.simhash))
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def filter(self, articles: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """拆分为 (新内容, 近似重复)，给每篇文章加上 simhash
+
+        与已保存内容或同一批中前面的文章相近的都算重复，重复的文章带上 duplicate_of（原文地址）。
+        """
+        fresh, duplicates, batch = [], [], []
+        for article in articles:
+            signature = simhash(article.get('content', ''))
+            article['simhash'] = signature
+            if signature is None:
+                fresh.append(article)
+                continue
+
+            match = self.lookup(signature)
+            if match:
+                article['duplicate_of'] = match.url
+                if match.article_id:
+                    article['article_id'] = match.article_id
+                duplicates.append(article)
+                continue
+
+            earlier = next(
+                (other for other in batch if hamming(signature, other['simhash']) <= self.max_distance), None
+            )
+            if earlier:
+                article['duplicate_of'] = earlier.get('source_url')
+                duplicates.append(article)
+                continue
+
+            batch.append(article)
+            fresh.append(article)
+
+        if duplicates:
+            logger.info(f"跳过近似重复的文章 {len(duplicates)} 篇")
+        return fresh, duplicates
+
+
+def _is_source_text(meta_data) -> bool:
+    """文章正文是否就是爬取的原文（没有经过LLM改写）"""
+    if isinstance(meta_data, str):
+        try:
+            meta_data = json.loads(meta_data)
+        except ValueError:
+            return False
+    return isinstance(meta_data, dict) and meta_data.get('rewritten') is False
+
+
+def index_stored_articles(batch_size: int = 500) -> int:
+    """给还没有指纹的爬取记录（迁移补录的已有文章）补算SimHash，返回算出指纹的条数
+
+    新爬取的内容按改写前的原文计算指纹，已有文章只保存了改写后的正文，两者无法比较，
+    所以只有没改写过的文章（meta_data 中 rewritten 为 False）按正文补算。
+    改写过的和正文算不出指纹的记录在 simhash_band0 写入哨兵值 SKIPPED_BAND，不再重复处理。
+    """
+    from models import Article
+
+    rows = db.session.query(CrawledItem.id, Article.content, Article.meta_data).join(
+        Article, Article.id == CrawledItem.article_id
+    ).filter(
+        CrawledItem.simhash.is_(None), CrawledItem.simhash_band0.is_(None)
+    ).order_by(CrawledItem.id.desc()).limit(batch_size).all()
+
+    indexed = 0
+    for item_id, content, meta_data in rows:
+        columns = signature_columns(simhash(content or '')) if _is_source_text(meta_data) else {}
+        if columns:
+            indexed += 1
+        else:
+            # 分段的取值范围是 0~65535，哨兵值不会被查询命中
+            columns = {'simhash_band0': SKIPPED_BAND}
+        CrawledItem.query.filter_by(id=item_id).update(columns, synchronize_session=False)
+    db.session.commit()
+    return indexed
@@ -0,0 +1,165 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from config import Config
+from models import db, Article, PublishSchedule
+
+logger = logging.getLogger(__name__)
+
+# session.info 中待注册的发布时间
+PENDING_TIMES_KEY = 'publish_dispatcher_times'
+
+# 修改后需要重新上传图文素材的文章字段
+STAGED_ARTICLE_FIELDS = ('title', 'content', 'markdown_content', 'html_content', 'cover_image', 'source_url')
+
+
+class PublishDispatcher:
+    """按每条定时任务的时间精确触发发布
+
+    定时任务写入或修改并提交后，在当前进程注册一个一次性的 date 触发器
+    （同一时间的任务共用一个触发器）；另有每分钟执行一次的巡检，按
+    (status, scheduled_time) 索引把即将到期的任务注册到执行巡检的进程，
+    并立即补发已过期未发布的任务（重启、进程退出后的补偿）。
+    触发时由 publish_due_schedules 逐行认领，多个worker同时触发也只发布一次。
+    """
+
+    def __init__(self, scheduler=None, app=None):
+        self.scheduler = scheduler
+        self.app = app
+        self.horizon = timedelta(minutes=Config.PUBLISH_ARM_HORIZON_MINUTES)
+        if scheduler is not None:
+            self.init_scheduler(scheduler, app)
+
+    def init_scheduler(self, scheduler, app=None):
+        global _dispatcher
+        self.scheduler = scheduler
+        self.app = app or scheduler.app
+        _dispatcher = self
+
+    def arm(self, scheduled_time: datetime):
+        """注册一个在 scheduled_time 触发的发布任务（已过期则立即触发）"""
+        run_at = max(scheduled_time, datetime.now())
+        job_id = f"publish_at_{scheduled_time:%Y%m%d%H%M%S}"
+        self.scheduler.add_job(
+            id=job_id,
+            func=self.dispatch,
+            trigger='date',
+            # scheduled_time 按服务器本地时间保存，转成带时区的时间，避免与调度器时区不一致
+            run_date=run_at.astimezone(),
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+        logger.debug(f"已注册定时发布触发器 {job_id}")
+
+    def arm_upcoming(self) -> Dict:
+        """注册即将到期的定时任务，补发已过期的任务"""
+        now = datetime.now()
+        times = [row[0] for row in db.session.query(PublishSchedule.scheduled_time).join(
+            Article, PublishSchedule.article_id == Article.id
+        ).filter(
+            PublishSchedule.status == 'pending',
+            PublishSchedule.scheduled_time <= now + self.horizon,
+            Article.status == 'approved'
+        ).distinct().all()]
+
+        overdue = [scheduled_time for scheduled_time in times if scheduled_time <= now]
+        if overdue:
+            logger.info(f"发现 {len(overdue)} 个已过期未发布的时间点，立即补发")
+            self.arm(now)
+        for scheduled_time in times:
+            if scheduled_time > now:
+                self.arm(scheduled_time)
+        return {'armed': len(times) - len(overdue), 'overdue': len(overdue)}
+
+    def dispatch(self):
+        from services.article_pipeline import publish_due_schedules
+
+        with self.app.app_context():
+            try:
+                publish_due_schedules()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"定时发布失败: {str(e)}")
+
+
+def dispatch_latency_stats(limit: int = 200) -> Dict:
+    """最近 limit 次定时发布的调度延迟（实际开始发布时间 - 计划时间，秒）"""
+    rows = db.session.query(PublishSchedule.scheduled_time, PublishSchedule.dispatched_at).filter(
+        PublishSchedule.dispatched_at.isnot(None)
+    ).order_by(PublishSchedule.dispatched_at.desc()).limit(limit).all()
+
+    latencies = sorted((dispatched_at - scheduled_time).total_seconds() for scheduled_time, dispatched_at in rows)
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'p50': round(latencies[len(latencies) // 2], 3),
+        'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        'max': round(latencies[-1], 3)
+    }
+
+
+_dispatcher: Optional[PublishDispatcher] = None
+
+
+@event.listens_for(PublishSchedule, 'after_insert')
+@event.listens_for(PublishSchedule, 'after_update')
+def _collect_schedule_time(mapper, connection, target):
+    if target.status == 'pending' and target.scheduled_time:
+        session = object_session(target)
+        session.info.setdefault(PENDING_TIMES_KEY, set()).add(target.scheduled_time)
+
+
+@event.listens_for(Session, 'after_commit')
+def _arm_committed(session):
+    times = session.info.pop(PENDING_TIMES_KEY, None)
+    if not times or _dispatcher is None:
+        return
+    for scheduled_time in times:
+        try:
+            _dispatcher.arm(scheduled_time)
+        except Exception as e:
+            logger.error(f"注册定时发布触发器失败: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING_TIMES_KEY, None)
+
+
+def _clear_staging(connection, condition):
+    """作废预上传的素材：与满足条件的任务同一条素材的待发布任务都要重新准备"""
+    table = PublishSchedule.__table__
+    media_ids = [row[0] for row in connection.execute(
+        select(table.c.staged_media_id).where(condition, table.c.staged_media_id.isnot(None)).distinct()
+    )]
+    if not media_ids:
+        return
+    connection.execute(table.update().where(
+        table.c.staged_media_id.in_(media_ids),
+        table.c.status == 'pending'
+    ).values(staged_media_id=None, stage_index=None, stage_status=None, staged_at=None))
+    logger.info(f"发布内容已变更，作废预上传素材 {len(media_ids)} 条")
+
+
+@event.listens_for(Article, 'after_update')
+def _invalidate_article_staging(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in STAGED_ARTICLE_FIELDS):
+        _clear_staging(connection, PublishSchedule.__table__.c.article_id == target.id)
+
+
+@event.listens_for(PublishSchedule, 'after_update')
+def _invalidate_rescheduled_staging(mapper, connection, target):
+    if target.staged_media_id and inspect(target).attrs.scheduled_time.history.has_changes():
+        _clear_staging(connection, PublishSchedule.__table__.c.id == target.id)
+
+
+@event.listens_for(PublishSchedule, 'after_delete')
+def _invalidate_deleted_staging(mapper, connection, target):
+    if target.staged_media_id:
+        _clear_staging(connection, PublishSchedule.__table__.c.staged_media_id == target.staged_media_id)
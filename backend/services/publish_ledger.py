@@ -0,0 +1,168 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, PublishLedger
+
+logger = logging.getLogger(__name__)
+
+# (文章ID, 定时任务ID)，立即发布的定时任务ID为0
+LedgerKey = Tuple[int, int]
+
+MANUAL_SCHEDULE_ID = 0
+
+
+class LedgerClaim:
+    """一次认领的结果
+
+    claimed: 本次认领成功、可以发送的键
+    sent: 之前已经发送成功的记录，直接按记录的消息ID补写结果，不再发送
+    in_flight: 其他进程正在发送，稍后重试
+    unknown: 发送结果不确定，不会自动重发
+    token 标识本次认领，之后的写入都以它为条件，认领被其他进程接管后不会再发送
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.claimed: List[LedgerKey] = []
+        self.sent: Dict[LedgerKey, PublishLedger] = {}
+        self.in_flight: Dict[LedgerKey, PublishLedger] = {}
+        self.unknown: Dict[LedgerKey, PublishLedger] = {}
+
+
+class SendLedger:
+    """群发记录，保证同一篇文章（按定时任务）最多群发一次
+
+    发送前逐篇原子认领（唯一约束插入或条件更新），调用群发前先记下 media_id，
+    群发后记录 msg_id/msg_data_id。重试时按记录对账：已发送的直接补写结果；
+    认领后在群发前中断的（没有 media_id）超时后可被重新认领，原认领随之失效；
+    群发请求可能已送达而结果未知的标记为 unknown，不自动重发。
+    """
+
+    def __init__(self, stale_after: timedelta = None):
+        self.stale_after = stale_after or timedelta(minutes=Config.PUBLISH_SEND_STALE_MINUTES)
+
+    def claim(self, keys: List[LedgerKey]) -> LedgerClaim:
+        result = LedgerClaim()
+        now = datetime.utcnow()
+        for key in keys:
+            article_id, schedule_id = key
+            try:
+                with db.session.begin_nested():
+                    db.session.add(PublishLedger(
+                        article_id=article_id,
+                        schedule_id=schedule_id,
+                        status='sending',
+                        claim_token=result.token,
+                        attempts=1,
+                        claimed_at=now
+                    ))
+                result.claimed.append(key)
+                continue
+            except IntegrityError:
+                pass
+
+            entry = PublishLedger.query.filter_by(article_id=article_id, schedule_id=schedule_id).first()
+            if entry is None:
+                continue
+            if entry.status == 'sent':
+                result.sent[key] = entry
+            elif entry.status == 'failed' or self._abandoned(entry, now):
+                if self._reclaim(entry, result.token, now):
+                    result.claimed.append(key)
+                else:
+                    result.in_flight[key] = entry
+            elif entry.status == 'sending' and entry.media_id and entry.claimed_at < now - self.stale_after:
+                PublishLedger.query.filter_by(id=entry.id, status='sending').update({
+                    'status': 'unknown',
+                    'error': '群发后没有记录结果，消息可能已发出'
+                }, synchronize_session=False)
+                result.unknown[key] = entry
+            elif entry.status == 'unknown':
+                result.unknown[key] = entry
+            else:
+                result.in_flight[key] = entry
+        db.session.commit()
+
+        if result.sent or result.unknown or result.in_flight:
+            logger.warning(
+                f"群发记录对账: 已发送{len(result.sent)}篇, 正在发送{len(result.in_flight)}篇, "
+                f"结果未知{len(result.unknown)}篇"
+            )
+        return result
+
+    def send(self, wechat, claim: LedgerClaim, keys: List[LedgerKey], media_id: str) -> Dict:
+        """群发已认领文章组成的素材，keys 的顺序即文章在消息中的位置"""
+        owned = 0
+        for index, (article_id, schedule_id) in enumerate(keys, start=1):
+            owned += PublishLedger.query.filter_by(
+                article_id=article_id, schedule_id=schedule_id, status='sending', claim_token=claim.token
+            ).update({'media_id': media_id, 'msg_index': index}, synchronize_session=False)
+        # 先提交 media_id，群发中断时据此判断消息可能已经发出
+        db.session.commit()
+        if owned < len(keys):
+            logger.error(f"群发认领已被其他进程接管，放弃发送素材 {media_id}")
+            self._update(claim, keys, {'status': 'failed', 'error': '认领已失效'})
+            return {"success": False, "message": "发布认领已失效，由其他进程重新发布"}
+
+        result = wechat.send_all(media_id)
+        if result['success']:
+            values = {
+                'status': 'sent',
+                'msg_id': self._to_str(result.get('msg_id')),
+                'msg_data_id': self._to_str(result.get('msg_data_id')),
+                'sent_at': datetime.utcnow(),
+                'error': None
+            }
+        else:
+            values = {
+                'status': 'unknown' if result.get('uncertain') else 'failed',
+                'error': result.get('message')
+            }
+        self._update(claim, keys, values)
+        return result
+
+    def fail(self, claim: LedgerClaim, keys: List[LedgerKey], message: str):
+        """群发前失败（内容准备、上传素材），释放认领以便重试"""
+        self._update(claim, keys, {'status': 'failed', 'error': message})
+
+    def _abandoned(self, entry: PublishLedger, now: datetime) -> bool:
+        """认领后没有走到群发就中断了（进程退出等）"""
+        return entry.status == 'sending' and not entry.media_id and entry.claimed_at < now - self.stale_after
+
+    def _reclaim(self, entry: PublishLedger, token: str, now: datetime) -> bool:
+        return bool(PublishLedger.query.filter_by(
+            id=entry.id, status=entry.status, claimed_at=entry.claimed_at
+        ).update({
+            'status': 'sending',
+            'claim_token': token,
+            'media_id': None,
+            'msg_index': None,
+            'claimed_at': now,
+            'attempts': PublishLedger.attempts + 1
+        }, synchronize_session=False))
+
+    def _update(self, claim: LedgerClaim, keys: List[LedgerKey], values: Dict):
+        for article_id, schedule_id in keys:
+            PublishLedger.query.filter_by(
+                article_id=article_id, schedule_id=schedule_id, status='sending', claim_token=claim.token
+            ).update(values, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def _to_str(value):
+        return str(value) if value is not None else None
+
+    @staticmethod
+    def as_result(entry: PublishLedger) -> Dict:
+        """把已发送的记录转换成群发结果"""
+        return {
+            'success': True,
+            'message': '已发送（按群发记录补写）',
+            'msg_id': entry.msg_id,
+            'msg_data_id': entry.msg_data_id
+        }
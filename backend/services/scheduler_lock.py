@@ -0,0 +1,118 @@
+import functools
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ScheduledJobState
+
+logger = logging.getLogger(__name__)
+
+
+class ExclusiveJobRunner:
+    """保证定时任务在多个gunicorn worker中只执行一次
+
+    每个进程的APScheduler都会按时触发任务，触发时先在 scheduled_job_state
+    表上做一次条件UPDATE：只有锁已释放且本时间片尚未被认领时才能成功，
+    其余进程直接跳过。执行结束后记录耗时和结果。
+
+    锁的持有时间默认为时间片的 LOCK_TTL_SLOTS 倍（不超过 lock_ttl），
+    进程崩溃后每分钟的任务几分钟内就能恢复，而不是被锁住一小时。
+    """
+
+    LOCK_TTL_SLOTS = 3
+
+    def __init__(self, app=None, slot_seconds: int = 60, lock_ttl: int = 3600):
+        self.app = None
+        self.slot_seconds = slot_seconds
+        self.lock_ttl = lock_ttl
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.lock_ttl = app.config.get('SCHEDULER_LOCK_TTL', self.lock_ttl)
+
+    @property
+    def runner_id(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def exclusive(self, job_id: str, slot_seconds: Optional[int] = None, lock_ttl: Optional[int] = None):
+        """装饰定时任务函数，放在 @scheduler.task 之下；slot_seconds 应与任务的触发周期一致"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.app.app_context():
+                    seconds = slot_seconds or self.slot_seconds
+                    ttl = lock_ttl or min(seconds * self.LOCK_TTL_SLOTS, self.lock_ttl)
+                    slot = self._current_slot(seconds)
+                    if not self._acquire(job_id, slot, ttl):
+                        logger.info(f"定时任务 {job_id} 已由其他进程执行，跳过")
+                        return None
+
+                    started = time.monotonic()
+                    status, error = 'success', None
+                    try:
+                        return func(*args, **kwargs)
+                    except Exception as e:
+                        db.session.rollback()
+                        status, error = 'failed', str(e)
+                        raise
+                    finally:
+                        self._record(job_id, status, error, time.monotonic() - started)
+            return wrapper
+        return decorator
+
+    def _current_slot(self, slot_seconds: int) -> datetime:
+        """把当前时间截断到时间片，同一次触发的各进程得到相同的值"""
+        now = datetime.utcnow()
+        epoch = int(now.timestamp())
+        return datetime.utcfromtimestamp(epoch - epoch % slot_seconds)
+
+    def _ensure_state(self, job_id: str):
+        if db.session.get(ScheduledJobState, job_id):
+            return
+        try:
+            db.session.add(ScheduledJobState(job_id=job_id, run_count=0))
+            db.session.commit()
+        except IntegrityError:
+            # 其他进程已经创建
+            db.session.rollback()
+
+    def _acquire(self, job_id: str, slot: datetime, lock_ttl: int) -> bool:
+        self._ensure_state(job_id)
+        now = datetime.utcnow()
+        claimed = ScheduledJobState.query.filter(
+            ScheduledJobState.job_id == job_id,
+            or_(ScheduledJobState.locked_until.is_(None), ScheduledJobState.locked_until < now),
+            or_(ScheduledJobState.last_slot.is_(None), ScheduledJobState.last_slot < slot)
+        ).update({
+            'locked_by': self.runner_id,
+            'locked_until': now + timedelta(seconds=lock_ttl),
+            'last_slot': slot,
+            'last_run_at': now,
+            'last_status': 'running',
+            'last_runner': self.runner_id
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _record(self, job_id: str, status: str, error: Optional[str], duration: float):
+        try:
+            state = db.session.get(ScheduledJobState, job_id)
+            state.locked_by = None
+            state.locked_until = None
+            state.last_status = status
+            state.last_error = error
+            state.last_duration = round(duration, 3)
+            state.run_count = (state.run_count or 0) + 1
+            db.session.commit()
+            logger.info(f"定时任务 {job_id} 执行{'成功' if status == 'success' else '失败'}，耗时 {duration:.1f}s")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"记录定时任务状态失败: {str(e)}")
@@ -1,26 +1,159 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import hashlib
+import os
+import threading
 import time
-from typing import Dict, Optional
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
 import logging
 from config import Config
+from services.media_cache import MediaCache, TEMP_MEDIA_TTL, content_hash
+from services.wechat_token import get_token_store
 
 logger = logging.getLogger(__name__)
 
+# access_token 失效或过期，刷新后重试
+TOKEN_ERRCODES = {40001, 40014, 42001}
+# 系统繁忙、接口调用超过频率限制，退避后重试
+RETRY_ERRCODES = {-1, 45011}
+# 一条图文消息最多包含的文章数
+MAX_NEWS_ARTICLES = 8
+
+
+class CallStats:
+    """各接口调用耗时统计（进程内）"""
+    
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._counts = defaultdict(lambda: {'calls': 0, 'errors': 0, 'total_seconds': 0.0})
+    
+    def record(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self._samples[name].append(seconds)
+            counts = self._counts[name]
+            counts['calls'] += 1
+            counts['errors'] += 0 if ok else 1
+            counts['total_seconds'] += seconds
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            result = {}
+            for name, counts in self._counts.items():
+                samples = sorted(self._samples[name])
+                result[name] = {
+                    'calls': counts['calls'],
+                    'errors': counts['errors'],
+                    'total_seconds': round(counts['total_seconds'], 3),
+                    'avg_ms': round(counts['total_seconds'] / counts['calls'] * 1000, 1),
+                    'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+                    'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                    'max_ms': round(samples[-1] * 1000, 1)
+                }
+            return result
+
+
+call_stats = CallStats()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """进程内共用的连接池，保持到微信服务器的长连接"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=Config.WECHAT_POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
 class WeChatAPI:
     def __init__(self):
         self.app_id = Config.WECHAT_APP_ID
         self.app_secret = Config.WECHAT_APP_SECRET
         self.access_token = None
-        self.token_expires_at = 0
-        self.base_url = "https://api.weixin.qq.com/cgi-bin"
+        self.token_store = get_token_store(Config.WECHAT_TOKEN_PATH, Config.WECHAT_TOKEN_REFRESH_MARGIN)
+        self.base_url = f"{Config.WECHAT_API_BASE}/cgi-bin"
+        self.datacube_url = f"{Config.WECHAT_API_BASE}/datacube"
+        self.session = _get_session()
+        self.media_cache = MediaCache()
+        self.timeout = (Config.WECHAT_CONNECT_TIMEOUT, Config.WECHAT_READ_TIMEOUT)
+        self.max_retries = Config.WECHAT_MAX_RETRIES
+        self.retry_backoff = Config.WECHAT_RETRY_BACKOFF
+        # 本实例累计等待微信接口的时间
+        self.api_seconds = 0.0
     
-    def get_access_token(self) -> str:
-        """获取access_token"""
-        if self.access_token and time.time() < self.token_expires_at:
-            return self.access_token
+    def _request(self, method: str, url: str, name: str, with_token: bool = True,
+                 idempotent: bool = True, **kwargs) -> Dict:
+        """调用微信接口并返回JSON结果
         
+        token失效时刷新后重试；系统繁忙、限频和网络错误按指数退避重试。
+        idempotent=False 的接口（如群发）只在请求确定未送达时重试，避免重复发送。
+        重试耗尽后返回最后一次的结果，网络错误则抛出异常。
+        """
+        params = dict(kwargs.pop('params', None) or {})
+        refresh_token = False
+        
+        for attempt in range(self.max_retries + 1):
+            if with_token:
+                access_token = self.get_access_token(force_refresh=refresh_token)
+                if not access_token:
+                    return {"errcode": 40001, "errmsg": "获取access_token失败"}
+                params["access_token"] = access_token
+            refresh_token = False
+            is_last = attempt == self.max_retries
+            
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, params=params, timeout=self.timeout, **kwargs)
+                result = response.json()
+            except requests.RequestException as e:
+                elapsed = time.monotonic() - started
+                self.api_seconds += elapsed
+                call_stats.record(name, elapsed, ok=False)
+                retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                if not idempotent:
+                    retryable = isinstance(e, requests.ConnectTimeout)
+                if is_last or not retryable:
+                    raise
+                logger.warning(f"微信接口 {name} 请求失败，准备重试: {str(e)}")
+                time.sleep(self.retry_backoff * 2 ** attempt)
+                continue
+            
+            elapsed = time.monotonic() - started
+            self.api_seconds += elapsed
+            errcode = result.get("errcode", 0) if isinstance(result, dict) else 0
+            call_stats.record(name, elapsed, ok=not errcode)
+            
+            if is_last:
+                return result
+            if with_token and errcode in TOKEN_ERRCODES:
+                logger.warning(f"微信接口 {name} 返回token失效({errcode})，刷新后重试")
+                refresh_token = True
+                continue
+            if errcode in RETRY_ERRCODES:
+                logger.warning(f"微信接口 {name} 返回{errcode}，准备重试")
+                time.sleep(self.retry_backoff * 2 ** attempt)
+                continue
+            return result
+    
+    def get_access_token(self, force_refresh: bool = False) -> str:
+        """获取access_token（多个进程共享，过期前自动刷新）
+
+        force_refresh 用于接口返回token失效时，只有其他进程尚未刷新过才重新获取
+        """
+        stale_token = self.access_token if force_refresh else None
+        self.access_token = self.token_store.get(self.app_id, self._fetch_access_token, stale_token)
+        return self.access_token
+    
+    def _fetch_access_token(self) -> Optional[Tuple[str, int]]:
+        """向微信请求新的access_token"""
         url = f"{self.base_url}/token"
         params = {
             "grant_type": "client_credential",
@@ -29,13 +162,10 @@ class WeChatAPI:
         }
         
         try:
-            response = requests.get(url, params=params)
-            data = response.json()
+            data = self._request("GET", url, "token", with_token=False, params=params)
             
             if "access_token" in data:
-                self.access_token = data["access_token"]
-                self.token_expires_at = time.time() + data.get("expires_in", 7200) - 300
-                return self.access_token
+                return data["access_token"], data.get("expires_in", 7200)
             else:
                 logger.error(f"获取access_token失败: {data}")
                 return None
@@ -44,51 +174,64 @@ class WeChatAPI:
             return None
     
     def upload_image(self, image_path: str) -> Optional[str]:
-        """上传图片获取media_id"""
-        access_token = self.get_access_token()
-        if not access_token:
-            return None
-        
+        """上传图片获取media_id（临时素材，相同内容3天内不重复上传）"""
         url = f"{self.base_url}/media/upload"
-        params = {
-            "access_token": access_token,
-            "type": "image"
-        }
+        params = {"type": "image"}
         
         try:
+            # 先读入内存，重试时可以重新发送
             with open(image_path, 'rb') as f:
-                files = {"media": f}
-                response = requests.post(url, params=params, files=files)
-                data = response.json()
-                
-                if "media_id" in data:
-                    return data["media_id"]
-                else:
-                    logger.error(f"上传图片失败: {data}")
-                    return None
+                content = f.read()
+            
+            digest = content_hash(content)
+            cached = self.media_cache.get(digest, "image")
+            if cached:
+                logger.info(f"图片已上传过，复用media_id: {image_path}")
+                return cached.media_id
+            
+            files = {"media": (os.path.basename(image_path), content)}
+            data = self._request("POST", url, "media/upload", params=params, files=files)
+            
+            if "media_id" in data:
+                self.media_cache.put(digest, "image", media_id=data["media_id"], size=len(content), ttl=TEMP_MEDIA_TTL)
+                return data["media_id"]
+            else:
+                logger.error(f"上传图片失败: {data}")
+                return None
         except Exception as e:
             logger.error(f"上传图片异常: {str(e)}")
             return None
     
+    def upload_content_image(self, content: bytes, filename: str = 'image.jpg') -> Optional[str]:
+        """上传图文消息正文中的图片，返回可在正文中使用的URL（jpg/png，1MB以内）"""
+        url = f"{self.base_url}/media/uploadimg"
+        
+        try:
+            data = self._request("POST", url, "media/uploadimg", files={"media": (filename, content)})
+            
+            if "url" in data:
+                return data["url"]
+            else:
+                logger.error(f"上传正文图片失败: {data}")
+                return None
+        except Exception as e:
+            logger.error(f"上传正文图片异常: {str(e)}")
+            return None
+    
     def upload_news(self, articles: list) -> Optional[str]:
         """上传图文消息"""
-        access_token = self.get_access_token()
-        if not access_token:
-            return None
-        
         url = f"{self.base_url}/material/add_news"
-        params = {"access_token": access_token}
         
         data = {"articles": articles}
         
         try:
-            response = requests.post(
+            result = self._request(
+                "POST",
                 url,
-                params=params,
+                "material/add_news",
                 data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
                 headers={"Content-Type": "application/json; charset=utf-8"}
             )
-            result = response.json()
             
             if "media_id" in result:
                 return result["media_id"]
@@ -101,13 +244,44 @@ class WeChatAPI:
     
     def publish(self, article: Dict) -> Dict:
         """发布文章到公众号"""
-        # 上传封面图
+        return self.publish_batch([article])
+    
+    def publish_batch(self, articles: List[Dict]) -> Dict:
+        """多篇文章合成一条图文消息发布：一次上传、一次群发（最多8篇，第一篇为头条）"""
+        if not articles or len(articles) > MAX_NEWS_ARTICLES:
+            return {"success": False, "message": f"每条图文消息需包含1-{MAX_NEWS_ARTICLES}篇文章"}
+        
+        started = time.monotonic()
+        api_seconds = self.api_seconds
+        
+        # 上传图文消息
+        media_id = self.upload_batch(articles)
+        if not media_id:
+            return {"success": False, "message": "上传图文消息失败"}
+        
+        # 群发消息
+        result = self.send_all(media_id)
+        
+        logger.info(
+            f"发布{len(articles)}篇文章耗时 {time.monotonic() - started:.2f}s，"
+            f"其中微信接口 {self.api_seconds - api_seconds:.2f}s"
+        )
+        return result
+    
+    def upload_batch(self, articles: List[Dict]) -> Optional[str]:
+        """上传封面图和多图文素材，返回素材 media_id（群发前的准备步骤，可以安全重试）"""
+        if not articles or len(articles) > MAX_NEWS_ARTICLES:
+            logger.error(f"每条图文消息需包含1-{MAX_NEWS_ARTICLES}篇文章")
+            return None
+        return self.upload_news([self.build_news_article(article) for article in articles])
+    
+    def build_news_article(self, article: Dict) -> Dict:
+        """构建图文消息中的一篇文章（上传封面图）"""
         cover_media_id = None
         if article.get('cover_image'):
             cover_media_id = self.upload_image(article['cover_image'])
         
-        # 构建图文消息
-        news_article = {
+        return {
             "title": article['title'],
             "author": article.get('author', ''),
             "digest": article.get('digest', ''),
@@ -118,25 +292,10 @@ class WeChatAPI:
             "need_open_comment": 1,
             "only_fans_can_comment": 0
         }
-        
-        # 上传图文消息
-        media_id = self.upload_news([news_article])
-        if not media_id:
-            return {"success": False, "message": "上传图文消息失败"}
-        
-        # 群发消息
-        result = self.send_all(media_id)
-        
-        return result
     
     def send_all(self, media_id: str) -> Dict:
         """群发消息"""
-        access_token = self.get_access_token()
-        if not access_token:
-            return {"success": False, "message": "获取access_token失败"}
-        
         url = f"{self.base_url}/message/mass/sendall"
-        params = {"access_token": access_token}
         
         data = {
             "filter": {
@@ -150,13 +309,15 @@ class WeChatAPI:
         }
         
         try:
-            response = requests.post(
+            # 群发不是幂等操作，只在请求确定未送达时重试
+            result = self._request(
+                "POST",
                 url,
-                params=params,
+                "message/mass/sendall",
+                idempotent=False,
                 data=json.dumps(data),
                 headers={"Content-Type": "application/json"}
             )
-            result = response.json()
             
             if result.get("errcode") == 0:
                 return {
@@ -172,4 +333,32 @@ class WeChatAPI:
                 }
         except Exception as e:
             logger.error(f"群发消息异常: {str(e)}")
-            return {"success": False, "message": f"发布异常: {str(e)}"}
\ No newline at end of file
+            # 只有连接超时能确定请求没有送达，其他异常（如读取超时）时消息可能已经发出
+            return {
+                "success": False,
+                "message": f"发布异常: {str(e)}",
+                "uncertain": not isinstance(e, requests.ConnectTimeout)
+            }
+    
+    def get_article_summary(self, day: str) -> Optional[list]:
+        """获取某天的图文群发每日数据（datacube/getarticlesummary，day格式YYYY-MM-DD）"""
+        url = f"{self.datacube_url}/getarticlesummary"
+        data = {"begin_date": day, "end_date": day}
+        
+        try:
+            result = self._request(
+                "POST",
+                url,
+                "datacube/getarticlesummary",
+                data=json.dumps(data),
+                headers={"Content-Type": "application/json"}
+            )
+            
+            if "list" in result:
+                return result["list"]
+            else:
+                logger.error(f"获取图文统计数据失败: {result}")
+                return None
+        except Exception as e:
+            logger.error(f"获取图文统计数据异常: {str(e)}")
+            return None
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+# 获取新token的函数，返回 (access_token, expires_in) 或 None
+TokenFetcher = Callable[[], Optional[Tuple[str, int]]]
+
+
+class TokenStore:
+    """access_token 共享存储（JSON文件 + 文件锁，gunicorn多个worker共享）
+
+    微信每次获取access_token都会使之前的token在5分钟后失效，且每天有调用次数上限，
+    所以所有进程共用同一个token：进程内先查内存，过期前 refresh_margin 秒内
+    视为需要刷新；刷新时先拿进程内的锁再拿文件锁，拿到锁后重新读文件，
+    其他进程已经刷新过就直接使用，保证同一时刻只有一个请求去换token。
+    """
+
+    def __init__(self, path: str, refresh_margin: int = 300):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Dict] = {}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    def get(self, app_id: str, fetch: TokenFetcher, stale_token: Optional[str] = None) -> Optional[str]:
+        """返回可用的token；stale_token 为被接口拒绝的token，与当前token相同时强制刷新"""
+        app_id = str(app_id)
+        token = self._fresh(self._tokens.get(app_id), stale_token)
+        if token:
+            return token
+
+        with self._lock:
+            token = self._fresh(self._tokens.get(app_id), stale_token)
+            if token:
+                return token
+
+            with self._file_lock():
+                entry = self._read().get(app_id)
+                token = self._fresh(entry, stale_token)
+                if token:
+                    self._tokens[app_id] = entry
+                    return token
+
+                fetched = fetch()
+                if not fetched:
+                    return None
+
+                access_token, expires_in = fetched
+                entry = {'access_token': access_token, 'expires_at': time.time() + int(expires_in)}
+                self._write(app_id, entry)
+                self._tokens[app_id] = entry
+                logger.info(f"已刷新access_token，有效期 {expires_in}s")
+                return access_token
+
+    def _fresh(self, entry: Optional[Dict], stale_token: Optional[str]) -> Optional[str]:
+        if not entry or entry['access_token'] == stale_token:
+            return None
+        if time.time() >= entry['expires_at'] - self.refresh_margin:
+            return None
+        return entry['access_token']
+
+    def _file_lock(self):
+        return FileLock(f"{self.path}.lock")
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, app_id: str, entry: Dict):
+        data = self._read()
+        data[app_id] = entry
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        # token相当于密钥，文件只允许当前用户读写
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+_stores: Dict[str, TokenStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_token_store(path: str, refresh_margin: int = 300) -> TokenStore:
+    """同一路径在进程内共用一个存储实例"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TokenStore(path, refresh_margin)
+        return _stores[path]
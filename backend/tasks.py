@@ -1,15 +1,26 @@
 from app import scheduler, db
-from models import PublishSchedule, Article
+from models import Article
 from services.llm_service import LLMService
-from services.wechat_api import WeChatAPI
 from services.crawler import ArticleCrawler
+from services.crawl_state import CrawlState
+from services.near_duplicate import index_stored_articles
 from services.markdown_converter import MarkdownToWeChatHTML
-from datetime import datetime, timedelta
+from services.scheduler_lock import ExclusiveJobRunner
+from services.metrics_ingestion import MetricsIngestion
+from services.publish_dispatcher import PublishDispatcher
+from services.article_pipeline import stage_upcoming_schedules
+from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+# gunicorn 每个worker都有自己的调度器，通过数据库锁保证每次触发只执行一次
+# 各worker的 interval 触发时间互相错开，slot_seconds 须与任务周期一致（默认60秒对应每分钟的任务），
+# 否则周期内每个worker都能认领到不同的时间片；每天的 cron 任务按天认领
+runner = ExclusiveJobRunner(scheduler.app)
+
 @scheduler.task('cron', id='auto_generate', hour=9, minute=0)
+@runner.exclusive('auto_generate', slot_seconds=86400)
 def auto_generate_article():
     """每天早上9点自动生成文章"""
     try:
@@ -46,78 +57,130 @@ def auto_generate_article():
         
     except Exception as e:
         logger.error(f"自动生成文章失败: {str(e)}")
+        raise
+
+# 每条定时任务按自己的时间精确触发；巡检负责把即将到期的任务注册到触发器，并补发过期任务
+dispatcher = PublishDispatcher(scheduler)
 
-@scheduler.task('cron', id='auto_publish', hour='*/4')
-def auto_publish_scheduled():
-    """每4小时检查并发布预定的文章"""
+@scheduler.task('interval', id='arm_publish_schedules', minutes=1)
+@runner.exclusive('arm_publish_schedules', lock_ttl=120)
+def arm_publish_schedules():
+    """每分钟注册即将到期的定时发布"""
     try:
-        now = datetime.now()
-        schedules = PublishSchedule.query.filter(
-            PublishSchedule.scheduled_time <= now,
-            PublishSchedule.status == 'pending'
-        ).all()
+        dispatcher.arm_upcoming()
         
-        wechat = WeChatAPI()
-        
-        for schedule in schedules:
-            article = schedule.article
-            if article.status == 'approved':
-                result = wechat.publish(article.to_dict())
-                
-                if result['success']:
-                    article.status = 'published'
-                    article.published_at = now
-                    schedule.status = 'completed'
-                    logger.info(f"成功发布文章: {article.title}")
-                else:
-                    schedule.status = 'failed'
-                    logger.error(f"发布失败: {article.title} - {result['message']}")
+    except Exception as e:
+        logger.error(f"注册定时发布失败: {str(e)}")
+        raise
+
+@scheduler.task('interval', id='stage_publish_schedules', minutes=1)
+@runner.exclusive('stage_publish_schedules', lock_ttl=300)
+def stage_publish_schedules():
+    """每分钟预先上传即将到期的定时发布素材，到点只需群发"""
+    try:
+        stage_upcoming_schedules()
         
-        db.session.commit()
+    except Exception as e:
+        logger.error(f"预上传定时发布素材失败: {str(e)}")
+        raise
+
+@scheduler.task('interval', id='index_crawled_simhash', minutes=10)
+@runner.exclusive('index_crawled_simhash', slot_seconds=600)
+def index_crawled_simhash():
+    """每10分钟给已有文章补算近似重复检测用的SimHash（只有没改写过的文章能补算），每次一批，补完后为空操作"""
+    if not Config.CRAWLER_DEDUP_ENABLED:
+        return
+    try:
+        indexed = index_stored_articles()
+        if indexed:
+            logger.info(f"补算了{indexed}篇已有文章的SimHash")
         
     except Exception as e:
-        logger.error(f"自动发布失败: {str(e)}")
+        logger.error(f"补算SimHash失败: {str(e)}")
+        raise
+
+@runner.exclusive('arm_publish_schedules_startup', lock_ttl=120)
+def arm_publish_schedules_on_startup():
+    """启动时补发停机期间到期的任务
+
+    每个gunicorn worker导入本模块时都会调用，只有拿到本时间片的worker注册触发器，
+    与每分钟的巡检一样由一个进程负责；即使多个进程都注册了，publish_due_schedules
+    按行认领，同一条任务也只会发布一次。
+    """
+    dispatcher.arm_upcoming()
+
+try:
+    arm_publish_schedules_on_startup()
+except Exception as e:
+    logger.error(f"补发定时任务失败: {str(e)}")
 
 @scheduler.task('cron', id='crawl_articles', hour=6, minute=0)
+@runner.exclusive('crawl_articles', slot_seconds=86400)
 def daily_crawl():
     """每天早上6点爬取指定公众号文章"""
     try:
         # 从配置中获取要爬取的公众号列表
         sources = get_crawl_sources()
-        crawler = ArticleCrawler()
+        # 增量爬取：已爬取的链接不再请求，内容重复或相近的文章不再改写
+        crawl_state = CrawlState() if Config.CRAWLER_INCREMENTAL else None
+        crawler = ArticleCrawler(crawl_state=crawl_state)
         llm = LLMService()
         
-        for source in sources:
-            articles = crawler.crawl_wechat_article(source['url'])
+        # 不同来源并发爬取，同一主机由爬虫内部限速
+        articles = crawler.crawl_sources(sources)
+        if crawl_state:
+            articles, unchanged = crawl_state.filter_unchanged(articles)
+            crawl_state.record(unchanged)
+            logger.info(f"增量爬取跳过 {crawl_state.skipped_urls} 个已爬取链接、{len(unchanged)} 篇重复的文章")
+        
+        rows = []
+        for article_data in articles:
+            # 使用LLM改写
+            rewritten_content = llm.rewrite_article(
+                article_data['content'],
+                style='creative'
+            )
             
-            for article_data in articles:
-                # 使用LLM改写
-                rewritten_content = llm.rewrite_article(
-                    article_data['content'],
-                    style='creative'
-                )
-                
-                # 转换格式
-                converter = MarkdownToWeChatHTML()
-                html_content = converter.convert(rewritten_content)
-                
-                # 保存到数据库
-                article = Article(
-                    title=article_data['title'],
-                    content=rewritten_content,
-                    markdown_content=rewritten_content,
-                    html_content=html_content,
-                    source_url=article_data['source_url'],
-                    images=article_data.get('images', []),
-                    status='draft'
-                )
-                db.session.add(article)
+            # 转换格式
+            converter = MarkdownToWeChatHTML()
+            html_content = converter.convert(rewritten_content)
+            
+            rows.append({
+                'title': article_data['title'],
+                'content': rewritten_content,
+                'markdown_content': rewritten_content,
+                'html_content': html_content,
+                'source_url': article_data['source_url'],
+                'images': article_data.get('images', []),
+                'status': 'draft'
+            })
         
-        db.session.commit()
-        logger.info(f"爬取并改写了{len(articles)}篇文章")
+        # 整批一个事务保存，单篇失败不影响其他文章
+        saved, failed = Article.bulk_create(rows)
+        for item in failed:
+            logger.error(f"保存文章失败: {item['title']} - {item['error']}")
+        if crawl_state:
+            failed_indexes = {item['index'] for item in failed}
+            saved_sources = [data for index, data in enumerate(articles) if index not in failed_indexes]
+            crawl_state.record([
+                {**article_data, 'article_id': article.id}
+                for article, article_data in zip(saved, saved_sources)
+            ])
+        logger.info(f"爬取并改写了{len(saved)}篇文章")
         
     except Exception as e:
         logger.error(f"爬取文章失败: {str(e)}")
+        raise
+
+@scheduler.task('cron', id='ingest_metrics', hour=10, minute=0)
+@runner.exclusive('ingest_metrics', slot_seconds=86400)
+def ingest_metrics():
+    """每天上午10点拉取公众号图文数据（微信后台约在次日上午更新前一天的数据）"""
+    try:
+        MetricsIngestion().ingest(Config.METRICS_LOOKBACK_DAYS)
+    except Exception as e:
+        logger.error(f"拉取图文数据失败: {str(e)}")
+        raise
 
 def get_trending_topics():
     """获取热门话题"""
@@ -0,0 +1,196 @@
+"""爬虫页面解析压测：比较解析器后端和部分解析的耗时与峰值内存
+
+    python -m tools.bench_parse --size-kb 1500 --repeat 5
+    python -m tools.bench_parse --generate fixtures/      # 把合成页面保存下来
+    python -m tools.bench_parse --fixtures fixtures/      # 使用保存的页面
+
+页面按文件名前缀区分类型：wechat_*.html（微信文章）、page_*.html（普通网页）、
+zhihu_*.html（知乎文章）。不指定 --fixtures 时使用内置的合成页面，结构与真实页面一致：
+大段内联脚本和样式、导航、推荐列表、评论区，正文只占页面的一小部分。
+每种组合都会和 html.parser 完整解析的提取结果比对，结果不一致时标记出来。
+峰值内存由 tracemalloc 统计，只包含Python对象（lxml 在C层的临时内存不计入）。
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+PAGE_TYPES = ('wechat', 'page', 'zhihu')
+
+
+def _filler(size_kb: int) -> Tuple[str, List[str]]:
+    """页面中与正文无关的部分：内联脚本/样式 + 大量嵌套的推荐和评论块"""
+    script = '<script>var data = ' + json.dumps({'k%d' % i: 'v' * 40 for i in range(size_kb * 4)}) + ';</script>'
+    blocks = []
+    index = 0
+    while sum(len(block) for block in blocks) < size_kb * 512:
+        blocks.append(
+            f'<div class="recommend-item"><a href="/item/{index}"><img src="/thumb/{index}.jpg">'
+            f'<span class="item-title">推荐内容 {index}</span></a>'
+            f'<div class="comment"><span class="user">用户{index}</span><p>评论内容 {index} ' + '很好' * 20 +
+            '</p></div></div>'
+        )
+        index += 1
+    return script, blocks
+
+
+def _paragraphs(count: int) -> str:
+    return ''.join(
+        f'<p>这是正文的第{i}段，包含一些<strong>重点</strong>和<a href="/link/{i}">链接</a>。' + '正文内容。' * 30 +
+        f'</p><p><img data-src="https://example.com/img/{i}.jpg"></p>'
+        for i in range(count)
+    )
+
+
+def synthetic_pages(size_kb: int) -> Dict[str, str]:
+    script, blocks = _filler(size_kb)
+    noise = ''.join(blocks)
+    quarter = ''.join(blocks[:len(blocks) // 4])
+    body = _paragraphs(40)
+    return {
+        'wechat_synthetic.html': (
+            f'<html><head><title>公众号</title><style>{"p{margin:0}" * 500}</style>{script}</head><body>'
+            f'<div id="js_top_ad_area">{noise}</div>'
+            '<div id="page-content"><div class="rich_media_inner">'
+            '<h1 class="rich_media_title" id="activity-name">  合成的微信文章标题  </h1>'
+            '<div class="rich_media_meta_list"><span class="rich_media_meta rich_media_meta_text">作者</span>'
+            '<em id="publish_time" class="rich_media_meta rich_media_meta_text">2024-01-01</em></div>'
+            f'<div class="rich_media_content" id="js_content">{body}</div>'
+            f'</div></div><div id="js_pc_qr_code">{noise}</div>{script}</body></html>'
+        ),
+        'page_synthetic.html': (
+            f'<html><head><title>合成网页标题 - 站点名</title>{script}</head><body>'
+            f'<header><nav>{quarter}</nav></header>'
+            '<main><div class="sidebar">' + noise + '</div>'
+            f'<article><h1>合成的博客文章标题</h1><div class="post-content">{body}</div></article>'
+            f'</main><footer>{quarter}</footer>{script}</body></html>'
+        ),
+        'zhihu_synthetic.html': (
+            f'<html><head><title>知乎</title>{script}</head><body><div id="root">'
+            f'<div class="AppHeader">{quarter}</div>'
+            '<article class="Post-Main"><header class="Post-Header"><h1 class="Post-Title">合成的知乎专栏文章</h1></header>'
+            f'<div class="Post-RichTextContainer"><div class="RichText ztext Post-RichText">{body}</div></div>'
+            f'</article><div class="Recommendations-Main">{noise}</div></div>{script}</body></html>'
+        )
+    }
+
+
+def load_fixtures(directory: str) -> Dict[str, str]:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        name = os.path.basename(path)
+        if name.split('_')[0] in PAGE_TYPES:
+            with open(path, 'rb') as f:
+                pages[name] = f.read().decode('utf-8', errors='replace')
+    return pages
+
+
+def extractor(crawler, name: str) -> Callable[[str], Dict]:
+    page_type = name.split('_')[0]
+    if page_type == 'wechat':
+        return lambda html: crawler._parse_wechat_article(html, 'https://mp.weixin.qq.com/s/bench')
+    if page_type == 'zhihu':
+        return lambda html: crawler._parse_zhihu_content(html, 'https://zhuanlan.zhihu.com/p/1', '作者')
+    return lambda html: crawler._parse_single_page(html, 'https://example.com/post/1')
+
+
+def comparable(result: Dict) -> Dict:
+    """去掉每次都会变化的字段"""
+    if not result:
+        return {}
+    result = dict(result)
+    result['meta'] = {k: v for k, v in (result.get('meta') or {}).items() if k != 'crawled_time'}
+    return result
+
+
+def measure(func: Callable[[str], Dict], html: str, repeat: int) -> Dict:
+    func(html)  # 预热
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(html)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    result = func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'min_ms': round(min(timings) * 1000, 1),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+        'result': comparable(result)
+    }
+
+
+def available_parsers() -> List[str]:
+    parsers = ['html.parser']
+    if importlib.util.find_spec('lxml'):
+        parsers.append('lxml')
+    return parsers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='爬虫页面解析压测')
+    parser.add_argument('--fixtures', help='保存的页面目录（wechat_*.html / page_*.html / zhihu_*.html）')
+    parser.add_argument('--generate', metavar='DIR', help='把合成页面写入目录后退出')
+    parser.add_argument('--size-kb', type=int, default=1500, help='合成页面中与正文无关部分的大致大小')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    if args.generate:
+        os.makedirs(args.generate, exist_ok=True)
+        for name, html in synthetic_pages(args.size_kb).items():
+            with open(os.path.join(args.generate, name), 'w', encoding='utf-8') as f:
+                f.write(html)
+            print(f"{os.path.join(args.generate, name)}  {len(html.encode('utf-8')) // 1024} KB")
+        return
+
+    pages = load_fixtures(args.fixtures) if args.fixtures else synthetic_pages(args.size_kb)
+    if not pages:
+        parser.error('没有找到页面')
+
+    from services.crawler import ArticleCrawler
+    crawler = ArticleCrawler()
+
+    report = []
+    for name, html in pages.items():
+        baseline = None
+        for parser_name in available_parsers():
+            for partial in (False, True):
+                crawler.html_parser = parser_name
+                crawler.partial_parsing = partial
+                stats = measure(extractor(crawler, name), html, args.repeat)
+                result = stats.pop('result')
+                if baseline is None:
+                    baseline = result
+                report.append({
+                    'page': name,
+                    'size_kb': len(html.encode('utf-8')) // 1024,
+                    'parser': parser_name,
+                    'partial': partial,
+                    'same_result': result == baseline,
+                    **stats
+                })
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print(f"{'页面':<26}{'KB':>7}  {'解析器':<12}{'部分解析':<8}{'中位ms':>9}{'最快ms':>9}{'峰值MB':>9}  结果")
+    for row in report:
+        print(f"{row['page']:<26}{row['size_kb']:>7}  {row['parser']:<12}{'是' if row['partial'] else '否':<8}"
+              f"{row['median_ms']:>9}{row['min_ms']:>9}{row['peak_mb']:>9}  "
+              f"{'一致' if row['same_result'] else '不一致'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""发布流程压测：在本地模拟的微信接口上测量发布吞吐量和尾延迟
+
+    python -m tools.bench_publish --articles 40 --slots 5 --images 3 \\
+        --latency default=lognormal:80:0.5 --error message/mass/sendall=-1:0.05
+
+--mode batch   按时段合并为多图文消息发布（publish_due_schedules，定时任务的实际路径）
+--mode single  逐篇发布（publish_article，可用 --concurrency 并发）
+
+使用临时目录中的SQLite数据库和token文件，不影响 data/ 下的数据。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from tools.wechat_stub import StubState, parse_errors, parse_latency, start_in_thread
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def create_app(workdir: str):
+    from flask import Flask
+    from models import db
+
+    app = Flask('bench_publish')
+    app.config.from_object('config.Config')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed(args, stub_url: str) -> List[int]:
+    """创建待发布的文章和定时任务，返回文章ID"""
+    from models import db, Article, PublishSchedule
+
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    article_ids = []
+    for index in range(args.articles):
+        images = ''.join(
+            f'<p><img src="{stub_url}/_stub/image?id={0 if args.shared_images else index}-{k}"></p>'
+            for k in range(args.images)
+        )
+        article = Article(
+            title=f'压测文章 {index + 1}',
+            content=f'压测文章 {index + 1}',
+            html_content=f'<h1>压测文章 {index + 1}</h1>{images}<p>{"正文内容。" * 200}</p>',
+            status='approved'
+        )
+        db.session.add(article)
+        db.session.flush()
+        slot = index % max(1, args.slots)
+        db.session.add(PublishSchedule(
+            article_id=article.id,
+            scheduled_time=now - timedelta(hours=slot + 1) + timedelta(minutes=index % 30)
+        ))
+        article_ids.append(article.id)
+    db.session.commit()
+    return article_ids
+
+
+def run_batch(app, publish_latencies: List[float]):
+    from services.article_pipeline import publish_due_schedules
+    from services.wechat_api import WeChatAPI
+
+    class TimedWeChatAPI(WeChatAPI):
+        """记录每条消息从上传素材到群发完成的耗时（上传失败时不调用群发，按上传耗时计）"""
+        started = None
+
+        def upload_batch(self, articles):
+            self.started = time.monotonic()
+            media_id = super().upload_batch(articles)
+            if not media_id:
+                publish_latencies.append(time.monotonic() - self.started)
+            return media_id
+
+        def send_all(self, media_id):
+            try:
+                return super().send_all(media_id)
+            finally:
+                if self.started is not None:
+                    publish_latencies.append(time.monotonic() - self.started)
+                    self.started = None
+
+    with app.app_context():
+        publish_due_schedules(wechat=TimedWeChatAPI())
+
+
+def run_single(app, article_ids: List[int], concurrency: int, publish_latencies: List[float]):
+    from models import db, Article, PublishSchedule
+    from services.article_pipeline import publish_article
+    from services.wechat_api import WeChatAPI
+
+    lock = threading.Lock()
+
+    def publish_one(article_id: int):
+        with app.app_context():
+            article = db.session.get(Article, article_id)
+            started = time.monotonic()
+            result = publish_article(article, WeChatAPI())
+            elapsed = time.monotonic() - started
+            PublishSchedule.query.filter_by(article_id=article_id).update(
+                {'status': 'completed' if result['success'] else 'failed'}
+            )
+            db.session.commit()
+            with lock:
+                publish_latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(publish_one, article_ids))
+
+
+def summarize(app, state: StubState, wall: float, publish_latencies: List[float]) -> Dict:
+    from models import db, Article
+    from services.wechat_api import call_stats
+
+    with app.app_context():
+        published = Article.query.filter_by(status='published').count()
+        messages = db.session.query(db.func.count(db.distinct(Article.wechat_msg_data_id))).scalar()
+        total = Article.query.count()
+
+    client = call_stats.snapshot()
+    wechat_seconds = sum(stats['total_seconds'] for stats in client.values())
+    return {
+        'articles': total,
+        'published': published,
+        'failed': total - published,
+        'messages': messages,
+        'wall_seconds': round(wall, 3),
+        'articles_per_second': round(published / wall, 2) if wall else 0,
+        'publish_call': {
+            'count': len(publish_latencies),
+            'p50_ms': round(percentile(publish_latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(publish_latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(publish_latencies, 0.99) * 1000, 1),
+            'max_ms': round(percentile(publish_latencies, 1.0) * 1000, 1)
+        },
+        'wechat_seconds': round(wechat_seconds, 3),
+        'client': client,
+        'stub': state.snapshot()['endpoints']
+    }
+
+
+def print_report(report: Dict):
+    call = report['publish_call']
+    print(f"文章 {report['articles']} 篇: 发布 {report['published']}, 失败 {report['failed']}, "
+          f"群发消息 {report['messages']} 条")
+    print(f"总耗时 {report['wall_seconds']:.2f}s, 吞吐 {report['articles_per_second']} 篇/s, "
+          f"微信接口累计 {report['wechat_seconds']:.2f}s（含并发）")
+    print(f"单次发布调用 {call['count']} 次: p50 {call['p50_ms']}ms  p95 {call['p95_ms']}ms  "
+          f"p99 {call['p99_ms']}ms  max {call['max_ms']}ms")
+    print(f"\n{'接口':<30}{'请求':>8}{'注入错误':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}")
+    for name, stats in sorted(report['stub'].items()):
+        print(f"{name:<30}{stats['requests']:>8}{stats['injected']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发布流程压测')
+    parser.add_argument('--articles', type=int, default=40)
+    parser.add_argument('--slots', type=int, default=5, help='定时任务分布在几个时段')
+    parser.add_argument('--images', type=int, default=0, help='每篇文章正文中的外链图片数')
+    parser.add_argument('--shared-images', action='store_true', help='所有文章使用相同的图片')
+    parser.add_argument('--mode', choices=['batch', 'single'], default='batch')
+    parser.add_argument('--concurrency', type=int, default=1, help='single 模式的并发数')
+    parser.add_argument('--latency', action='append', metavar='ENDPOINT=DIST')
+    parser.add_argument('--error', action='append', metavar='ENDPOINT=ERRCODE:RATE')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    state = StubState(parse_latency(args.latency), parse_errors(args.error), seed=args.seed)
+    server = start_in_thread(state=state)
+    stub_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # 必须在导入 config 之前设置
+    workdir = tempfile.mkdtemp(prefix='bench_publish_')
+    os.environ.update({
+        'WECHAT_API_BASE': stub_url,
+        'WECHAT_APP_ID': 'bench',
+        'WECHAT_APP_SECRET': 'bench',
+        'WECHAT_TOKEN_PATH': os.path.join(workdir, 'wechat_token.json')
+    })
+
+    app = create_app(workdir)
+    with app.app_context():
+        article_ids = seed(args, stub_url)
+
+    state.reset_stats()
+    publish_latencies: List[float] = []
+    started = time.monotonic()
+    if args.mode == 'batch':
+        run_batch(app, publish_latencies)
+    else:
+        run_single(app, article_ids, args.concurrency, publish_latencies)
+    wall = time.monotonic() - started
+
+    report = summarize(app, state, wall, publish_latencies)
+    report.update({'mode': args.mode, 'workdir': workdir})
+    server.shutdown()
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
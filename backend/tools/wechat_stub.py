@@ -0,0 +1,449 @@
+"""微信公众号接口本地模拟服务
+
+用于开发和压测时替代 api.weixin.qq.com：
+
+    python -m tools.wechat_stub --port 9000 \\
+        --latency default=lognormal:80:0.5 --latency message/mass/sendall=uniform:200:600 \\
+        --error message/mass/sendall=45009:0.05 --error '*=-1:0.01'
+    WECHAT_API_BASE=http://127.0.0.1:9000 python app.py
+
+实现的接口：token、media/upload、media/uploadimg、material/add_news、
+message/mass/sendall、datacube/getarticlesummary。接口名与 WeChatAPI 的耗时统计一致。
+
+管理接口（不计入统计）：
+    GET  /_stub/stats     各接口请求数、注入的错误数、耗时分布
+    POST /_stub/reset     清空统计
+    POST /_stub/config    运行时修改 {"latency": {...}, "errors": {...}, "token_ttl": 7200}
+    POST /_stub/messages  注册已群发的消息 {msg_data_id, titles, sent_at}，供数据统计接口返回
+    GET  /_stub/image     返回一张PNG图片（?id= 区分内容），用于测试正文图片转存
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# 旧token在刷新后仍可使用的时间（与微信一致）
+TOKEN_GRACE_SECONDS = 300
+
+
+class LatencyModel:
+    """接口耗时分布，单位毫秒
+
+    fixed:50 | uniform:20:200 | normal:100:30 | lognormal:80:0.5（中位数, sigma）
+    """
+
+    def __init__(self, spec: str = 'fixed:0'):
+        self.spec = spec
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"未知的耗时分布: {spec}")
+
+    def sample(self) -> float:
+        """返回本次请求的耗时（秒）"""
+        if self.kind == 'fixed':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = random.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            ms = random.gauss(self.params[0], self.params[1])
+        else:
+            ms = random.lognormvariate(0, self.params[1]) * self.params[0]
+        return max(0.0, ms) / 1000
+
+
+class StubState:
+    """模拟服务的共享状态：token、素材、消息、故障配置和请求统计"""
+
+    def __init__(self, latency: Optional[Dict[str, str]] = None,
+                 errors: Optional[Dict[str, List[Tuple[int, float]]]] = None,
+                 token_ttl: int = 7200, seed: Optional[int] = None):
+        self.lock = threading.Lock()
+        self.tokens: Dict[str, float] = {}
+        self.messages: Dict[str, Dict] = {}
+        self.news: Dict[str, Dict] = {}
+        self.latency: Dict[str, LatencyModel] = {}
+        self.errors: Dict[str, List[Tuple[int, float]]] = {}
+        self.token_ttl = token_ttl
+        self.random = random.Random(seed)
+        self.configure(latency=latency, errors=errors)
+        self.reset_stats()
+
+    def configure(self, latency: Optional[Dict[str, str]] = None,
+                  errors: Optional[Dict[str, List[Tuple[int, float]]]] = None,
+                  token_ttl: Optional[int] = None):
+        with self.lock:
+            if latency is not None:
+                self.latency = {name: LatencyModel(spec) for name, spec in latency.items()}
+            if errors is not None:
+                self.errors = {name: [(int(code), float(rate)) for code, rate in rules]
+                               for name, rules in errors.items()}
+            if token_ttl is not None:
+                self.token_ttl = int(token_ttl)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = defaultdict(lambda: {'requests': 0, 'injected': 0, 'errors': defaultdict(int), 'latencies': []})
+            self.started_at = time.time()
+
+    def delay_for(self, name: str) -> float:
+        with self.lock:
+            model = self.latency.get(name) or self.latency.get('default')
+        return model.sample() if model else 0.0
+
+    def injected_error(self, name: str) -> Optional[int]:
+        """按配置的概率返回要注入的错误码"""
+        with self.lock:
+            rules = self.errors.get(name, []) + self.errors.get('*', [])
+            for code, rate in rules:
+                if self.random.random() < rate:
+                    return code
+        return None
+
+    def record(self, name: str, seconds: float, errcode: Optional[int], injected: bool = False):
+        with self.lock:
+            stats = self.stats[name]
+            stats['requests'] += 1
+            stats['latencies'].append(seconds)
+            if errcode:
+                stats['errors'][errcode] += 1
+            if injected:
+                stats['injected'] += 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            result = {'elapsed': round(time.time() - self.started_at, 3), 'endpoints': {}}
+            for name, stats in self.stats.items():
+                latencies = sorted(stats['latencies'])
+                result['endpoints'][name] = {
+                    'requests': stats['requests'],
+                    'injected': stats['injected'],
+                    'errors': dict(stats['errors']),
+                    'p50_ms': _percentile_ms(latencies, 0.50),
+                    'p95_ms': _percentile_ms(latencies, 0.95),
+                    'p99_ms': _percentile_ms(latencies, 0.99),
+                    'max_ms': _percentile_ms(latencies, 1.0)
+                }
+            return result
+
+    def issue_token(self) -> str:
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            # 新token生效后，旧token只在短时间内继续有效
+            for old_token, expires_at in self.tokens.items():
+                self.tokens[old_token] = min(expires_at, now + TOKEN_GRACE_SECONDS)
+            self.tokens[token] = now + self.token_ttl
+        return token
+
+    def check_token(self, query: Dict) -> bool:
+        token = (query.get('access_token') or [''])[0]
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def add_message(self, message: Dict) -> Dict:
+        message = {
+            'msg_data_id': str(message.get('msg_data_id') or uuid.uuid4().int % 10 ** 10),
+            'titles': list(message.get('titles') or []),
+            'sent_at': message.get('sent_at') or date.today().isoformat()
+        }
+        with self.lock:
+            self.messages[message['msg_data_id']] = message
+        return message
+
+
+def _percentile_ms(latencies: List[float], fraction: float) -> Optional[float]:
+    if not latencies:
+        return None
+    index = min(len(latencies) - 1, int(len(latencies) * fraction))
+    return round(latencies[index] * 1000, 1)
+
+
+def _metric(*parts) -> int:
+    """由消息和日期得到确定的伪随机数"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _png(seed: str, size: int = 16) -> bytes:
+    """生成一张纯色PNG，颜色由 seed 决定"""
+    r, g, b = bytes.fromhex(hashlib.md5(seed.encode()).hexdigest()[:6])
+    raw = b''.join(b'\x00' + bytes((r, g, b)) * size for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+INVALID_TOKEN = (200, {'errcode': 40001, 'errmsg': 'invalid credential, access_token is invalid or not latest'})
+
+ERROR_MESSAGES = {
+    -1: 'system error',
+    40001: 'invalid credential, access_token is invalid or not latest',
+    42001: 'access_token expired',
+    45009: 'reach max api daily quota limit',
+    45011: 'api minute-quota reach limit',
+}
+
+
+def token(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not (query.get('appid') and query.get('secret')):
+        return 200, {'errcode': 40013, 'errmsg': 'invalid appid'}
+    return 200, {'access_token': state.issue_token(), 'expires_in': state.token_ttl}
+
+
+def article_summary(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not state.check_token(query):
+        return INVALID_TOKEN
+
+    day = body.get('begin_date', '')
+    with state.lock:
+        messages = [m for m in state.messages.values() if m['sent_at'] <= day]
+
+    items = []
+    for message in messages:
+        for index, title in enumerate(message['titles'], start=1):
+            msgid = f"{message['msg_data_id']}_{index}"
+            views = _metric(msgid, day) % 5000
+            items.append({
+                'ref_date': day,
+                'msgid': msgid,
+                'title': title,
+                'int_page_read_user': views * 4 // 5,
+                'int_page_read_count': views,
+                'ori_page_read_user': views // 20,
+                'ori_page_read_count': views // 15,
+                'share_user': views // 50,
+                'share_count': views // 40,
+                'add_to_fav_user': views // 30,
+                'add_to_fav_count': views // 25
+            })
+    return 200, {'list': items}
+
+
+def upload_media(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not state.check_token(query):
+        return INVALID_TOKEN
+    return 200, {'type': (query.get('type') or ['image'])[0], 'media_id': uuid.uuid4().hex, 'created_at': int(time.time())}
+
+
+def upload_content_image(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not state.check_token(query):
+        return INVALID_TOKEN
+    return 200, {'url': f"http://mmbiz.qpic.cn/mmbiz_jpg/{uuid.uuid4().hex}/0"}
+
+
+def add_news(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not state.check_token(query):
+        return INVALID_TOKEN
+    articles = body.get('articles') or []
+    if not 1 <= len(articles) <= 8:
+        return 200, {'errcode': 45008, 'errmsg': 'article size out of limit'}
+    media_id = uuid.uuid4().hex
+    with state.lock:
+        state.news[media_id] = {'titles': [article.get('title', '') for article in articles]}
+    return 200, {'media_id': media_id}
+
+
+def send_all(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    if not state.check_token(query):
+        return INVALID_TOKEN
+    media_id = (body.get('mpnews') or {}).get('media_id')
+    with state.lock:
+        news = state.news.get(media_id)
+    if news is None:
+        return 200, {'errcode': 40007, 'errmsg': 'invalid media_id'}
+    # 群发的消息可以通过 getarticlesummary 查询数据
+    message = state.add_message({'titles': news['titles']})
+    return 200, {'errcode': 0, 'errmsg': 'send job submission success',
+                 'msg_id': _metric(message['msg_data_id']) % 10 ** 9, 'msg_data_id': int(message['msg_data_id'])}
+
+
+def register_messages(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    return 200, {'errcode': 0, 'message': state.add_message(body)}
+
+
+def stub_stats(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    return 200, state.snapshot()
+
+
+def stub_reset(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    state.reset_stats()
+    return 200, {'errcode': 0}
+
+
+def stub_config(state: StubState, query: Dict, body: Dict) -> Tuple[int, Dict]:
+    try:
+        state.configure(latency=body.get('latency'), errors=body.get('errors'), token_ttl=body.get('token_ttl'))
+    except (TypeError, ValueError) as e:
+        return 400, {'errcode': 400, 'errmsg': str(e)}
+    return 200, {'errcode': 0}
+
+
+# (方法, 路径) -> 处理函数
+ROUTES: Dict[Tuple[str, str], Callable] = {
+    ('GET', '/cgi-bin/token'): token,
+    ('POST', '/cgi-bin/media/upload'): upload_media,
+    ('POST', '/cgi-bin/media/uploadimg'): upload_content_image,
+    ('POST', '/cgi-bin/material/add_news'): add_news,
+    ('POST', '/cgi-bin/message/mass/sendall'): send_all,
+    ('POST', '/datacube/getarticlesummary'): article_summary,
+    ('GET', '/_stub/stats'): stub_stats,
+    ('POST', '/_stub/reset'): stub_reset,
+    ('POST', '/_stub/config'): stub_config,
+    ('POST', '/_stub/messages'): register_messages,
+}
+
+
+def endpoint_name(path: str) -> str:
+    """/cgi-bin/message/mass/sendall -> message/mass/sendall，与 WeChatAPI 的统计名一致"""
+    path = path.lstrip('/')
+    return path[len('cgi-bin/'):] if path.startswith('cgi-bin/') else path
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+    routes: Dict[Tuple[str, str], Callable] = ROUTES
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method: str):
+        started = time.monotonic()
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        if method == 'GET' and parsed.path == '/_stub/image':
+            self._send_bytes(200, _png((query.get('id') or ['0'])[0]), 'image/png')
+            return
+
+        handler = self.routes.get((method, parsed.path))
+        if handler is None:
+            self._send(404, {'errcode': 404, 'errmsg': 'not found'})
+            return
+
+        body = {}
+        if raw and self.headers.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(raw.decode('utf-8'))
+
+        if parsed.path.startswith('/_stub/'):
+            status, payload = handler(self.state, query, body)
+            self._send(status, payload)
+            return
+
+        name = endpoint_name(parsed.path)
+        delay = self.state.delay_for(name)
+        if delay:
+            time.sleep(delay)
+
+        errcode = self.state.injected_error(name)
+        injected = errcode is not None
+        if injected:
+            status, payload = 200, {'errcode': errcode, 'errmsg': ERROR_MESSAGES.get(errcode, 'injected error')}
+        else:
+            status, payload = handler(self.state, query, body)
+            errcode = payload.get('errcode') or None
+
+        self.state.record(name, time.monotonic() - started, errcode, injected)
+        self._send(status, payload)
+
+    def _send(self, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self._send_bytes(status, data, 'application/json; charset=utf-8')
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def make_server(host: str = '127.0.0.1', port: int = 9000, state: StubState = None) -> ThreadingHTTPServer:
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state or StubState()})
+    return StubServer((host, port), handler)
+
+
+def start_in_thread(host: str = '127.0.0.1', port: int = 0, state: StubState = None) -> ThreadingHTTPServer:
+    """在后台线程中启动（port=0 时自动分配端口），压测脚本使用"""
+    server = make_server(host, port, state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_latency(values: List[str]) -> Dict[str, str]:
+    """['default=fixed:50', 'message/mass/sendall=uniform:100:300'] -> {接口: 分布}"""
+    latency = {}
+    for value in values or []:
+        name, _, spec = value.partition('=')
+        LatencyModel(spec)
+        latency[name] = spec
+    return latency
+
+
+def parse_errors(values: List[str]) -> Dict[str, List[Tuple[int, float]]]:
+    """['message/mass/sendall=45009:0.1', '*=-1:0.01'] -> {接口: [(错误码, 概率)]}"""
+    errors = defaultdict(list)
+    for value in values or []:
+        name, _, spec = value.partition('=')
+        code, _, rate = spec.rpartition(':')
+        errors[name].append((int(code), float(rate)))
+    return dict(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微信公众号接口模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', action='append', metavar='ENDPOINT=DIST',
+                        help='接口耗时分布，可多次指定；ENDPOINT 为 default 时作用于所有接口')
+    parser.add_argument('--error', action='append', metavar='ENDPOINT=ERRCODE:RATE',
+                        help='按概率返回错误码，可多次指定；ENDPOINT 为 * 时作用于所有接口')
+    parser.add_argument('--token-ttl', type=int, default=7200, help='access_token 有效期（秒）')
+    parser.add_argument('--seed', type=int, help='错误注入的随机种子')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    state = StubState(parse_latency(args.latency), parse_errors(args.error), args.token_ttl, args.seed)
+    server = make_server(args.host, args.port, state)
+    logger.info(f"微信接口模拟服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
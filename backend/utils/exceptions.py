@@ -21,4 +21,12 @@ class PublishError(WeChatAutoPublisherException):
 
 class LLMError(WeChatAutoPublisherException):
     """LLM服务错误"""
-    pass
\ No newline at end of file
+    pass
+
+class ContentTooLargeError(CrawlerError):
+    """响应正文超过爬虫的大小上限"""
+    pass
+
+class UnsupportedContentError(CrawlerError):
+    """响应不是文本内容（视频、PDF、图片等）"""
+    pass
@@ -0,0 +1,24 @@
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，此时不加锁
+    fcntl = None
+
+
+class FileLock:
+    """基于 fcntl.flock 的进程间互斥锁"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
@@ -0,0 +1,61 @@
+import importlib.util
+import logging
+from typing import Iterable, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _detect_parser() -> str:
+    """优先使用 lxml（C实现，比 html.parser 快数倍），没有安装时退回标准库解析器"""
+    return 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+
+HTML_PARSER = Config.CRAWLER_HTML_PARSER or _detect_parser()
+
+
+def make_soup(markup, parse_only: Optional[SoupStrainer] = None, parser: Optional[str] = None) -> BeautifulSoup:
+    """用配置的解析器构建文档树，传入 parse_only 时只保留匹配的子树"""
+    return BeautifulSoup(markup, parser or HTML_PARSER, parse_only=parse_only)
+
+
+class SubtreeStrainer(SoupStrainer):
+    """匹配任一标签名、class 或 id 的元素（连同其全部子节点）
+
+    解析时只为匹配的子树建节点，其余部分直接跳过，大页面上可以省掉大部分建树的时间和内存。
+    """
+
+    def __init__(self, tags: Iterable[str] = (), classes: Iterable[str] = (), ids: Iterable[str] = ()):
+        super().__init__()
+        self.tags = set(tags)
+        self.classes = set(classes)
+        self.ids = set(ids)
+
+    def matches_start_tag(self, name: str, attrs) -> bool:
+        attrs = attrs or {}
+        if name in self.tags:
+            return True
+        if self.ids and attrs.get('id') in self.ids:
+            return True
+        if self.classes:
+            value = attrs.get('class') or []
+            if isinstance(value, str):
+                value = value.split()
+            return not self.classes.isdisjoint(value)
+        return False
+
+    # bs4 4.13 及以后的版本
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return self.matches_start_tag(name, attrs)
+
+    def allow_string_creation(self, string) -> bool:
+        return False
+
+    # bs4 4.13 之前的版本
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if isinstance(markup_name, str):
+            return markup_name if self.matches_start_tag(markup_name, dict(markup_attrs)) else None
+        return super().search_tag(markup_name, markup_attrs)
@@ -0,0 +1,108 @@
+import codecs
+import logging
+import re
+from typing import Optional
+
+import requests
+
+from utils.exceptions import ContentTooLargeError, UnsupportedContentError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# 在正文开头查找 <meta charset> / XML 声明的范围，以及自动检测编码时采样的长度
+SNIFF_BYTES = 4 * 1024
+DETECT_BYTES = 64 * 1024
+
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.I)
+XML_ENCODING_PATTERN = re.compile(rb'^\s*<\?xml[^>]+encoding\s*=\s*["\']([a-zA-Z0-9_\-]+)', re.I)
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# 页面声明的编码按超集解码（gb2312 页面里常混有 gbk 才有的字）
+SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8', 'latin-1': 'cp1252'}
+
+
+def is_text_content(content_type: Optional[str]) -> bool:
+    """网页、feed等文本内容；没有声明类型时也当作文本"""
+    mime = (content_type or '').split(';')[0].strip().lower()
+    if not mime:
+        return True
+    return (mime.startswith('text/') or mime.endswith('+xml') or mime.endswith('/xml')
+            or mime in ('application/xhtml+xml', 'application/json'))
+
+
+def read_limited(response: requests.Response, max_bytes: int, text_only: bool = True) -> bytes:
+    """分块读取流式响应的正文，超过 max_bytes 立即中断
+
+    先看 Content-Type 和 Content-Length，明显不是网页（text_only 为 False 时不检查类型）或过大的
+    直接放弃，不下载正文。上限按解压后的大小计算。读完后正文保存在 response.content 上，调用方可照常使用。
+    """
+    content_type = response.headers.get('Content-Type')
+    if text_only and response.ok and not is_text_content(content_type):
+        response.close()
+        raise UnsupportedContentError(f"不是文本内容 ({content_type}): {response.url}")
+
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        response.close()
+        raise ContentTooLargeError(f"响应大小 {declared} 字节超过上限 {max_bytes}: {response.url}")
+
+    chunks, size = [], 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ContentTooLargeError(f"响应超过上限 {max_bytes} 字节，已中断: {response.url}")
+            chunks.append(chunk)
+    finally:
+        response.close()
+
+    body = b''.join(chunks)
+    response._content = body
+    response._content_consumed = True
+    return body
+
+
+def _normalize(encoding: Optional[str]) -> Optional[str]:
+    if not encoding:
+        return None
+    try:
+        name = codecs.lookup(encoding.strip().strip('"\'')).name
+    except LookupError:
+        return None
+    return SUPERSETS.get(name, name)
+
+
+def detect_encoding(headers, body: bytes) -> str:
+    """确定正文编码：响应头声明 -> BOM -> 页面/XML声明 -> 按开头一段内容自动检测 -> utf-8
+
+    requests 对没有声明编码的 text/* 响应默认用 ISO-8859-1，中文页面会乱码，所以这里不用它的默认值。
+    """
+    content_type = headers.get('Content-Type') or ''
+    match = re.search(r'charset\s*=\s*["\']?([\w\-]+)', content_type, re.I)
+    encoding = _normalize(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    for bom, name in BOMS:
+        if body.startswith(bom):
+            return name
+
+    head = body[:SNIFF_BYTES]
+    match = XML_ENCODING_PATTERN.search(head) or META_CHARSET_PATTERN.search(head)
+    encoding = _normalize(match.group(1).decode('ascii', 'ignore')) if match else None
+    if encoding:
+        return encoding
+
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(body[:DETECT_BYTES]).best()
+        encoding = _normalize(best.encoding) if best else None
+    except ImportError:
+        encoding = None
+    return encoding or 'utf-8'
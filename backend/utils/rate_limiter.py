@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """获取令牌，不足时阻塞等待，返回实际等待的秒数"""
+        # 单次请求超过桶容量时按容量计，避免永远等不到
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class HostRateLimiter:
+    """按主机划分的令牌桶，不同主机互不影响"""
+
+    def __init__(self, default_interval: float, host_intervals: Optional[Dict[str, float]] = None):
+        self.default_interval = default_interval
+        self.host_intervals = host_intervals or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, url: str):
+        """返回 (桶名, 请求间隔)；命中配置的域名后缀时整个站点共用一个桶"""
+        host = (urlparse(url).hostname or '').lower()
+        for suffix, interval in self.host_intervals.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return suffix, interval
+        return host, self.default_interval
+
+    def _get_bucket(self, url: str) -> Optional[TokenBucket]:
+        key, interval = self._resolve(url)
+        if interval <= 0:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate=1.0 / interval, capacity=1.0)
+                self._buckets[key] = bucket
+            return bucket
+
+    def acquire(self, url: str) -> float:
+        """等待该主机的令牌，返回等待的秒数"""
+        bucket = self._get_bucket(url)
+        if bucket is None:
+            return 0.0
+        return bucket.acquire()
+
+
+class UsageRateLimiter:
+    """同时按 请求数/分钟 和 token数/分钟 限速（对应LLM服务商的RPM/TPM配额）
+
+    令牌桶只在当前进程内有效，多个worker时由调用方把配额按进程数平分后传入。
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.request_bucket = (
+            TokenBucket(requests_per_minute / 60.0, requests_per_minute)
+            if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+            if tokens_per_minute else None
+        )
+
+    def acquire(self, tokens: int = 0) -> float:
+        """获取一次请求额度和预估的token额度，返回等待的秒数"""
+        waited = 0.0
+        if self.request_bucket:
+            waited += self.request_bucket.acquire()
+        if self.token_bucket and tokens:
+            waited += self.token_bucket.acquire(tokens)
+        return waited
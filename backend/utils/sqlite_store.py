@@ -0,0 +1,134 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class SQLiteStore:
+    """SQLite文件缓存的公共部分（gunicorn多个worker共享同一个文件）
+
+    - 每个线程对每个文件复用一个连接，不再每次操作都新建连接（旧写法 with conn 只提交不关闭，
+      连接和文件句柄要等到垃圾回收才释放）
+    - 命中/未命中计数和访问时间先在进程内累加，每隔 FLUSH_INTERVAL 秒合并成一次写入，
+      读多写少时各进程不必为了更新统计排队抢写锁
+
+    子类实现 _create_schema，有统计表的设置 STATS_TABLE，需要记录访问时间的设置 TOUCH_SQL
+    （参数为 (访问时间, 键)）。
+    """
+
+    STATS_TABLE: Optional[str] = None
+    TOUCH_SQL: Optional[str] = None
+    FLUSH_INTERVAL = 5.0
+
+    _local = threading.local()
+    _initialized = set()
+    _init_lock = threading.Lock()
+    # (类, 文件路径) -> 待写入的计数和访问时间
+    _pending: Dict = {}
+    _pending_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ensure_schema()
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        # 按进程区分，fork 出的worker不会沿用父进程的连接
+        connections = getattr(self._local, 'connections', None)
+        if connections is None or self._local.pid != os.getpid():
+            connections = self._local.connections = {}
+            self._local.pid = os.getpid()
+        conn = connections.get(self.path)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            connections[self.path] = conn
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """当前线程的连接，退出时提交（异常时回滚）"""
+        conn = self._thread_connection()
+        with conn:
+            yield conn
+
+    def _ensure_schema(self):
+        key = (type(self), self.path)
+        with self._init_lock:
+            if key in self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with self._connection() as conn:
+                self._create_schema(conn)
+            self._initialized.add(key)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        raise NotImplementedError
+
+    def _pending_state(self) -> Dict:
+        return self._pending.setdefault(
+            (type(self), self.path), {'counts': Counter(), 'touched': {}, 'flushed_at': time.monotonic()}
+        )
+
+    def _count(self, name: str, amount: int = 1):
+        with self._pending_lock:
+            self._pending_state()['counts'][name] += amount
+        self._flush_if_due()
+
+    def _touch(self, key: str, accessed_at: float):
+        with self._pending_lock:
+            self._pending_state()['touched'][key] = accessed_at
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        with self._pending_lock:
+            state = self._pending_state()
+            due = time.monotonic() - state['flushed_at'] >= self.FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把进程内累加的计数和访问时间写入文件"""
+        with self._pending_lock:
+            state = self._pending_state()
+            counts, touched = state['counts'], state['touched']
+            state['counts'], state['touched'] = Counter(), {}
+            state['flushed_at'] = time.monotonic()
+        if not counts and not touched:
+            return
+        try:
+            with self._connection() as conn:
+                if self.STATS_TABLE and counts:
+                    conn.executemany(
+                        f'UPDATE {self.STATS_TABLE} SET value = value + ? WHERE name = ?',
+                        [(amount, name) for name, amount in counts.items()]
+                    )
+                if self.TOUCH_SQL and touched:
+                    conn.executemany(self.TOUCH_SQL, [(at, key) for key, at in touched.items()])
+        except sqlite3.Error:
+            # 写入失败时放回去，下次再试
+            with self._pending_lock:
+                state = self._pending_state()
+                state['counts'].update(counts)
+                for key, at in touched.items():
+                    state['touched'].setdefault(key, at)
+            raise
+
+    @classmethod
+    def flush_all(cls):
+        """进程退出时写入所有未写入的计数"""
+        with cls._pending_lock:
+            keys = list(cls._pending)
+        for store_class, path in keys:
+            try:
+                store = store_class.__new__(store_class)
+                store.path = path
+                store.flush()
+            except Exception:
+                pass
+
+
+atexit.register(SQLiteStore.flush_all)
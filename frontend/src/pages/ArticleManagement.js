@@ -319,6 +319,21 @@ const ArticleManagement = () => {
     }
   };
 
+  // 轮询后台任务，完成后返回与同步接口相同的结果
+  const waitForJob = async (jobId) => {
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, 2000));
+      const response = await fetch(`/api/jobs/${jobId}`);
+      const { job } = await response.json();
+      if (job.status === 'completed') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        return { success: false, message: job.error || job.message };
+      }
+    }
+  };
+
   // AI生成文章
   const handleGenerate = () => {
     setGenerateModalVisible(true);
@@ -335,10 +350,13 @@ const ArticleManagement = () => {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(values)
+        body: JSON.stringify({ ...values, async: true })
       });
       
-      const result = await response.json();
+      let result = await response.json();
+      if (result.job_id) {
+        result = await waitForJob(result.job_id);
+      }
       
       if (result.success) {
         const newArticle = {
@@ -382,10 +400,13 @@ const ArticleManagement = () => {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(values)
+        body: JSON.stringify({ ...values, async: true })
       });
       
-      const result = await response.json();
+      let result = await response.json();
+      if (result.job_id) {
+        result = await waitForJob(result.job_id);
+      }
       
       if (result.success) {
         const newArticles = result.articles.map((article, index) => ({